@@ -0,0 +1,444 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from . import telemetry
+from .deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying: rate limits, timeouts and transient server errors
+# (529 is Anthropic's "overloaded")
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+OVERLOAD_STATUS_CODES = frozenset({429, 503, 529})
+
+
+class ProviderOverloadedError(RuntimeError):
+    """Raised when a call could not be admitted before its queueing deadline."""
+
+
+class RateLimits:
+    """Admission settings for one provider and model."""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: int = 64,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        failure_threshold: int = 5,
+        cooldown: float = 15.0,
+        max_queue_time: float = 120.0,
+        expected_completion_tokens: int = 256
+    ):
+        """
+        Args:
+            rpm: Requests per minute allowed (None for no limit)
+            tpm: Tokens per minute allowed, prompt plus expected completion (None for no limit)
+            max_concurrency: Maximum calls in flight at once
+            max_retries: Retries of a failed call before giving up
+            base_delay: First backoff delay in seconds; doubles on every retry
+            max_delay: Upper bound for a single backoff delay
+            failure_threshold: Consecutive overload failures that open the circuit breaker
+            cooldown: Seconds the breaker stays open before a probe call is let through
+            max_queue_time: Seconds a call may wait for admission before failing
+            expected_completion_tokens: Completion size assumed when charging the TPM budget
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_queue_time = max_queue_time
+        self.expected_completion_tokens = expected_completion_tokens
+
+
+def load_rate_limits(provider: str, model: str) -> RateLimits:
+    """
+    Read the admission settings for a provider and model from MODEL_RATE_LIMITS.
+
+    MODEL_RATE_LIMITS is a JSON object keyed by "provider:model" or "provider", e.g.
+    {"openai": {"rpm": 500, "tpm": 200000}, "openai:gpt-4o": {"max_concurrency": 32}}.
+    Model settings override provider settings.
+    """
+    configured = json.loads(os.getenv("MODEL_RATE_LIMITS") or "{}")
+    options = {**configured.get(provider, {}), **configured.get(f"{provider}:{model}", {})}
+    return RateLimits(**options)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Return the delay the server asked for in Retry-After headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None  # HTTP-date values are rare from these APIs; fall back to backoff
+    return None
+
+
+def _classify(error: BaseException) -> Tuple[bool, bool]:
+    """Return (retryable, overload) for an error raised by a provider SDK."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES, status_code in OVERLOAD_STATUS_CODES
+    # Connection errors and timeouts carry no status code
+    names = {cls.__name__ for cls in type(error).__mro__}
+    connection_error = bool(names & {"APIConnectionError", "APITimeoutError"})
+    return connection_error, connection_error
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously at rate_per_minute.
+
+    reserve() always succeeds and returns how long the caller must wait before
+    using what it reserved, so callers queue in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self._tokens = rate_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back a reservation that will not be used, e.g. by a call rejected while queued."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+
+class ConcurrencyLimiter:
+    """Bound the calls in flight across threads and event loops."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < self.limit, timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+                        raise
+                # Already woken: pass the wakeup on before giving up
+                self._wake_one()
+                raise
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+        self._wake_one()
+
+    def _wake_one(self) -> None:
+        while True:
+            with self._lock:
+                if not self._async_waiters:
+                    return
+                loop, waiter = self._async_waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+                return
+            except RuntimeError:
+                continue  # the waiter's event loop has closed
+
+
+class AdmissionController:
+    """
+    Decide when a provider call may be sent.
+
+    Calls wait for the circuit breaker, the RPM and TPM token buckets and a free
+    concurrency slot, in that order. Failed calls that are worth retrying are
+    retried with jittered exponential backoff, honoring Retry-After; a rate limit
+    response pauses every caller for the requested time. After failure_threshold
+    consecutive overload failures the breaker opens for the cooldown, during which
+    new calls queue instead of failing; the first call after it is a probe whose
+    outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, provider: str, model: str, limits: Optional[RateLimits] = None):
+        self.provider = provider
+        self.model = model
+        self.limits = limits or RateLimits()
+        self._requests = TokenBucket(self.limits.rpm) if self.limits.rpm else None
+        self._tokens = TokenBucket(self.limits.tpm) if self.limits.tpm else None
+        self._slots = ConcurrencyLimiter(self.limits.max_concurrency)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._open_until = 0.0  # breaker open (or server-requested pause) until this time
+        self._probe: Optional[object] = None  # the call let through as the half-open probe
+
+    @property
+    def state(self) -> str:
+        """The circuit breaker state: "closed", "open" or "half-open"."""
+        with self._lock:
+            if self._open_until > time.monotonic():
+                return "open"
+            return "half-open" if self._consecutive_failures >= self.limits.failure_threshold else "closed"
+
+    def _estimate(self, prompt_tokens: int) -> int:
+        return prompt_tokens + self.limits.expected_completion_tokens
+
+    def _breaker_wait(self, token: object) -> float:
+        """Return how long to wait before the breaker admits the call identified by token (0 to go now)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._open_until > now:
+                return self._open_until - now
+            if self._consecutive_failures >= self.limits.failure_threshold:
+                # Half-open: let a single probe through, queue everyone else
+                if self._probe is not None and self._probe is not token:
+                    return min(self.limits.cooldown, 0.5)
+                self._probe = token
+            return 0.0
+
+    def _abandon_probe(self, token: object) -> None:
+        """Let another call probe if the call identified by token was the probe and ended without an outcome."""
+        with self._lock:
+            if self._probe is token:
+                self._probe = None
+
+    def _bucket_wait(self, prompt_tokens: int) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.reserve(1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.reserve(self._estimate(prompt_tokens)))
+        return wait
+
+    def _refund_buckets(self, prompt_tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.refund(1)
+        if self._tokens is not None:
+            self._tokens.refund(self._estimate(prompt_tokens))
+
+    def _reject_bucket_wait(self, prompt_tokens: int, wait: float, start: float, deadline: float) -> None:
+        """Fail fast, instead of sleeping, when the rate limit wait would outlast the queue limit or request deadline."""
+        if time.monotonic() + wait > deadline:
+            self._refund_buckets(prompt_tokens)
+            raise self._queue_timeout(start, deadline)
+
+    def _overloaded(self) -> ProviderOverloadedError:
+        return ProviderOverloadedError(
+            f"{self.provider}:{self.model} could not admit a call within {self.limits.max_queue_time} seconds"
+        )
+
+    def _queue_limit(self, start: float) -> float:
+        """Latest time a call may wait for admission: the queue timeout, or the request deadline if sooner."""
+        limit = start + self.limits.max_queue_time
+        request_deadline = current_deadline()
+        return limit if request_deadline is None else min(limit, request_deadline.expires_at)
+
+    def _queue_timeout(self, start: float, limit: float) -> Exception:
+        if limit < start + self.limits.max_queue_time:
+            return DeadlineExceeded(f"Request deadline exceeded while queued for {self.provider}:{self.model}")
+        return self._overloaded()
+
+    def _may_retry(self, delay: float) -> bool:
+        """Whether a retry after delay seconds can still finish before the request deadline."""
+        request_deadline = current_deadline()
+        return request_deadline is None or delay < request_deadline.remaining()
+
+    def admit(self, prompt_tokens: int, token: Optional[object] = None) -> None:
+        """
+        Block until a call of prompt_tokens may be sent, then hold a concurrency slot.
+
+        token identifies the call across retries, so a half-open probe keeps its turn.
+        """
+        token = token or object()
+        start = time.monotonic()
+        deadline = self._queue_limit(start)
+        try:
+            while (wait := self._breaker_wait(token)) > 0:
+                if time.monotonic() + wait > deadline:
+                    raise self._queue_timeout(start, deadline)
+                time.sleep(wait)
+            wait = self._bucket_wait(prompt_tokens)
+            self._reject_bucket_wait(prompt_tokens, wait, start, deadline)
+            time.sleep(wait)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise self._queue_timeout(start, deadline)
+        except BaseException:
+            self._abandon_probe(token)
+            raise
+        telemetry.record_admission_wait(self.provider, self.model, time.monotonic() - start)
+
+    async def aadmit(self, prompt_tokens: int, token: Optional[object] = None) -> None:
+        """Wait without blocking the event loop until a call may be sent, then hold a concurrency slot."""
+        token = token or object()
+        start = time.monotonic()
+        deadline = self._queue_limit(start)
+        try:
+            while (wait := self._breaker_wait(token)) > 0:
+                if time.monotonic() + wait > deadline:
+                    raise self._queue_timeout(start, deadline)
+                await asyncio.sleep(wait)
+            wait = self._bucket_wait(prompt_tokens)
+            self._reject_bucket_wait(prompt_tokens, wait, start, deadline)
+            await asyncio.sleep(wait)
+            try:
+                await asyncio.wait_for(self._slots.aacquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._queue_timeout(start, deadline)
+        except BaseException:
+            self._abandon_probe(token)
+            raise
+        telemetry.record_admission_wait(self.provider, self.model, time.monotonic() - start)
+
+    def release(self) -> None:
+        """Give back the concurrency slot held by an admitted call."""
+        self._slots.release()
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._consecutive_failures >= self.limits.failure_threshold:
+                logger.info(f"Circuit breaker for {self.provider}:{self.model} closed")
+            self._consecutive_failures = 0
+            self._probe = None
+
+    def _backoff(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt and return the delay before retrying, or None to give up."""
+        retryable, overload = _classify(error)
+        retry_after = _retry_after(error)
+        with self._lock:
+            self._probe = None
+            if overload:
+                self._consecutive_failures += 1
+                now = time.monotonic()
+                if self._consecutive_failures == self.limits.failure_threshold or (
+                    self._consecutive_failures > self.limits.failure_threshold and self._open_until <= now
+                ):
+                    logger.warning(f"Circuit breaker for {self.provider}:{self.model} opened for {self.limits.cooldown}s")
+                    telemetry.record_circuit_open(self.provider, self.model)
+                    self._open_until = max(self._open_until, now + self.limits.cooldown)
+                if retry_after:
+                    # The server told us when to come back; hold every caller until then
+                    self._open_until = max(self._open_until, now + retry_after)
+
+        if not retryable or attempt >= self.limits.max_retries:
+            return None
+        delay = random.uniform(0, min(self.limits.max_delay, self.limits.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = retry_after + random.uniform(0, self.limits.base_delay)
+        if not self._may_retry(delay):
+            return None
+        telemetry.record_retry(self.provider, self.model, getattr(error, "status_code", None) or type(error).__name__)
+        logger.warning(f"{self.provider}:{self.model} call failed ({str(error)}); retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def call(self, fn: Callable[[], T], prompt_tokens: int) -> T:
+        """Run a blocking provider call under admission control, retrying transient failures."""
+        attempt = 0
+        token = object()
+        while True:
+            self.admit(prompt_tokens, token)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release()
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: no outcome to judge the provider by
+                self.release()
+                self._abandon_probe(token)
+                raise
+            self.release()
+            self.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], prompt_tokens: int, hold: bool = False) -> T:
+        """
+        Run an async provider call under admission control, retrying transient failures.
+
+        With hold=True the concurrency slot is kept after a successful call, e.g. for
+        a stream that is still being consumed; the caller must then call release().
+        """
+        attempt = 0
+        token = object()
+        while True:
+            await self.aadmit(prompt_tokens, token)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.release()
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: no outcome to judge the provider by
+                self.release()
+                self._abandon_probe(token)
+                raise
+            if not hold:
+                self.release()
+            self.record_success()
+            return result
+
+
+_controllers: Dict[Tuple[str, str], AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(provider: str, model: str) -> AdmissionController:
+    """Return the process-wide admission controller for a provider and model."""
+    key = (provider, model)
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = AdmissionController(provider, model, load_rate_limits(provider, model))
+        return _controllers[key]
@@ -11,10 +11,53 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
+    timeout: Optional[float] = None  # seconds; capped by the server's request timeout
 
 class ChatResponse(BaseModel):
     response: str
 
+class BatchChatRequest(ChatRequest):
+    """One conversation of a /chat/batch job."""
+    id: Optional[str] = None  # defaults to the request's line number in the batch
+
+class BatchChatResult(BaseModel):
+    id: str
+    response: Optional[str] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+    resumed: bool = False  # answered by an earlier run of the same batch
+
+class BatchStats(BaseModel):
+    batch_id: str
+    total: int
+    succeeded: int
+    failed: int
+    resumed: int
+    elapsed_seconds: float
+    conversations_per_second: float
+    p50_seconds: float
+    p95_seconds: float
+
+class SessionMessage(Message):
+    """A message a client adds to a session; only user turns, the agent writes every other turn."""
+    role: Literal["user"] = "user"
+
+class SessionMessageRequest(BaseModel):
+    """The newest message of a server-side session; earlier turns are loaded from the session store."""
+    message: SessionMessage
+    timeout: Optional[float] = None  # seconds; capped by the server's request timeout
+
+class SessionResponse(BaseModel):
+    session_id: str
+
+class SessionChatResponse(ChatResponse):
+    session_id: str
+
+class SessionHistoryResponse(BaseModel):
+    """A session's stored history, including the agent's internal action and observation turns."""
+    session_id: str
+    messages: List[Dict[str, Any]]
+
 class Action(BaseModel):
     """Represents an action that can be taken by the agent."""
     name: str
@@ -23,6 +66,51 @@ class Action(BaseModel):
     returns: str
     example: Optional[str] = None
     handler: Callable
+    observation_token_budget: Optional[int] = None  # tokens of each result shown to the model; None uses the agent's default
 
     class Config:
-        arbitrary_types_allowed = True
\ No newline at end of file
+        arbitrary_types_allowed = True
+
+    def to_json_schema(self) -> Dict[str, Any]:
+        """Build a JSON schema for the action's parameters, used for native tool calling."""
+        properties = {}
+        required = []
+        for param_name, param_details in self.parameters.items():
+            properties[param_name] = {
+                key: value for key, value in param_details.items() if key != "required"
+            }
+            if param_details.get("required", True):
+                required.append(param_name)
+        return {"type": "object", "properties": properties, "required": required}
+
+    def bind_arguments(self, arguments: Dict[str, Any]) -> Callable[[], Any]:
+        """
+        Bind structured tool-call arguments to the handler.
+
+        Handlers take a single input, so single-parameter actions receive the
+        argument value directly and multi-parameter actions receive keyword arguments.
+        """
+        if len(self.parameters) == 1:
+            (param_name,) = self.parameters
+            value = arguments.get(param_name, "")
+            return lambda: self.handler(value)
+        return lambda: self.handler(**arguments)
+
+class ToolCall(BaseModel):
+    """A structured action invocation requested by the model."""
+    id: str
+    name: str
+    arguments: Dict[str, Any]
+
+class Usage(BaseModel):
+    """Token usage reported by a provider for a single model call."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # prompt tokens served from the provider's prompt cache
+    cache_creation_tokens: int = 0  # prompt tokens written to the prompt cache
+
+class ModelResponse(BaseModel):
+    """A model turn in native tool-calling mode."""
+    content: str = ""
+    tool_calls: List[ToolCall] = []
+    usage: Optional[Usage] = None
\ No newline at end of file
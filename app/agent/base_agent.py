@@ -1,23 +1,138 @@
-from typing import Dict, Any, List, Callable, Optional, Tuple
+from typing import Dict, Any, List, Callable, Optional, Sequence, Tuple, AsyncIterator
 from uuid import UUID
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from types import MappingProxyType
+import asyncio
+import functools
+import inspect
+import os
+import random
 import re
-from dotenv import load_dotenv
+import threading
+import time
+import uuid
 import logging
-from .model_providers import OpenAIProvider, AnthropicProvider
-from .agent_schemas import Action, Message
-from .prompt_templates import create_base_prompt
+from .model_providers import ModelProvider, get_hedged_provider, get_model_provider
+from .agent_schemas import Action, Message, ModelResponse, ToolCall
+from .prompt_templates import create_base_prompt, current_datetime_note
+from .stream_parser import ReActStreamParser
+from .history import HistoryManager, SummaryCache, Summarizer, get_token_budget
+from .deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from .conversation import Conversation
+from .observations import EXPAND_ACTION, ObservationProcessor, create_expand_action
+from .speculation import Speculation, Speculator
+from .response_cache import ResponseCache
+from .routing import FULL, LIGHT, TEMPLATE, Route, Router
+from .recorder import ACTION, MODEL, OBSERVATION, TIMING, USER, TurnRecorder
+from . import telemetry
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Bulky payloads are logged lazily under a category, which the logging pipeline samples and truncates
+_PROMPT_LOG = {"category": "prompt"}
+_RESPONSE_LOG = {"category": "response"}
+_OBSERVATION_LOG = {"category": "observation"}
 
-logger = logging.getLogger(__name__)
+# Lines that show the model answered in the text protocol instead of calling a tool
+_text_protocol_re = re.compile(r'^(Action|Response to Client): ', re.MULTILINE)
+
+_action_executor: Optional[ThreadPoolExecutor] = None
+_action_loop: Optional[asyncio.AbstractEventLoop] = None
+_action_loop_thread: Optional[threading.Thread] = None
+_action_loop_lock = threading.Lock()
+
+# Longest observation excerpt returned as a partial answer when a query runs out of time
+PARTIAL_RESPONSE_MAX_CHARS = 2000
+
+
+class UnansweredQueryError(RuntimeError):
+    """A query ended without a final answer, e.g. after max_turns or a failed action; raised with raise_errors."""
+
+def _raise(error: Exception) -> None:
+    raise error
+
+def _timed_action(action: Action, bound: Callable[[], Any]) -> Callable[[], Any]:
+    """Wrap a bound synchronous handler so its run time and outcome are recorded."""
+    def run() -> Any:
+        with telemetry.action_span(action.name):
+            return bound()
+    return run
+
+async def _atimed_action(action: Action, bound: Callable[[], Any]) -> Any:
+    with telemetry.action_span(action.name):
+        return await bound()
+
+def _await_on_action_loop(result: Any, timeout: Optional[float]) -> Any:
+    """Wait for an awaitable returned by a synchronous handler on the action loop; other results pass through."""
+    if not inspect.isawaitable(result):
+        return result
+
+    async def wait() -> Any:
+        return await result
+    return asyncio.run_coroutine_threadsafe(wait(), get_action_loop()).result(timeout=timeout)
+
+def _compact_message(message: Dict[str, Any] | Message) -> Dict[str, Any]:
+    """Return a message as a history dict, dropping the default "type" of text messages."""
+    if isinstance(message, Message):
+        message = message.dict()
+    if message.get("type", "text") == "text":
+        return {key: value for key, value in message.items() if key != "type"}
+    return dict(message)
+
+def get_action_executor() -> ThreadPoolExecutor:
+    """Return the bounded thread pool used to run synchronous action handlers."""
+    global _action_executor
+    if _action_executor is None:
+        _action_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("ACTION_EXECUTOR_MAX_WORKERS", "32")),
+            thread_name_prefix="agent-action"
+        )
+    return _action_executor
+
+def get_action_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop that runs coroutine action handlers for synchronous queries.
+
+    It runs on a thread of its own, so blocking queries can await handlers even
+    when they are called from a thread that is already running an event loop.
+    """
+    global _action_loop, _action_loop_thread
+    with _action_loop_lock:
+        if _action_loop is None:
+            _action_loop = asyncio.new_event_loop()
+            _action_loop_thread = threading.Thread(target=_action_loop.run_forever, name="agent-action-loop", daemon=True)
+            _action_loop_thread.start()
+        return _action_loop
+
+def shutdown_action_executor() -> None:
+    """Wait for running action handlers and release the action thread pool and loop, e.g. on application shutdown."""
+    global _action_executor, _action_loop, _action_loop_thread
+    if _action_executor is not None:
+        _action_executor.shutdown(wait=True, cancel_futures=True)
+        _action_executor = None
+    with _action_loop_lock:
+        loop, thread, _action_loop, _action_loop_thread = _action_loop, _action_loop_thread, None, None
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+class AgentTemplate:
+    """
+    Immutable agent definition shared by every conversation.
+
+    Building a template resolves the shared model provider, the action table and
+    the rendered system prompt once, so creating a per-conversation BaseAgent from
+    it only allocates the conversation history.
+    """
+
+    __slots__ = (
+        "actions", "tools", "system_prompt", "model_provider", "model", "temperature", "max_turns",
+        "tool_calling", "action_timeout", "max_parallel_actions",
+        "history_token_budget", "history_keep_recent", "history_summarizer", "history_summaries", "observation_token_budget",
+        "speculator", "response_cache", "router", "light_provider"
+    )
 
-class BaseAgent:
     def __init__(
         self,
         actions: List[Action],
@@ -26,29 +141,49 @@ class BaseAgent:
         provider: str = "openai",
         model: str = "gpt-4o",
         temperature: float = 1.0,
-        max_turns: int = 3
+        max_turns: int = 3,
+        tool_calling: bool = False,
+        action_timeout: Optional[float] = 30.0,
+        max_parallel_actions: int = 4,
+        history_token_budget: Optional[int] = None,
+        history_keep_recent: int = 6,
+        history_summarizer: Optional[Summarizer] = None,
+        fallback_models: Optional[List[Tuple[str, str]]] = None,
+        observation_token_budget: Optional[int] = None,
+        speculator: Optional[Speculator] = None,
+        response_cache: Optional[ResponseCache] = None,
+        router: Optional[Router] = None,
+        light_model: Optional[str] = None
     ):
         """
-        Initialize a base agent with customizable system prompt and actions.
+        Build a shareable agent definition.
         
         Args:
             actions: List of Action objects defining available actions with their handlers
             context: The context that defines the agent's behavior
             custom_examples: Optional list of example interactions
-            provider: The model provider to use ('openai' or 'anthropic')
+            provider: A registered model provider name, e.g. 'openai' or 'anthropic'
             model: The model to use
             temperature: The temperature parameter for generation
             max_turns: Maximum number of action/observation turns before returning
+            tool_calling: Send actions as native tool schemas instead of using the text protocol
+            action_timeout: Seconds each action handler may run before it is abandoned (None for no limit)
+            max_parallel_actions: Maximum number of actions from one turn that run at the same time
+            history_token_budget: Prompt token budget for the conversation (defaults to a per-model budget)
+            history_keep_recent: Number of most recent messages that are never elided or summarized
+            history_summarizer: Optional summarizer for older turns (defaults to a local extractive summary)
+            fallback_models: Optional ordered (provider, model) pairs that slow or failed calls are hedged to
+            observation_token_budget: Default token budget of each action result; actions can set their own (None to keep results whole)
+            speculator: Optional predictor of the first turn's action, which is then started alongside the model call
+            response_cache: Optional cache of final answers, reused when a conversation repeats exactly
+            router: Optional router that answers trivial turns from templates and sends simple ones to light_model
+            light_model: Cheaper model of the same provider for turns the router sends to the light tier
         """
-        # Initialize the appropriate model provider
-        if provider == "openai":
-            self.model_provider = OpenAIProvider(model=model)
-        elif provider == "anthropic":
-            self.model_provider = AnthropicProvider(model=model)
+        # Reuse the process-wide provider and its pooled clients
+        if fallback_models:
+            model_provider = get_hedged_provider([(provider, model)] + list(fallback_models))
         else:
-            raise ValueError(f"Unsupported provider: {provider}")
-            
-        self.temperature = temperature
+            model_provider = get_model_provider(provider, model)
         
         # Add the "none" action to the list of actions
         none_action = Action(
@@ -58,70 +193,224 @@ class BaseAgent:
             returns="No action taken",
             handler=lambda _: "No action taken"
         )
+        # Trimmed results can be expanded by the model when any action's results are trimmed
+        if observation_token_budget is not None or any(action.observation_token_budget for action in actions):
+            actions = actions + [create_expand_action()]
         all_actions = [none_action] + actions
-        self.actions = {action.name: action for action in all_actions}  # Store actions by name
-        
-        self.messages = []
-        self.action_re = re.compile('^Action: (\w+): (.*)$')
-        self.max_turns = max_turns
         
-        # Create the system prompt using the template
+        # Create the system prompt using the template. The current date and time is
+        # appended per conversation so the rendered prompt can be reused.
         system_prompt = create_base_prompt(
             actions=all_actions,
             additional_context=additional_context,
-            examples=custom_examples
+            examples=custom_examples,
+            include_datetime=False,
+            tool_calling=tool_calling
         )
-        logger.info(f"System prompt:\n{system_prompt}")
+        logger.info("System prompt:\n%s", system_prompt, extra=_PROMPT_LOG)
         
-        # Initialize with system prompt
-        if system_prompt:
-            self.messages.append({
-                "role": "system",
-                "content": system_prompt,
-                "type": "text"
-            })
+        object.__setattr__(self, "actions", MappingProxyType({action.name: action for action in all_actions}))
+        object.__setattr__(self, "system_prompt", system_prompt)
+        object.__setattr__(self, "model_provider", model_provider)
+        object.__setattr__(self, "model", model)
+        object.__setattr__(self, "temperature", temperature)
+        object.__setattr__(self, "max_turns", max_turns)
+        object.__setattr__(self, "tool_calling", tool_calling)
+        object.__setattr__(self, "action_timeout", action_timeout)
+        object.__setattr__(self, "max_parallel_actions", max_parallel_actions)
+        object.__setattr__(self, "history_token_budget", history_token_budget or get_token_budget(model))
+        object.__setattr__(self, "history_keep_recent", history_keep_recent)
+        object.__setattr__(self, "history_summarizer", history_summarizer)
+        # Rolling summaries outlive the per-request agents, so a conversation's older turns are summarized once
+        object.__setattr__(self, "history_summaries", SummaryCache())
+        object.__setattr__(self, "observation_token_budget", observation_token_budget)
+        object.__setattr__(self, "speculator", speculator)
+        object.__setattr__(self, "response_cache", response_cache)
+        object.__setattr__(self, "router", router)
+        object.__setattr__(self, "light_provider", get_model_provider(provider, light_model) if light_model else None)
+        # The "none" action only exists for the text protocol
+        object.__setattr__(self, "tools", tuple(actions))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def create_agent(self) -> "BaseAgent":
+        """Create a fresh per-conversation agent backed by this template."""
+        return BaseAgent(template=self)
+
+class BaseAgent:
+    action_re = re.compile(r'^Action: (\w+): (.*)$', re.MULTILINE)
+
+    def __init__(
+        self,
+        actions: List[Action] = None,
+        additional_context: str = None,
+        custom_examples: Optional[List[Dict[str, str]]] = None,
+        provider: str = "openai",
+        model: str = "gpt-4o",
+        temperature: float = 1.0,
+        max_turns: int = 3,
+        template: Optional[AgentTemplate] = None,
+        **template_options: Any
+    ):
+        """
+        Initialize a base agent with customizable system prompt and actions.
+        
+        Args:
+            actions: List of Action objects defining available actions with their handlers
+            context: The context that defines the agent's behavior
+            custom_examples: Optional list of example interactions
+            provider: A registered model provider name, e.g. 'openai' or 'anthropic'
+            model: The model to use
+            temperature: The temperature parameter for generation
+            max_turns: Maximum number of action/observation turns before returning
+            template: Optional prebuilt AgentTemplate; when given, the other arguments are ignored
+            template_options: Additional AgentTemplate options, e.g. tool_calling or action_timeout
+        """
+        if template is None:
+            template = AgentTemplate(
+                actions=actions or [],
+                additional_context=additional_context,
+                custom_examples=custom_examples,
+                provider=provider,
+                model=model,
+                temperature=temperature,
+                max_turns=max_turns,
+                **template_options
+            )
+        
+        self.template = template
+        self.model_provider = template.model_provider  # the light tier's provider while a turn is routed to it
+        self.model = template.model
+        self.temperature = template.temperature
+        self.actions = template.actions  # Store actions by name
+        self.max_turns = template.max_turns
+        self.tool_calling = template.tool_calling
+        self.action_timeout = template.action_timeout
+        self._action_semaphore = asyncio.Semaphore(template.max_parallel_actions)
+        self.history = HistoryManager(
+            token_budget=template.history_token_budget,
+            model=template.model,
+            keep_recent=template.history_keep_recent,
+            summarizer=template.history_summarizer,
+            summary_cache=template.history_summaries
+        )
+        self.observations = ObservationProcessor(token_budget=template.observation_token_budget, model=template.model)
+        if EXPAND_ACTION in template.actions:
+            # Each conversation expands the results in its own store
+            expand = template.actions[EXPAND_ACTION].copy(update={"handler": self.observations.expand})
+            self.actions = MappingProxyType({**template.actions, EXPAND_ACTION: expand})
+        self.messages = Conversation()
+        self.turns = 0  # model turns taken by the current query
+        self.deadline: Optional[Deadline] = None  # time budget of the current query
+        self._query_start = 0  # index of the current query's first message
+        self._speculation: Optional[Speculation] = None  # action started ahead of the current query's first turn
+        self._prompt_end = 0  # length of the history the current query answers
+        self._used_actions: set[str] = set()  # actions run by the current query
+        self._answered = False  # whether the current query ended with a final answer from the model
+        self.routing = True  # whether queries go through the template's router
+        self._route: Optional[Route] = None  # how the current query was routed
+        self._escalated = False  # whether the current light-tier query needed the full model
+        self.conversation_id = uuid.uuid4().hex  # identifies the conversation's persisted turns
+        self._recorder: Optional[TurnRecorder] = None  # where the current query's turns are persisted
+        self._user_id: Optional[UUID] = None  # the user of the current query
+        
+        # Initialize with system prompt. The shared prompt and the per-request date are
+        # separate messages so the prompt stays a byte-identical, cacheable prefix.
+        if template.system_prompt:
+            self.messages.append({"role": "system", "content": template.system_prompt})
+        self.messages.append({"role": "system", "content": current_datetime_note()})
     
     def add_message(self, message: str | Dict[str, Any] | Message | List[Dict[str, Any] | Message]) -> None:
-        """Add a message or list of messages to the conversation history."""
+        """
+        Add a message or list of messages to the conversation history.
+
+        Messages are stored as compact dicts; the "type" key is only kept for
+        non-text messages.
+        """
         if isinstance(message, list):
             for msg in message:
-                if isinstance(msg, Message):
-                    # Convert Pydantic model to dict
-                    self.messages.append(msg.dict())
-                elif isinstance(msg, dict) and 'role' in msg and 'content' in msg and 'type' in msg:
-                    self.messages.append(msg)
+                if isinstance(msg, Message) or (isinstance(msg, dict) and 'role' in msg and 'content' in msg):
+                    self.messages.append(_compact_message(msg))
                 else:
-                    raise ValueError("Each message must contain 'role', 'content', and 'type'.")
+                    raise ValueError("Each message must contain 'role' and 'content'.")
         elif isinstance(message, Message):
-            # Convert Pydantic model to dict
-            self.messages.append(message.dict())
+            self.messages.append(_compact_message(message))
         elif isinstance(message, dict):
-            if 'role' in message and 'content' in message and 'type' in message:
-                self.messages.append(message)
+            if 'role' in message and 'content' in message:
+                self.messages.append(_compact_message(message))
             else:
-                raise ValueError("Message must contain 'role', 'content', and 'type'.")
+                raise ValueError("Message must contain 'role' and 'content'.")
         else:
             # Handle string input
-            self.messages.append({
-                "role": "user",
-                "content": str(message),
-                "type": "text"
-            })
+            self.messages.append({"role": "user", "content": str(message)})
+
+    def context_messages(self) -> Sequence[Dict[str, Any]]:
+        """Return the conversation to send to the model, trimmed to the history token budget."""
+        return self.history.fit(self.messages)
+
+    def _model_call_span(self, mode: str):
+        self.turns += 1
+        return telemetry.model_call_span(self.model_provider.name, self.model, mode)
+
+    def _record_query(self, mode: str, query: telemetry.Span) -> None:
+        # Every query mode ends here, including ones whose first turn requested no action
+        self._settle_speculation([])
+        self._finish_route(query.elapsed)
+        query.set_attribute("turns", self.turns)
+        telemetry.record_query(mode, self.turns, query.elapsed)
+        self._record_turn(
+            TIMING, mode=mode, seconds=query.elapsed, turns=self.turns, status=query.status,
+            model=self.model, route=self._route.kind if self._route else None, actions=sorted(self._used_actions)
+        )
+
+    def _record_turn(self, kind: str, content: str = "", **data: Any) -> None:
+        """Hand a record of the current query to its turn recorder, if it has one; this never blocks."""
+        if self._recorder is not None:
+            self._recorder.record(self.conversation_id, kind, content, data, self._user_id)
+
+    def _query_span(self, mode: str):
+        """Span covering a whole query; its turn count and latency are recorded when it ends."""
+        self.turns = 0
+        return telemetry.span(
+            "agent.query",
+            on_end=functools.partial(self._record_query, mode),
+            mode=mode,
+            provider=self.model_provider.name,
+            model=self.model
+        )
 
     def execute(self) -> str:
         """Execute a single turn of conversation with the model."""
-        logger.info(f"Generating model response with {len(self.messages)} messages")
-        response = self.model_provider.generate_response(self.messages, self.temperature)
-        logger.info(f"Model response:\n{response}")
+        logger.info("Generating model response with %d messages", len(self.messages))
+        with self._model_call_span("generate") as call:
+            response = self.model_provider.generate_response(self.context_messages(), self.temperature)
+        logger.info("Model response:\n%s", response, extra=_RESPONSE_LOG)
+        self._record_turn(MODEL, response, model=self.model, seconds=call.elapsed)
         return response
 
-    def process_actions(self, result: str) -> tuple[Optional[str], Optional[str]]:
-        """Process any actions in the model's response."""
-        logger.info("Processing actions from response...")
+    async def aexecute(self) -> str:
+        """Execute a single turn of conversation with the model without blocking the event loop."""
+        logger.info("Generating model response with %d messages", len(self.messages))
+        with self._model_call_span("generate") as call:
+            response = await self.model_provider.agenerate_response(self.context_messages(), self.temperature)
+        logger.info("Model response:\n%s", response, extra=_RESPONSE_LOG)
+        self._record_turn(MODEL, response, model=self.model, seconds=call.elapsed)
+        return response
         
-        # Extract thought, action, observation and response using regex
+    def _parse_actions(self, result: str) -> tuple[Optional[str], Optional[List[tuple[str, str]]]]:
+        """
+        Parse the model's response into a final response and/or the actions to run.
+
+        Returns:
+            A (response, actions) tuple. When actions is None, response is the final
+            response or an error message. When actions is set, response is the
+            Response to Client text to return if the action turns out to be "none".
+        """
+        # Extract thought, actions, observation and response using regex
         thought_match = re.search(r'^Thought: (.*)$', result, re.MULTILINE)
-        action_match = re.search(r'^Action: (\w+): (.*)$', result, re.MULTILINE)
+        action_matches = list(self.action_re.finditer(result))
+        action_match = action_matches[0] if action_matches else None
         observation_match = re.search(r'^Observation: (.*)$', result, re.MULTILINE)
         response_match = re.search(r'^Response to Client: (.*)$', result, re.MULTILINE)
         
@@ -132,49 +421,25 @@ class BaseAgent:
         
         # If we have a complete response (all fields), process it normally
         if all([thought_match, action_match, observation_match, response_match]):
-            action_name, action_input = action_match.groups()
-            logger.info(f"Processing complete response with action: {action_name}")
+            actions = self._requested_actions(action_matches)
+            logger.info("Processing complete response with actions: %s", ", ".join(name for name, _ in actions))
             
-            if action_name not in self.actions:
-                error_msg = f"Unknown action: {action_name}. Available actions: {', '.join(self.actions.keys())}"
-                logger.error(error_msg)
-                return error_msg, None
+            unknown_error = self._unknown_action_error(actions)
+            if unknown_error:
+                return unknown_error, None
                 
-            try:
-                action = self.actions[action_name]
-                observation = action.handler(action_input)
-                logger.info(f"Action executed successfully. Observation: {observation}")
-                
-                # If this was the final response (no more actions needed), return the Response to Client
-                if action_name == "none":
-                    return response_match.group(1).strip(), None
-                
-                # Otherwise, return None to continue the conversation loop with the observation
-                return None, f"Observation: {observation}"
-            except Exception as e:
-                error_msg = f"Error executing {action_name}: {str(e)}"
-                logger.error(error_msg)
-                return error_msg, None
+            return response_match.group(1).strip(), actions
         
         # If we have a thought and action but no observation/response, this is a mid-process response
         if thought_match and action_match and not observation_match and not response_match:
-            action_name, action_input = action_match.groups()
-            logger.info(f"Processing mid-process response with action: {action_name}")
+            actions = self._requested_actions(action_matches)
+            logger.info("Processing mid-process response with actions: %s", ", ".join(name for name, _ in actions))
             
-            if action_name not in self.actions:
-                error_msg = f"Unknown action: {action_name}. Available actions: {', '.join(self.actions.keys())}"
-                logger.error(error_msg)
-                return error_msg, None
+            unknown_error = self._unknown_action_error(actions)
+            if unknown_error:
+                return unknown_error, None
                 
-            try:
-                action = self.actions[action_name]
-                observation = action.handler(action_input)
-                logger.info(f"Action executed successfully. Observation: {observation}")
-                return None, f"Observation: {observation}"
-            except Exception as e:
-                error_msg = f"Error executing {action_name}: {str(e)}"
-                logger.error(error_msg)
-                return error_msg, None
+            return None, actions
         
         # If we have a thought but no action, this is an incomplete response
         if thought_match and not action_match:
@@ -200,59 +465,835 @@ class BaseAgent:
         logger.error("Response contains no recognizable components")
         return "Error: Response contains no recognizable components", None
 
-    def query(self, messages: List[Message], user_id: UUID, db) -> str:
+    def _timed_parse(self, result: str) -> tuple[Optional[str], Optional[List[tuple[str, str]]]]:
+        start = time.perf_counter()
+        try:
+            return self._parse_actions(result)
+        finally:
+            telemetry.record_parse(time.perf_counter() - start)
+
+    def _requested_actions(self, action_matches: List[re.Match]) -> List[tuple[str, str]]:
+        """Collect the (name, input) pairs of every Action line, ignoring "none" when real actions are present."""
+        actions = [match.groups() for match in action_matches]
+        return [action for action in actions if action[0] != "none"] or actions[:1]
+
+    def _unknown_action_error(self, actions: List[tuple[str, str]]) -> Optional[str]:
+        for action_name, _ in actions:
+            if action_name not in self.actions:
+                error_msg = f"Unknown action: {action_name}. Available actions: {', '.join(self.actions.keys())}"
+                logger.error(error_msg)
+                return error_msg
+        return None
+
+    def _action_result(self, actions: List[tuple[str, str]], results: List[Any], response: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+        """Turn the results of executed actions into a (response, observation) pair."""
+        results = [self._observe(name, action_input, result) for (name, action_input), result in zip(actions, results)]
+        if len(actions) == 1:
+            action_name, result = actions[0][0], results[0]
+            if isinstance(result, BaseException):
+                return self._action_error(action_name, result)
+            logger.info("Action executed successfully. Observation: %s", result, extra=_OBSERVATION_LOG)
+
+            # If this was the final response (no more actions needed), return the Response to Client
+            if action_name == "none" and response is not None:
+                self._answered = True
+                return response, None
+
+            # Otherwise, return None to continue the conversation loop with the observation
+            return None, f"Observation: {result}"
+
+        # Several actions ran in this turn; report every result back in a single message
+        sections = []
+        for i, ((action_name, action_input), result) in enumerate(zip(actions, results), start=1):
+            if isinstance(result, BaseException):
+                result = f"Error executing {action_name}: {str(result)}"
+                logger.error(result)
+            sections.append(f"[{i}] {action_name}: {action_input}\n{result}")
+        observations = "\n\n".join(sections)
+        logger.info("%d actions executed. Observations:\n%s", len(actions), observations, extra=_OBSERVATION_LOG)
+        return None, f"Observation: Results of {len(actions)} actions\n\n{observations}"
+
+    def _observe(self, action_name: str, action_input: str, result: Any) -> Any:
+        """Deduplicate, rank and trim an action result to the action's token budget before the model sees it."""
+        if action_name in self.actions and action_name != "none":
+            self._used_actions.add(action_name)
+            self._record_turn(ACTION, action_input, action=action_name)
+        if isinstance(result, BaseException) or action_name not in self.actions:
+            self._record_turn(OBSERVATION, str(result), action=action_name, error=True)
+            return result
+        if action_name == "none":
+            return result
+        observation = self.observations.process(action_name, action_input, result, self.actions[action_name].observation_token_budget)
+        self._record_turn(OBSERVATION, str(observation), action=action_name, error=False)
+        return observation
+
+    def _action_error(self, action_name: str, error: BaseException) -> tuple[Optional[str], Optional[str]]:
+        """Turn a failed action into a (response, observation) pair carrying the error."""
+        error_msg = f"Error executing {action_name}: {str(error)}"
+        logger.error(error_msg)
+        return error_msg, None
+
+    def _bind_actions(self, actions: List[tuple[str, str]]) -> List[tuple[Action, Callable[[], Any]]]:
+        """Bind each parsed (name, input) pair to its handler."""
+        bound_calls = [
+            (self.actions[action_name], functools.partial(self.actions[action_name].handler, action_input))
+            for action_name, action_input in actions
+        ]
+        return self._use_speculation(actions, bound_calls)
+
+    def _speculate(self) -> None:
+        """Start the action the template's speculator predicts for the latest user message, if any."""
+        speculator = self.template.speculator
+        action = self.actions.get(speculator.action) if speculator is not None else None
+        last = self.messages[-1]
+        # Coroutine handlers run on the caller's event loop, so only synchronous ones can start early
+        if action is None or inspect.iscoroutinefunction(action.handler) or last["role"] != "user":
+            return
+        action_input = speculator.predict(last["content"])
+        if not action_input:
+            return
+        # Not timed as an action run: on a hit, the wait for the result is what the query sees
+        future = get_action_executor().submit(action.handler, action_input)
+        self._speculation = Speculation(action.name, action_input, future)
+        logger.info("Speculatively started %s with input: %s", action.name, action_input)
+
+    def _settle_speculation(self, requested: List[tuple[str, str]]) -> Optional[int]:
+        """
+        Match the pending speculation against the first turn's requested (name, input) calls.
+
+        The speculation is consumed either way. A hit returns the index of the call it
+        answers; otherwise it is recorded as a miss (the action was requested with a
+        different input) or as unused, and cancelled if it has not started yet.
+        """
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        index = speculation.match(requested, self.template.speculator.min_similarity)
+        if index is not None:
+            saved = speculation.saved_seconds()
+            telemetry.record_speculation(speculation.action, "hit", saved)
+            logger.info("Speculative %s used for %r, saving %.3fs", speculation.action, requested[index][1], saved)
+            return index
+        outcome = "miss" if any(name == speculation.action for name, _ in requested) else "unused"
+        speculation.future.cancel()
+        telemetry.record_speculation(speculation.action, outcome)
+        logger.info("Speculative %s for %r discarded (%s)", speculation.action, speculation.action_input, outcome)
+        return None
+
+    def _use_speculation(
+        self, requested: List[tuple[str, str]], bound_calls: List[tuple[Action, Callable[[], Any]]]
+    ) -> List[tuple[Action, Callable[[], Any]]]:
+        """Replace the bound call a speculative action already answers with a wait for its result."""
+        if self._speculation is None:
+            return bound_calls
+        speculation = self._speculation
+        index = self._settle_speculation(requested)
+        if index is not None:
+            bound_calls[index] = (bound_calls[index][0], speculation.future.result)
+        return bound_calls
+
+    def _action_timeout(self) -> Optional[float]:
+        """The action timeout, shortened to the time left before the query deadline or an enclosing one that is sooner."""
+        deadline = current_deadline() or self.deadline
+        if deadline is None:
+            return self.action_timeout
+        return deadline.timeout(self.action_timeout)
+
+    def run_actions(self, calls: List[tuple[Action, Callable[[], Any]]]) -> List[Any]:
+        """
+        Run bound action handlers, concurrently when there are several.
+
+        Synchronous handlers run in the action thread pool, even when there is only
+        one, so the action timeout bounds the wait for every handler; coroutine
+        handlers run on the action event loop, so this also works when called from a
+        thread with a running loop. Each entry of the returned list is either the
+        handler's result or the exception it raised, in the same order as calls.
+        """
+        futures = [self._submit_action(action, bound) for action, bound in calls]
+        action_timeout = self._action_timeout()
+        deadline = time.monotonic() + action_timeout if action_timeout is not None else None
+        results = []
+        for (action, _), future in zip(calls, futures):
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                results.append(_await_on_action_loop(future.result(timeout=timeout), timeout))
+            except FutureTimeoutError:
+                future.cancel()
+                telemetry.record_action_timeout(action.name)
+                results.append(TimeoutError(f"{action.name} timed out after {action_timeout:.1f} seconds"))
+            except Exception as e:
+                results.append(e)
+        deadline = current_deadline() or self.deadline
+        if deadline is not None and deadline.expired:
+            # Stopped waiting because the query ran out of time, not because an action failed
+            raise DeadlineExceeded("Request deadline exceeded while running actions")
+        return results
+
+    def _submit_action(self, action: Action, bound: Callable[[], Any]) -> Future:
+        """Start a bound handler: coroutine handlers on the action loop, timed until they finish, others in the action pool."""
+        if inspect.iscoroutinefunction(action.handler):
+            return asyncio.run_coroutine_threadsafe(_atimed_action(action, bound), get_action_loop())
+        return get_action_executor().submit(_timed_action(action, bound))
+
+    async def _run_bound_action(self, action: Action, bound: Callable[[], Any]) -> Any:
+        """
+        Run a bound action handler without blocking the event loop.
+
+        Coroutine handlers are awaited directly; synchronous handlers are offloaded
+        to the bounded action thread pool. Both are subject to the action timeout.
+        """
+        async with self._action_semaphore:
+            if inspect.iscoroutinefunction(action.handler):
+                pending = _atimed_action(action, bound)
+            else:
+                pending = asyncio.get_running_loop().run_in_executor(get_action_executor(), _timed_action(action, bound))
+            action_timeout = self._action_timeout()
+            try:
+                observation = await asyncio.wait_for(pending, timeout=action_timeout)
+                if inspect.isawaitable(observation):
+                    observation = await asyncio.wait_for(observation, timeout=self._action_timeout())
+            except asyncio.TimeoutError:
+                telemetry.record_action_timeout(action.name)
+                raise TimeoutError(f"{action.name} timed out after {action_timeout:.1f} seconds")
+            return observation
+
+    async def run_action(self, action: Action, action_input: str) -> Any:
+        """Run an action handler without blocking the event loop."""
+        return await self._run_bound_action(action, functools.partial(action.handler, action_input))
+
+    async def arun_actions(self, calls: List[tuple[Action, Callable[[], Any]]]) -> List[Any]:
+        """
+        Run bound action handlers concurrently without blocking the event loop.
+
+        Each entry of the returned list is either the handler's result or the
+        exception it raised, in the same order as calls.
+        """
+        return await asyncio.gather(
+            *(self._run_bound_action(action, bound) for action, bound in calls),
+            return_exceptions=True
+        )
+
+    def process_actions(self, result: str) -> tuple[Optional[str], Optional[str]]:
+        """Process any actions in the model's response."""
+        logger.info("Processing actions from response...")
+        response, actions = self._timed_parse(result)
+        if actions is None:
+            return response, None
+        results = self.run_actions(self._bind_actions(actions))
+        return self._action_result(actions, results, response)
+
+    async def aprocess_actions(self, result: str) -> tuple[Optional[str], Optional[str]]:
+        """Process any actions in the model's response, running handlers concurrently and asynchronously."""
+        logger.info("Processing actions from response...")
+        response, actions = self._timed_parse(result)
+        if actions is None:
+            return response, None
+        results = await self.arun_actions(self._bind_actions(actions))
+        return self._action_result(actions, results, response)
+
+    def execute_tools(self) -> ModelResponse:
+        """Execute a single turn of conversation with the model in native tool-calling mode."""
+        logger.info("Generating tool-calling model response with %d messages", len(self.messages))
+        with self._model_call_span("tools") as call:
+            turn = self.model_provider.generate_with_tools(self.context_messages(), self.temperature, list(self.template.tools))
+        logger.info("Model response: %r with %d tool call(s)", turn.content, len(turn.tool_calls), extra=_RESPONSE_LOG)
+        self._record_model_turn(turn, call.elapsed)
+        return turn
+
+    async def aexecute_tools(self) -> ModelResponse:
+        """Execute a single turn of conversation with the model in native tool-calling mode without blocking the event loop."""
+        logger.info("Generating tool-calling model response with %d messages", len(self.messages))
+        with self._model_call_span("tools") as call:
+            turn = await self.model_provider.agenerate_with_tools(self.context_messages(), self.temperature, list(self.template.tools))
+        logger.info("Model response: %r with %d tool call(s)", turn.content, len(turn.tool_calls), extra=_RESPONSE_LOG)
+        self._record_model_turn(turn, call.elapsed)
+        return turn
+
+    def _record_model_turn(self, turn: ModelResponse, seconds: float) -> None:
+        tool_calls = [{"name": call.name, "arguments": call.arguments} for call in turn.tool_calls]
+        self._record_turn(MODEL, turn.content or "", model=self.model, seconds=seconds, tool_calls=tool_calls)
+
+    def _record_tool_turn(self, turn: ModelResponse) -> None:
+        """Append a tool-calling model turn to the conversation history."""
+        message = {"role": "assistant", "content": turn.content}
+        if turn.tool_calls:
+            message["tool_calls"] = [call.dict() for call in turn.tool_calls]
+        self.messages.append(message)
+
+    def _record_tool_results(self, calls: List[ToolCall], results: List[Any]) -> None:
+        """Append the results of a turn's tool calls to the conversation history."""
+        for call, result in zip(calls, results):
+            result = self._observe(call.name, " ".join(str(value) for value in call.arguments.values()), result)
+            if isinstance(result, BaseException):
+                result = f"Error executing {call.name}: {str(result)}"
+                logger.error(result)
+            else:
+                logger.info("Tool call %s executed successfully. Observation: %s", call.name, str(result), extra=_OBSERVATION_LOG)
+            self.messages.append({
+                "role": "tool",
+                "content": str(result),
+                "tool_call_id": call.id,
+                "name": call.name
+            })
+
+    def _bind_tool_calls(self, calls: List[ToolCall]) -> List[tuple[Action, Callable[[], Any]]]:
+        """Resolve tool calls to their handlers with the structured arguments bound."""
+        bound_calls = []
+        for call in calls:
+            logger.info("Running tool call %s with arguments %s", call.name, call.arguments)
+            action = self.actions.get(call.name)
+            if action is None:
+                available = ", ".join(tool.name for tool in self.template.tools)
+                error = ValueError(f"Unknown action: {call.name}. Available actions: {available}")
+                bound_calls.append((self.actions["none"], functools.partial(_raise, error)))
+            else:
+                bound_calls.append((action, action.bind_arguments(call.arguments)))
+        requested = [(call.name, " ".join(str(value) for value in call.arguments.values())) for call in calls]
+        return self._use_speculation(requested, bound_calls)
+
+    def _query_tools(self) -> str:
+        """Run the agent loop in native tool-calling mode."""
+        action_count = 0
+        while True:
+            turn = self.execute_tools()
+            if self._escalate(bool(turn.tool_calls) or self._requests_actions(turn.content)):
+                continue
+            self._record_tool_turn(turn)
+
+            if turn.tool_calls:
+                results = self.run_actions(self._bind_tool_calls(turn.tool_calls))
+                self._record_tool_results(turn.tool_calls, results)
+            elif not _text_protocol_re.search(turn.content):
+                logger.info("Query complete with direct tool-mode response")
+                self._answered = True
+                return turn.content.strip()
+            else:
+                # The model answered in the text protocol; handle it as in text mode
+                logger.info("Falling back to text protocol parsing")
+                response, observation = self.process_actions(turn.content)
+                if response is not None:
+                    return response
+                self.add_message(observation)
+
+            action_count += 1
+            logger.info("Action %d/%d executed", action_count, self.max_turns)
+            if action_count >= self.max_turns:
+                logger.warning("Max actions reached without final response")
+                return "Max actions reached without final response"
+
+    async def _aquery_tools(self) -> str:
+        """Run the agent loop in native tool-calling mode without blocking the event loop."""
+        action_count = 0
+        while True:
+            turn = await self.aexecute_tools()
+            if self._escalate(bool(turn.tool_calls) or self._requests_actions(turn.content)):
+                continue
+            self._record_tool_turn(turn)
+
+            if turn.tool_calls:
+                results = await self.arun_actions(self._bind_tool_calls(turn.tool_calls))
+                self._record_tool_results(turn.tool_calls, results)
+            elif not _text_protocol_re.search(turn.content):
+                logger.info("Query complete with direct tool-mode response")
+                self._answered = True
+                return turn.content.strip()
+            else:
+                # The model answered in the text protocol; handle it as in text mode
+                logger.info("Falling back to text protocol parsing")
+                response, observation = await self.aprocess_actions(turn.content)
+                if response is not None:
+                    return response
+                self.add_message(observation)
+
+            action_count += 1
+            logger.info("Action %d/%d executed", action_count, self.max_turns)
+            if action_count >= self.max_turns:
+                logger.warning("Max actions reached without final response")
+                return "Max actions reached without final response"
+
+    def _query_text(self) -> str:
+        """Run the agent loop in the text (ReAct) protocol."""
+        action_count = 0
+        while True:
+            result = self.execute()
+            if self._escalate(self._requests_actions(result)):
+                continue
+            self.messages.append({"role": "assistant", "content": result})
+        
+            response, observation = self.process_actions(result)
+        
+            # If we got a response, return it
+            if response is not None:
+                logger.info("Query complete with response: %s", response, extra=_RESPONSE_LOG)
+                return response
+            
+            # If we got an observation, we executed an action
+            if observation is not None:
+                action_count += 1
+                logger.info("Action %d/%d executed", action_count, self.max_turns)
+            
+                if action_count >= self.max_turns:
+                    logger.warning("Max actions reached without final response")
+                    return "Max actions reached without final response"
+                
+                logger.info("Adding observation of %d characters to messages", len(observation))
+                self.add_message(observation)
+            else:
+                logger.info("No observation to process, ending query")
+                break
+            
+        logger.warning("Query ended without final response")
+        return "Query ended without final response"
+
+    async def _aquery_text(self) -> str:
+        """Run the agent loop in the text (ReAct) protocol without blocking the event loop."""
+        action_count = 0
+        while True:
+            result = await self.aexecute()
+            if self._escalate(self._requests_actions(result)):
+                continue
+            self.messages.append({"role": "assistant", "content": result})
+
+            response, observation = await self.aprocess_actions(result)
+
+            # If we got a response, return it
+            if response is not None:
+                logger.info("Query complete with response: %s", response, extra=_RESPONSE_LOG)
+                return response
+
+            # If we got an observation, we executed an action
+            if observation is not None:
+                action_count += 1
+                logger.info("Action %d/%d executed", action_count, self.max_turns)
+
+                if action_count >= self.max_turns:
+                    logger.warning("Max actions reached without final response")
+                    return "Max actions reached without final response"
+
+                logger.info("Adding observation of %d characters to messages", len(observation))
+                self.add_message(observation)
+            else:
+                logger.info("No observation to process, ending query")
+                break
+
+        logger.warning("Query ended without final response")
+        return "Query ended without final response"
+
+    def _start_query(self, messages: List[Message], deadline: Optional[Deadline], user_id: Optional[UUID] = None, db=None) -> None:
+        self.deadline = deadline
+        self._query_start = len(self.messages)
+        self.add_message(messages)
+        # A TurnRecorder passed as the query's db persists its turns
+        self._recorder = db if isinstance(db, TurnRecorder) else None
+        self._user_id = user_id
+        # Clients resend the whole history, so only the newest user message is recorded
+        new_user_messages = [message for message in self.messages[self._query_start:] if message["role"] == "user"]
+        if new_user_messages:
+            self._record_turn(USER, str(new_user_messages[-1].get("content") or ""))
+        self._used_actions = set()
+        self._answered = False
+        self.model_provider, self.model = self.template.model_provider, self.template.model
+        self._route, self._escalated = None, False
+        self._prompt_end = len(self.messages)
+
+    def _response_key(self, provider: ModelProvider, model: str) -> str:
+        """Response cache key of the current query's answer by a provider and model."""
+        return self.template.response_cache.key(
+            self.messages[:self._prompt_end], self.template.system_prompt, provider.name, model,
+            self.temperature, [tool.name for tool in self.template.tools] if self.tool_calling else ()
+        )
+
+    def _cached_response(self) -> Optional[str]:
+        """
+        Return the cached answer to the current query, if any, recording it in the history.
+
+        Called after routing, so answers are looked up under the model tier that
+        would produce them; a light-tier query also accepts the full model's answer.
+        """
+        cache = self.template.response_cache
+        if cache is None:
+            return None
+        keys = [self._response_key(self.model_provider, self.model)]
+        if self.model_provider is not self.template.model_provider:
+            keys.append(self._response_key(self.template.model_provider, self.template.model))
+        for key in keys:
+            response = cache.get(key)
+            if response is not None:
+                logger.info("Query answered from the response cache")
+                self._route = None  # the routed tier did not answer, so there is no outcome to record
+                self.messages.append({"role": "assistant", "content": response})
+                self._record_turn(MODEL, response, source="cache")
+                self._answered = True
+                return response
+        return None
+
+    async def _acached_response(self) -> Optional[str]:
+        cache = self.template.response_cache
+        if cache is not None and cache.blocking:
+            return await asyncio.to_thread(self._cached_response)
+        return self._cached_response()
+
+    def _store_response(self, response: str) -> None:
+        """Cache the answer of a query that the model completed; errors and partial answers are not cached."""
+        cache = self.template.response_cache
+        if cache is not None and self._answered:
+            # Keyed on the model that produced the answer: the light tier's, unless the query escalated
+            cache.put(self._response_key(self.model_provider, self.model), response, self._used_actions)
+
+    async def _astore_response(self, response: str) -> None:
+        cache = self.template.response_cache
+        if cache is not None and cache.blocking:
+            await asyncio.to_thread(self._store_response, response)
+        else:
+            self._store_response(response)
+
+    def _route_query(self) -> Optional[str]:
+        """
+        Route the latest user turn with the template's router before any model call.
+
+        Returns the canned reply of a template route, recorded in the history;
+        light routes switch the query's model calls to the light provider.
+        """
+        router = self.template.router
+        last = self.messages[-1]
+        if router is None or not self.routing or last["role"] != "user":
+            return None
+        route = router.route(last["content"], self.messages[-2] if len(self.messages) > 1 else None)
+        if route.kind == LIGHT and self.template.light_provider is None:
+            route = route._replace(kind=FULL)
+        self._route = route
+        telemetry.record_route(route.kind)
+        logger.info("Routed turn to %s: %s", route.kind, route.reason)
+        if route.kind == LIGHT:
+            self.model_provider, self.model = self.template.light_provider, self.template.light_provider.model
+        elif route.kind == TEMPLATE:
+            if router.shadow_rate and random.random() < router.shadow_rate:
+                history = [dict(message) for message in self.messages if message["role"] != "system"]
+                get_action_executor().submit(self._shadow_template_turn, history)
+            self.messages.append({"role": "assistant", "content": route.response})
+            self._record_turn(MODEL, route.response, source="template")
+            self._answered = True
+            return route.response
+        return None
+
+    def _shadow_template_turn(self, history: List[Dict[str, Any]]) -> None:
+        """Run a template-answered turn through the full agent and record whether it would have used an action."""
+        agent = self.template.create_agent()
+        agent.routing = False
+        try:
+            agent.query(history, None, None)
+        except Exception as e:
+            logger.error(f"Error in shadow run of a template-routed turn: {str(e)}")
+            return
+        self.template.router.record_outcome(TEMPLATE, "disagreed" if agent._used_actions else "confirmed")
+
+    def _requests_actions(self, text: str) -> bool:
+        """Whether a text protocol turn asks for a real action."""
+        return any(name != "none" for name, _ in self.action_re.findall(text))
+
+    def _escalate(self, requests_actions: bool) -> bool:
+        """
+        Move a light-tier query to the full model when its turn asks for an action.
+
+        Returns whether the turn must be generated again, by the full model.
+        """
+        if not requests_actions or self.model_provider is self.template.model_provider:
+            return False
+        logger.info("Light model turn requested an action, escalating to the full model")
+        self.model_provider, self.model = self.template.model_provider, self.template.model
+        self._escalated = True
+        return True
+
+    def _finish_route(self, seconds: float) -> None:
+        """Record how the current query's routing decision held up and the time it saved."""
+        route, self._route = self._route, None
+        router = self.template.router
+        if route is None or router is None:
+            return
+        if route.kind == FULL:
+            router.observe_full(seconds)
+        elif route.kind == LIGHT and self._escalated:
+            router.record_outcome(LIGHT, "escalated")
+        else:
+            if route.kind == LIGHT:
+                router.record_outcome(LIGHT, "confirmed")
+            router.record_saved(route.kind, seconds)
+
+    def _deadline_exceeded(self, error: BaseException) -> bool:
+        """Whether error was caused by the query deadline running out."""
+        return self.deadline is not None and (isinstance(error, TimeoutError) or self.deadline.expired)
+
+    @property
+    def answered(self) -> bool:
+        """Whether the latest query ended with a final answer, from the model, a template or the response cache."""
+        return self._answered
+
+    def partial_response(self) -> str:
+        """
+        Build a best-effort answer for a query whose deadline expired.
+
+        The newest observation gathered by the query is returned, since it holds
+        what the final answer would have been based on.
+        """
+        for message in reversed(self.messages[self._query_start:]):
+            content = message["content"]
+            if message["role"] == "tool" or (message["role"] == "user" and content.startswith("Observation: ")):
+                content = content.removeprefix("Observation: ").strip()
+                if len(content) > PARTIAL_RESPONSE_MAX_CHARS:
+                    content = content[:PARTIAL_RESPONSE_MAX_CHARS].rstrip() + "..."
+                return f"I ran out of time before finishing my answer. Here is what I found so far:\n\n{content}"
+        return "I ran out of time before I could answer. Please try again."
+
+    def query(self, messages: List[Message], user_id: UUID, db, deadline: Optional[Deadline] = None) -> str:
         """
         Process a message through the agent, handling multiple turns of action/observation.
         
         Args:
             messages: The input message(s) to process
             user_id: The ID of the user making the request
-            db: Database connection object
+            db: Optional TurnRecorder that persists the query's turns; other values are ignored
+            deadline: Optional time budget for the whole query. Model calls and actions
+                get the remaining budget as their timeout, and a partial answer is
+                returned once it runs out.
             
         Returns:
             The final response string to send to the client
         """
-        try:
-            logger.info(f"Starting query for user {user_id}")
-            self.add_message(messages)
+        with self._query_span("tools" if self.tool_calling else "text"), deadline_scope(deadline):
+            try:
+                logger.info("Starting query for user %s", user_id)
+                self._start_query(messages, deadline, user_id, db)
+                if self._recorder is not None:
+                    self._recorder.wait_for_capacity()
+                response = self._route_query() or self._cached_response()
+                if response is None:
+                    self._speculate()
+                    response = self._query_tools() if self.tool_calling else self._query_text()
+                    self._store_response(response)
+                return response
             
+            except Exception as e:
+                if self._deadline_exceeded(e):
+                    logger.warning(f"Query deadline exceeded: {str(e)}")
+                    return self.partial_response()
+                error_msg = f"Error in agent loop: {str(e)}"
+                logger.error(error_msg)
+                return error_msg 
+
+    async def aquery(
+        self,
+        messages: List[Message],
+        user_id: UUID,
+        db,
+        deadline: Optional[Deadline] = None,
+        raise_errors: bool = False
+    ) -> str:
+        """
+        Asynchronously process a message through the agent, handling multiple turns of action/observation.
+
+        Model calls go through the provider's async client and action handlers run off
+        the event loop, so a single worker can serve many conversations concurrently.
+        Cancelling the calling task cancels in-flight model calls and stops waiting
+        for actions.
+
+        Args:
+            messages: The input message(s) to process
+            user_id: The ID of the user making the request
+            db: Optional TurnRecorder that persists the query's turns; other values are ignored
+            deadline: Optional time budget for the whole query. In-flight work is
+                cancelled when it runs out and a partial answer is returned.
+            raise_errors: Raise errors, including an expired deadline, instead of
+                returning them as the response, e.g. for callers that retry failures;
+                a query that ends without a final answer raises UnansweredQueryError
+
+        Returns:
+            The final response string to send to the client
+        """
+        with self._query_span("tools" if self.tool_calling else "text"), deadline_scope(deadline):
+            try:
+                logger.info("Starting query for user %s", user_id)
+                self._start_query(messages, deadline, user_id, db)
+                if self._recorder is not None:
+                    await self._recorder.await_capacity()
+                response = self._route_query() or await self._acached_response()
+                if response is not None:
+                    return response
+                self._speculate()
+                run = self._aquery_tools() if self.tool_calling else self._aquery_text()
+                response = await (run if deadline is None else asyncio.wait_for(run, timeout=deadline.remaining()))
+                if raise_errors and not self._answered:
+                    # The loop reports its own failures, e.g. running out of turns, as the response
+                    raise UnansweredQueryError(response)
+                await self._astore_response(response)
+                return response
+
+            except Exception as e:
+                if raise_errors:
+                    raise
+                if self._deadline_exceeded(e):
+                    logger.warning(f"Query deadline exceeded: {str(e) or type(e).__name__}")
+                    return self.partial_response()
+                error_msg = f"Error in agent loop: {str(e)}"
+                logger.error(error_msg)
+                return error_msg
+
+    async def astream_turn(self) -> AsyncIterator[tuple[str, str]]:
+        """
+        Stream a single model turn, yielding ("response", delta) events as they arrive.
+
+        As soon as the "Action:" lines for real actions are complete (the next line is
+        something else), the rest of the generation is cancelled so the handlers can
+        start right away. Once the turn is over a final ("result", text) event carries
+        the text that was consumed.
+        """
+        logger.info("Streaming model response with %d messages", len(self.messages))
+        parser = ReActStreamParser()
+        stream = self.model_provider.astream_response(self.context_messages(), self.temperature)
+        actions_end = None
+        self.turns += 1
+        provider, model = self.model_provider.name, self.model
+        # Generator yields cannot hold a current span, so this one is ended explicitly
+        call = telemetry.start_span("agent.model_call", provider=provider, model=model, mode="stream")
+        first_token = True
+        try:
+            while (chunk := await self._anext_chunk(stream)) is not None:
+                if first_token:
+                    first_token = False
+                    telemetry.record_time_to_first_token(provider, model, call.elapsed)
+                for event in parser.feed(chunk):
+                    if actions_end is not None and event.kind != "action":
+                        logger.info("Action lines received, cancelling generation")
+                        self._record_turn(MODEL, parser.text[:actions_end], model=model, seconds=call.elapsed)
+                        yield "result", parser.text[:actions_end]
+                        return
+                    if event.kind == "response":
+                        yield "response", event.text
+                    elif event.kind == "action" and event.action_name != "none":
+                        actions_end = event.end
+            for event in parser.close():
+                if event.kind == "response":
+                    yield "response", event.text
+        except Exception:
+            call.status = "error"
+            raise
+        finally:
+            await stream.aclose()
+            telemetry.record_model_call(provider, model, "stream", call.status, call.elapsed)
+            call.end()
+        logger.info("Model response:\n%s", parser.text, extra=_RESPONSE_LOG)
+        self._record_turn(MODEL, parser.text, model=model, seconds=call.elapsed)
+        yield "result", parser.text
+
+    async def _anext_chunk(self, stream: AsyncIterator[str]) -> Optional[str]:
+        """Return the next chunk of a model stream, or None at its end, waiting no longer than the query deadline."""
+        try:
+            if self.deadline is None:
+                return await stream.__anext__()
+            # Generator yields cannot hold a context, so the deadline is made current per chunk
+            with deadline_scope(self.deadline):
+                return await asyncio.wait_for(stream.__anext__(), timeout=self.deadline.remaining())
+        except StopAsyncIteration:
+            return None
+
+    async def astream(self, messages: List[Message], user_id: UUID, db, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """
+        Process a message through the agent, streaming the Response to Client as it is generated.
+
+        Closing the iterator early cancels the in-flight model stream.
+
+        Args:
+            messages: The input message(s) to process
+            user_id: The ID of the user making the request
+            db: Optional TurnRecorder that persists the query's turns; other values are ignored
+            deadline: Optional time budget for the whole query. When it runs out the
+                stream ends, with a partial answer if nothing was sent yet.
+
+        Yields:
+            Chunks of the final response text to send to the client
+        """
+        query = telemetry.start_span("agent.query", mode="stream")
+        self.turns = 0
+        responded = False
+        try:
+            logger.info("Starting streamed query for user %s", user_id)
+            self._start_query(messages, deadline, user_id, db)
+            if self._recorder is not None:
+                await self._recorder.await_capacity()
+            response = self._route_query() or await self._acached_response()
+            if response is not None:
+                yield response
+                return
+            self._speculate()
+            if self.tool_calling:
+                # Tool calls are not streamed; send the final response as one chunk
+                with deadline_scope(deadline):
+                    run = self._aquery_tools()
+                    response = await (run if deadline is None else asyncio.wait_for(run, timeout=deadline.remaining()))
+                await self._astore_response(response)
+                yield response
+                return
+
             action_count = 0
             while True:
-                result = self.execute()
-                self.messages.append({
-                    "role": "assistant",
-                    "content": result,
-                    "type": "text"
-                })
-                
-                response, observation = self.process_actions(result)
-                logger.info(f"Response: {response}")
-                logger.info(f"Observation: {observation}")
-                
+                streamed = False
+                result = ""
+                chunks = []
+                async for kind, text in self.astream_turn():
+                    if kind == "response":
+                        streamed = responded = True
+                        chunks.append(text)
+                        yield text
+                    else:
+                        result = text
+                if not streamed and self._escalate(self._requests_actions(result)):
+                    continue
+                self.messages.append({"role": "assistant", "content": result})
+
+                # The response was already forwarded to the client as it arrived
+                if streamed:
+                    logger.info("Streamed query complete")
+                    self._answered = True
+                    await self._astore_response("".join(chunks))
+                    return
+
+                response, observation = await self.aprocess_actions(result)
+
                 # If we got a response, return it
                 if response is not None:
-                    logger.info(f"Query complete with response: {response}")
-                    return response
-                    
+                    logger.info("Query complete with response: %s", response, extra=_RESPONSE_LOG)
+                    await self._astore_response(response)
+                    yield response
+                    return
+
                 # If we got an observation, we executed an action
                 if observation is not None:
                     action_count += 1
-                    logger.info(f"Action {action_count}/{self.max_turns} executed")
-                    
+                    logger.info("Action %d/%d executed", action_count, self.max_turns)
+
                     if action_count >= self.max_turns:
                         logger.warning("Max actions reached without final response")
-                        return "Max actions reached without final response"
-                        
-                    logger.info(f"Adding observation to messages: {observation}")
+                        yield "Max actions reached without final response"
+                        return
+
+                    logger.info("Adding observation of %d characters to messages", len(observation))
                     self.add_message(observation)
                 else:
                     logger.info("No observation to process, ending query")
                     break
-                    
+
             logger.warning("Query ended without final response")
-            return "Query ended without final response"
-            
+            yield "Query ended without final response"
+
         except Exception as e:
+            if self._deadline_exceeded(e):
+                logger.warning(f"Streamed query deadline exceeded: {str(e) or type(e).__name__}")
+                # A response that was already being streamed is left as the partial answer
+                if not responded:
+                    yield self.partial_response()
+                return
             error_msg = f"Error in agent loop: {str(e)}"
             logger.error(error_msg)
-            return error_msg 
\ No newline at end of file
+            yield error_msg
+        finally:
+            self._record_query("stream", query)
+            query.end()
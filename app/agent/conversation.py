@@ -0,0 +1,135 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar, Union, overload
+
+T = TypeVar("T")
+
+Converter = Callable[[Dict[str, Any]], T]
+
+
+class Conversation:
+    """
+    The append-only message history of an agent.
+
+    Messages are plain dicts with "role" and "content" (plus "tool_calls",
+    "tool_call_id" and "name" for tool turns) and must not be modified once
+    appended. That lets each provider convert a message to its wire format once
+    and reuse the conversion on every later turn, so a multi-turn query only
+    converts the messages added since the previous model call.
+    """
+
+    __slots__ = ("_messages", "_positions", "_wire", "_totals")
+
+    def __init__(self, messages: Iterable[Dict[str, Any]] = ()):
+        self._messages: List[Dict[str, Any]] = []
+        self._positions: Dict[int, int] = {}  # id(message) -> index, built lazily for views; ids stay valid as the list keeps messages alive
+        self._wire: Dict[str, List[Any]] = {}  # provider -> converted messages, a prefix of _messages
+        self._totals: Dict[str, Tuple[int, int]] = {}  # key -> (messages measured, running total)
+        self.extend(messages)
+
+    def append(self, message: Dict[str, Any]) -> None:
+        self._messages.append(message)
+
+    def extend(self, messages: Iterable[Dict[str, Any]]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._messages)
+
+    @overload
+    def __getitem__(self, index: int) -> Dict[str, Any]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Dict[str, Any]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return f"Conversation({len(self._messages)} messages)"
+
+    def total(self, key: str, measure: Callable[[Dict[str, Any]], int]) -> int:
+        """Return the sum of measure over all messages, e.g. their token counts, measuring only new messages."""
+        measured, total = self._totals.get(key, (0, 0))
+        for message in self._messages[measured:]:
+            total += measure(message)
+        self._totals[key] = (len(self._messages), total)
+        return total
+
+    def view(self, messages: List[Dict[str, Any]]) -> "ConversationView":
+        """Wrap a trimmed or rearranged selection of this conversation's messages so it can reuse their conversions."""
+        return ConversationView(self, messages)
+
+    def _converted(self, provider: str, convert: Converter) -> List[Any]:
+        """Return the provider's conversions of every message, converting only the ones appended since the last call."""
+        wire = self._wire.setdefault(provider, [])
+        for message in self._messages[len(wire):]:
+            wire.append(convert(message))
+        return wire
+
+    def wire(self, provider: str, convert: Converter) -> List[Any]:
+        """Convert the whole conversation to a provider's wire format, one converted message per message."""
+        return list(self._converted(provider, convert))
+
+    def wire_selection(self, messages: Sequence[Dict[str, Any]], provider: str, convert: Converter) -> List[Any]:
+        """Convert a selection of messages, reusing the conversions of those that belong to this conversation."""
+        wire = self._converted(provider, convert)
+        for index in range(len(self._positions), len(self._messages)):
+            self._positions[id(self._messages[index])] = index
+        converted = []
+        for message in messages:
+            index = self._positions.get(id(message))
+            if index is not None and self._messages[index] is message:
+                converted.append(wire[index])
+            else:
+                # Messages made for this turn only, such as summaries and elided observations
+                converted.append(convert(message))
+        return converted
+
+
+class ConversationView:
+    """A read-only selection of a conversation's messages, e.g. history trimmed to a token budget."""
+
+    __slots__ = ("conversation", "messages")
+
+    def __init__(self, conversation: Conversation, messages: List[Dict[str, Any]]):
+        self.conversation = conversation
+        self.messages = messages
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.messages)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        return self.messages[index]
+
+    def __repr__(self) -> str:
+        return f"ConversationView({len(self.messages)} of {len(self.conversation)} messages)"
+
+    def wire(self, provider: str, convert: Converter) -> List[Any]:
+        return self.conversation.wire_selection(self.messages, provider, convert)
+
+
+def to_wire(messages: Sequence[Dict[str, Any]], provider: str, convert: Converter) -> List[Any]:
+    """
+    Convert messages to a provider's wire format, one converted message per message.
+
+    Conversations and their views reuse earlier conversions; plain lists are
+    converted in full.
+
+    Args:
+        messages: A Conversation, ConversationView or list of message dicts
+        provider: Key under which conversions are memoized, e.g. the provider name
+        convert: Converts one message; it must not depend on the message's neighbours
+
+    Returns:
+        A new list that the caller may modify. The converted messages are shared
+        with later calls and must be copied before they are modified.
+    """
+    if isinstance(messages, (Conversation, ConversationView)):
+        return messages.wire(provider, convert)
+    return [convert(message) for message in messages]
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget runs out before work could start or finish."""
+    pass
+
+
+class Deadline:
+    """
+    An absolute point in time by which a request must be answered.
+
+    The deadline flows from the endpoint through the agent loop to the providers
+    and action handlers, each of which uses the remaining budget as its timeout.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, default: Optional[float] = None) -> float:
+        """Return the remaining budget, capped at default when one is given."""
+        remaining = self.remaining()
+        return remaining if default is None else min(default, remaining)
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired:
+            raise DeadlineExceeded("Request deadline exceeded")
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.3f}s)"
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("agent_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Return the deadline of the request being served by the current context, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """
+    Make deadline the current deadline for the block.
+
+    Provider calls and the admission controller read it to bound their timeouts
+    and queue waits. An enclosing deadline that expires sooner stays in force.
+    """
+    enclosing = _current_deadline.get()
+    if deadline is None or (enclosing is not None and enclosing.expires_at <= deadline.expires_at):
+        deadline = enclosing
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(token)
+        except ValueError:
+            # An async generator finalized from another context; that context never saw the value
+            pass
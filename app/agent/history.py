@@ -0,0 +1,286 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .conversation import Conversation
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character heuristic
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets for conversation history, matched by model name prefix.
+# These leave headroom below each model's context window for the completion.
+DEFAULT_TOKEN_BUDGETS = {
+    "gpt-4o": 96_000,
+    "gpt-4-turbo": 96_000,
+    "gpt-4": 6_000,
+    "gpt-3.5": 12_000,
+    "claude": 150_000,
+}
+FALLBACK_TOKEN_BUDGET = 6_000
+
+# Approximate per-message token overhead of the chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+ELIDED_RESULT = "[Earlier result removed to save context]"
+
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], str]
+
+
+def get_token_budget(model: str) -> int:
+    """Return the history token budget for a model, overridable with HISTORY_TOKEN_BUDGET."""
+    if os.getenv("HISTORY_TOKEN_BUDGET"):
+        return int(os.getenv("HISTORY_TOKEN_BUDGET"))
+    matches = [prefix for prefix in DEFAULT_TOKEN_BUDGETS if model.startswith(prefix)]
+    if not matches:
+        return FALLBACK_TOKEN_BUDGET
+    return DEFAULT_TOKEN_BUDGETS[max(matches, key=len)]
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+# Token counts of recently seen texts, keyed by a digest so the cache never holds the texts themselves
+TOKEN_COUNT_CACHE_SIZE = 4096
+_token_counts: "OrderedDict[Tuple[bytes, str], int]" = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Uses tiktoken when it is installed and a ~4 characters per token estimate
+    otherwise. tiktoken counts are cached by a digest of the text, so recounting
+    a restored conversation's messages is cheap.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), model)
+    with _token_counts_lock:
+        if key in _token_counts:
+            _token_counts.move_to_end(key)
+            return _token_counts[key]
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    with _token_counts_lock:
+        _token_counts[key] = tokens
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return tokens
+
+
+def message_tokens(message: Dict[str, Any], model: str = "gpt-4o") -> int:
+    """Count the tokens a message contributes to the prompt."""
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"] or "", model)
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(f"{call['name']}{call['arguments']}", model)
+    return tokens
+
+
+def is_observation(message: Dict[str, Any]) -> bool:
+    """Whether a message carries an action result."""
+    return message["role"] == "tool" or (
+        message["role"] == "user" and message["content"].startswith("Observation:")
+    )
+
+
+def elide_observation(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of an observation message with its content removed."""
+    content = ELIDED_RESULT if message["role"] == "tool" else f"Observation: {ELIDED_RESULT}"
+    return {**message, "content": content}
+
+
+def extractive_summary(
+    previous: Optional[str],
+    messages: List[Dict[str, Any]],
+    max_chars: int = 200,
+    max_lines: int = 40
+) -> str:
+    """
+    Summarize messages locally by keeping the start of each user and assistant turn.
+
+    Observations and tool results are skipped, and for text-protocol replies only the
+    Response to Client is kept. Only the latest max_lines turns are retained.
+    """
+    lines = previous.splitlines() if previous else []
+    for message in messages:
+        if message["role"] == "system" or is_observation(message) or not message["content"]:
+            continue
+        content = message["content"]
+        if message["role"] == "assistant" and "Response to Client:" in content:
+            content = content.split("Response to Client:", 1)[1]
+        content = " ".join(content.split())
+        if len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "..."
+        lines.append(f"- {message['role']}: {content}")
+    return "\n".join(lines[-max_lines:])
+
+
+class SummaryCache:
+    """
+    Rolling summaries of conversations, by a digest of the messages each one covers.
+
+    Agents are created per request, so their HistoryManagers start empty. Sharing
+    this cache between them (it lives on the AgentTemplate) lets a later request of
+    the same conversation, resent by the client or restored from a session, resume
+    the summary instead of summarizing the same turns again.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(digest)
+            if summary is not None:
+                self._entries.move_to_end(digest)
+            return summary
+
+    def put(self, digest: str, summary: str) -> None:
+        with self._lock:
+            self._entries[digest] = summary
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def prefix_digests(messages: Sequence[Dict[str, Any]]) -> List[str]:
+    """Return the digest of every prefix of messages: the i-th covers messages[:i + 1]."""
+    digests = []
+    state = hashlib.sha256()
+    for message in messages:
+        payload = {"role": message["role"], "content": message.get("content") or "", "tool_calls": message.get("tool_calls")}
+        state.update(json.dumps(payload, sort_keys=True, default=str).encode("utf-8"))
+        digests.append(state.copy().hexdigest())
+    return digests
+
+
+class HistoryManager:
+    """
+    Keep the conversation sent to the model within a token budget.
+
+    The leading system messages and the most recent messages are always sent
+    unchanged. When the history is over budget, older observations are elided
+    first; if that is not enough, the oldest turns are folded into a summary.
+    The summary is built incrementally and reused on later turns, so each message
+    is summarized at most once; with a summary_cache, later requests of the same
+    conversation resume it too.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        model: str = "gpt-4o",
+        keep_recent: int = 6,
+        summarizer: Optional[Summarizer] = None,
+        summary_cache: Optional[SummaryCache] = None
+    ):
+        self.token_budget = token_budget
+        self.model = model
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer or extractive_summary
+        self.summary_cache = summary_cache
+        self._summary: Optional[str] = None
+        self._summarized = 0  # number of history messages folded into the summary
+        self._resumed = False  # whether the summary cache was consulted
+
+    def tokens(self, messages: Sequence[Dict[str, Any]]) -> int:
+        if isinstance(messages, Conversation):
+            # Kept as a running total, so each turn only counts the new messages
+            return messages.total(f"tokens:{self.model}", self._message_tokens)
+        return sum(message_tokens(message, self.model) for message in messages)
+
+    def _message_tokens(self, message: Dict[str, Any]) -> int:
+        return message_tokens(message, self.model)
+
+    def fit(self, messages: Sequence[Dict[str, Any]]) -> Sequence[Dict[str, Any]]:
+        """
+        Return the messages to send for this turn, trimmed to the token budget.
+
+        A Conversation is returned unchanged when it fits and as a view of the
+        trimmed messages otherwise, so providers can reuse their conversions.
+        """
+        total = self.tokens(messages)
+        if total <= self.token_budget and not self._summarized:
+            return messages
+
+        system_count = 0
+        while system_count < len(messages) and messages[system_count]["role"] == "system":
+            system_count += 1
+        system, history = messages[:system_count], messages[system_count:]
+
+        # Never split a tool result from the assistant message that requested it
+        recent_start = max(0, len(history) - self.keep_recent)
+        while recent_start > 0 and history[recent_start]["role"] == "tool":
+            recent_start -= 1
+        older, recent = history[:recent_start], history[recent_start:]
+        if not self._resumed:
+            self._resume(older)
+
+        # Turns that were summarized earlier stay summarized
+        older = older[self._summarized:]
+        older = [elide_observation(message) if is_observation(message) else message for message in older]
+        fitted = system + self._summary_messages() + older + recent
+        total = self.tokens(fitted)
+        if total <= self.token_budget:
+            return self._view(messages, fitted)
+
+        # Fold the oldest turns into the summary until the rest fits
+        fold = 0
+        while fold < len(older) and total > self.token_budget:
+            total -= message_tokens(older[fold], self.model)
+            fold += 1
+        while fold < len(older) and older[fold]["role"] == "tool":
+            fold += 1
+        if fold:
+            self._summary = self.summarizer(self._summary, history[self._summarized:self._summarized + fold])
+            self._summarized += fold
+            if self.summary_cache is not None:
+                self.summary_cache.put(prefix_digests(history[:self._summarized])[-1], self._summary)
+            logger.info("Summarized %d older messages (%d total) to fit the %d token budget", fold, self._summarized, self.token_budget)
+
+        fitted = system + self._summary_messages() + older[fold:] + recent
+        if self.tokens(fitted) > self.token_budget:
+            logger.warning(f"Conversation exceeds the {self.token_budget} token budget even after trimming")
+        return self._view(messages, fitted)
+
+    def _resume(self, older: Sequence[Dict[str, Any]]) -> None:
+        """Pick up the longest cached summary of a prefix of the older messages, once per manager."""
+        self._resumed = True
+        if self.summary_cache is None or self._summarized or not older:
+            return
+        for covered, digest in reversed(list(enumerate(prefix_digests(older), start=1))):
+            summary = self.summary_cache.get(digest)
+            if summary is not None:
+                self._summary, self._summarized = summary, covered
+                logger.info("Resumed the summary of %d earlier messages", covered)
+                return
+
+    def _view(self, messages: Sequence[Dict[str, Any]], fitted: List[Dict[str, Any]]) -> Sequence[Dict[str, Any]]:
+        return messages.view(fitted) if isinstance(messages, Conversation) else fitted
+
+    def _summary_messages(self) -> List[Dict[str, Any]]:
+        if not self._summary:
+            return []
+        return [{
+            "role": "user",
+            "content": f"[Summary of the earlier conversation]\n{self._summary}"
+        }]
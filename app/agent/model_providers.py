@@ -1,59 +1,733 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from openai import OpenAI
-import anthropic
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait as futures_wait
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Callable, Deque
+import asyncio
+import contextvars
+import functools
+import json
+import logging
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from .agent_schemas import Action, ModelResponse, ToolCall, Usage
+from . import telemetry
+from .admission import get_admission_controller
+from .conversation import to_wire
+from .deadline import current_deadline
+from .registry import get_provider_registry, register_model_provider
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+class UsageStats:
+    """Running totals of the token usage reported by a provider"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cache_creation_tokens = 0
+
+    def add(self, usage: Usage) -> None:
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cached_tokens += usage.cached_tokens
+            self.cache_creation_tokens += usage.cache_creation_tokens
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_creation_tokens": self.cache_creation_tokens,
+                "cache_hit_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
 
 class ModelProvider(ABC):
     """Abstract base class for different LLM providers"""
     
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+        self.usage_stats = UsageStats()
+        self.admission = get_admission_controller(self.name, model)
+
+    def _estimate_prompt_tokens(self, request: Dict[str, Any]) -> int:
+        """Roughly estimate a request's prompt tokens for the TPM budget"""
+        payload = [request.get("system"), request.get("messages"), request.get("tools")]
+        return len(json.dumps(payload, default=str)) // 4
+
+    def _with_deadline(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Bound a request's timeout by the remaining budget of the current request deadline"""
+        deadline = current_deadline()
+        if deadline is None:
+            return request
+        deadline.check()
+        return {**request, "timeout": deadline.timeout(request.get("timeout"))}
+
+    def _call(self, create: Callable[..., Any], /, **request: Any) -> Any:
+        """Send an API request through the provider's admission controller"""
+        return self.admission.call(lambda: create(**self._with_deadline(request)), self._estimate_prompt_tokens(request))
+
+    async def _acall(self, create: Callable[..., Any], /, **request: Any) -> Any:
+        """Send an async API request through the provider's admission controller"""
+        return await self.admission.acall(lambda: create(**self._with_deadline(request)), self._estimate_prompt_tokens(request))
+
+    async def _aopen_stream(self, create: Callable[..., Any], /, **request: Any) -> Any:
+        """
+        Open a stream through the admission controller.
+
+        The stream keeps its concurrency slot until it is consumed; the caller must
+        call self.admission.release() once the stream is closed.
+        """
+        return await self.admission.acall(
+            lambda: create(**self._with_deadline(request)), self._estimate_prompt_tokens(request), hold=True
+        )
+
+    def record_usage(self, usage: Optional[Usage]) -> None:
+        """Record the token usage reported for a model call, including prompt-cache hits"""
+        if usage is None:
+            return
+        self.usage_stats.add(usage)
+        telemetry.record_usage(self.name, self.model, usage)
+        logger.info(
+            f"{type(self).__name__} usage for {self.model}: prompt={usage.prompt_tokens} "
+            f"(cached={usage.cached_tokens}, cache_write={usage.cache_creation_tokens}) "
+            f"completion={usage.completion_tokens}"
+        )
+
     @abstractmethod
     def generate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
         """Generate a response from the model given a list of messages"""
         pass
 
+    @abstractmethod
+    async def agenerate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        """Asynchronously generate a response from the model given a list of messages"""
+        pass
+
+    async def astream_response(self, messages: List[Dict[str, Any]], temperature: float) -> AsyncIterator[str]:
+        """
+        Stream the model's response as text deltas.
+
+        Closing the iterator early cancels the rest of the generation. Providers
+        without native streaming yield the full response as a single chunk.
+        """
+        yield await self.agenerate_response(messages, temperature)
+
+    def generate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        """Generate a response that may contain structured tool calls for the given actions"""
+        raise NotImplementedError(f"{type(self).__name__} does not support native tool calling")
+
+    async def agenerate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        """Asynchronously generate a response that may contain structured tool calls for the given actions"""
+        raise NotImplementedError(f"{type(self).__name__} does not support native tool calling")
+
+    async def aclose(self) -> None:
+        """Release any pooled connections held by the provider's clients"""
+        pass
+
 class OpenAIProvider(ModelProvider):
     """OpenAI model provider implementation"""
     
+    name = "openai"
+
     def __init__(self, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = model
+        super().__init__(model)
+        # The SDK is imported with the first provider, keeping it out of application startup
+        from openai import OpenAI, AsyncOpenAI
+        api_key = os.getenv("OPENAI_API_KEY")
+        # Retries are handled by the admission controller
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def aclose(self) -> None:
+        self.client.close()
+        await self.async_client.close()
+
+    def _convert_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert one message to OpenAI format, including tool calls and tool results"""
+        if msg["role"] == "tool":
+            return {
+                "role": "tool",
+                "tool_call_id": msg["tool_call_id"],
+                "content": msg["content"]
+            }
+        if msg.get("tool_calls"):
+            return {
+                "role": "assistant",
+                "content": msg["content"] or None,
+                "tool_calls": [
+                    {
+                        "id": call["id"],
+                        "type": "function",
+                        "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+                    }
+                    for call in msg["tool_calls"]
+                ]
+            }
+        if len(msg) == 2:
+            # Compact history messages are already in OpenAI format
+            return msg
+        return {"role": msg["role"], "content": msg["content"]}
+
+    def _convert_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Convert messages to OpenAI format, reusing the conversions of earlier turns of a Conversation"""
+        return to_wire(messages, self.name, self._convert_message)
+
+    def _convert_tools(self, tools: List[Action]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": action.name,
+                    "description": action.description,
+                    "parameters": action.to_json_schema()
+                }
+            }
+            for action in tools
+        ]
+
+    def _parse_tool_completion(self, completion) -> ModelResponse:
+        message = completion.choices[0].message
+        tool_calls = []
+        for call in message.tool_calls or []:
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                # Hand malformed arguments to the handler as-is rather than failing the turn
+                arguments = {"input": call.function.arguments}
+            tool_calls.append(ToolCall(id=call.id, name=call.function.name, arguments=arguments))
+        return ModelResponse(content=message.content or "", tool_calls=tool_calls, usage=self._parse_usage(completion.usage))
+
+    def _parse_usage(self, usage) -> Optional[Usage]:
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Usage(
+            prompt_tokens=usage.prompt_tokens or 0,
+            completion_tokens=usage.completion_tokens or 0,
+            cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0
+        )
     
     def generate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
-        completion = self.client.chat.completions.create(
+        completion = self._call(
+            self.client.chat.completions.create,
             model=self.model,
-            messages=messages,
+            messages=self._convert_messages(messages),
             temperature=temperature
         )
+        self.record_usage(self._parse_usage(completion.usage))
         return completion.choices[0].message.content
 
+    async def agenerate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        completion = await self._acall(
+            self.async_client.chat.completions.create,
+            model=self.model,
+            messages=self._convert_messages(messages),
+            temperature=temperature
+        )
+        self.record_usage(self._parse_usage(completion.usage))
+        return completion.choices[0].message.content
+
+    def generate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        completion = self._call(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=self._convert_messages(messages),
+            temperature=temperature,
+            tools=self._convert_tools(tools)
+        )
+        response = self._parse_tool_completion(completion)
+        self.record_usage(response.usage)
+        return response
+
+    async def agenerate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        completion = await self._acall(
+            self.async_client.chat.completions.create,
+            model=self.model,
+            messages=self._convert_messages(messages),
+            temperature=temperature,
+            tools=self._convert_tools(tools)
+        )
+        response = self._parse_tool_completion(completion)
+        self.record_usage(response.usage)
+        return response
+
+    async def astream_response(self, messages: List[Dict[str, Any]], temperature: float) -> AsyncIterator[str]:
+        stream = await self._aopen_stream(
+            self.async_client.chat.completions.create,
+            model=self.model,
+            messages=self._convert_messages(messages),
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage:
+                    self.record_usage(self._parse_usage(chunk.usage))
+        finally:
+            # Closing the HTTP response stops the generation server-side
+            await stream.close()
+            self.admission.release()
+
+def _is_tool_result(message: Dict[str, Any]) -> bool:
+    content = message["content"]
+    return message["role"] == "user" and type(content) is list and content[0]["type"] == "tool_result"
+
+
 class AnthropicProvider(ModelProvider):
     """Anthropic model provider implementation"""
     
-    def __init__(self, model: str = "claude-3-sonnet-20240229"):
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.model = model
+    name = "anthropic"
+
+    def __init__(self, model: str = "claude-3-sonnet-20240229", max_tokens: int = 4096, prompt_caching: bool = True):
+        super().__init__(model)
+        # The SDK is imported with the first provider, keeping it out of application startup
+        import anthropic
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        # Retries are handled by the admission controller
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+        self._not_given = anthropic.NOT_GIVEN
+        self.max_tokens = max_tokens
+        self.prompt_caching = prompt_caching
+
+    async def aclose(self) -> None:
+        self.client.close()
+        await self.async_client.close()
+
+    def _convert_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert one message to Anthropic format.
+
+        System messages become {"role": "system", "content": [text block]} and are
+        moved to the system prompt by _convert_messages.
+        """
+        if msg["role"] == "system":
+            return {"role": "system", "content": [{"type": "text", "text": msg["content"]}]}
+        if msg["role"] == "tool":
+            # Tool results go back as tool_result blocks in a user message
+            return {
+                "role": "user",
+                "content": [{"type": "tool_result", "tool_use_id": msg["tool_call_id"], "content": msg["content"]}]
+            }
+        if msg.get("tool_calls"):
+            content = [{"type": "text", "text": msg["content"]}] if msg["content"] else []
+            content.extend(
+                {"type": "tool_use", "id": call["id"], "name": call["name"], "input": call["arguments"]}
+                for call in msg["tool_calls"]
+            )
+            return {"role": "assistant", "content": content}
+        if len(msg) == 2:
+            # Compact history messages are already in Anthropic format
+            return msg
+        return {"role": msg["role"], "content": msg["content"]}
+
+    def _convert_messages(self, messages: List[Dict[str, Any]]) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        Convert messages to Anthropic format, returning the system prompt separately.
+
+        Converted messages are reused from earlier turns of a Conversation and are
+        never modified here; merged tool results and cache breakpoints use copies.
+        With prompt caching enabled, cache_control breakpoints are placed after the
+        first system block (the shared, static prompt) and after the latest message,
+        so both the prompt and the conversation so far are reused on the next turn.
+        """
+        system_prompt = []
+        anthropic_messages = []
+        for wire in to_wire(messages, self.name, self._convert_message):
+            if wire["role"] == "system":
+                system_prompt.extend(wire["content"])
+                continue
+            if _is_tool_result(wire) and anthropic_messages and _is_tool_result(anthropic_messages[-1]):
+                previous = anthropic_messages[-1]
+                # Results of one turn's tool calls share a single user message
+                anthropic_messages[-1] = {"role": "user", "content": previous["content"] + wire["content"]}
+            else:
+                anthropic_messages.append(wire)
+
+        if self.prompt_caching and system_prompt:
+            system_prompt[0] = {**system_prompt[0], "cache_control": {"type": "ephemeral"}}
+        if self.prompt_caching and anthropic_messages:
+            last = anthropic_messages[-1]
+            content = last["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            if content:
+                content = content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+            anthropic_messages[-1] = {**last, "content": content}
+        return system_prompt or self._not_given, anthropic_messages
+
+    def _convert_tools(self, tools: List[Action]) -> List[Dict[str, Any]]:
+        return [
+            {"name": action.name, "description": action.description, "input_schema": action.to_json_schema()}
+            for action in tools
+        ]
+
+    def _parse_tool_completion(self, completion) -> ModelResponse:
+        text = []
+        tool_calls = []
+        for block in completion.content:
+            if block.type == "text":
+                text.append(block.text)
+            elif block.type == "tool_use":
+                tool_calls.append(ToolCall(id=block.id, name=block.name, arguments=block.input or {}))
+        return ModelResponse(content="".join(text), tool_calls=tool_calls, usage=self._parse_usage(completion.usage))
+
+    def _parse_usage(self, usage) -> Optional[Usage]:
+        if usage is None:
+            return None
+        cached_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_creation_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+        # Anthropic reports uncached input separately from cache reads and writes
+        return Usage(
+            prompt_tokens=(usage.input_tokens or 0) + cached_tokens + cache_creation_tokens,
+            completion_tokens=usage.output_tokens or 0,
+            cached_tokens=cached_tokens,
+            cache_creation_tokens=cache_creation_tokens
+        )
     
     def generate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
-        # Convert messages to Anthropic format
-        system_prompt = next((msg["content"] for msg in messages if msg["role"] == "system"), None)
-        
-        # Build the messages for Anthropic
-        anthropic_messages = []
-        for msg in messages:
-            if msg["role"] != "system":  # System message is handled separately
-                anthropic_messages.append({
-                    "role": "user" if msg["role"] == "user" else "assistant",
-                    "content": msg["content"]
-                })
+        system_prompt, anthropic_messages = self._convert_messages(messages)
         
-        completion = self.client.messages.create(
+        completion = self._call(
+            self.client.messages.create,
             model=self.model,
             messages=anthropic_messages,
             system=system_prompt,
-            temperature=temperature
+            temperature=temperature,
+            max_tokens=self.max_tokens
         )
-        return completion.content[0].text 
\ No newline at end of file
+        self.record_usage(self._parse_usage(completion.usage))
+        return completion.content[0].text
+
+    def generate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        system_prompt, anthropic_messages = self._convert_messages(messages)
+
+        completion = self._call(
+            self.client.messages.create,
+            model=self.model,
+            messages=anthropic_messages,
+            system=system_prompt,
+            temperature=temperature,
+            max_tokens=self.max_tokens,
+            tools=self._convert_tools(tools)
+        )
+        response = self._parse_tool_completion(completion)
+        self.record_usage(response.usage)
+        return response
+
+    async def agenerate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        system_prompt, anthropic_messages = self._convert_messages(messages)
+
+        completion = await self._acall(
+            self.async_client.messages.create,
+            model=self.model,
+            messages=anthropic_messages,
+            system=system_prompt,
+            temperature=temperature,
+            max_tokens=self.max_tokens,
+            tools=self._convert_tools(tools)
+        )
+        response = self._parse_tool_completion(completion)
+        self.record_usage(response.usage)
+        return response
+
+    async def agenerate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        system_prompt, anthropic_messages = self._convert_messages(messages)
+
+        completion = await self._acall(
+            self.async_client.messages.create,
+            model=self.model,
+            messages=anthropic_messages,
+            system=system_prompt,
+            temperature=temperature,
+            max_tokens=self.max_tokens
+        )
+        self.record_usage(self._parse_usage(completion.usage))
+        return completion.content[0].text
+
+    async def astream_response(self, messages: List[Dict[str, Any]], temperature: float) -> AsyncIterator[str]:
+        system_prompt, anthropic_messages = self._convert_messages(messages)
+
+        stream = await self._aopen_stream(
+            lambda **request: self.async_client.messages.stream(**request).__aenter__(),
+            model=self.model,
+            messages=anthropic_messages,
+            system=system_prompt,
+            temperature=temperature,
+            max_tokens=self.max_tokens
+        )
+        try:
+            async for text in stream.text_stream:
+                yield text
+            self.record_usage(self._parse_usage((await stream.get_final_message()).usage))
+        finally:
+            await stream.close()
+            self.admission.release()
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies for one backend"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the q-quantile of the window, or None until min_samples are recorded"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgedProvider(ModelProvider):
+    """
+    Composite provider that hedges slow calls across an ordered list of backends.
+
+    Each call goes to the first backend. If it has not answered within that
+    backend's adaptive threshold (the hedge_quantile of its recent latencies,
+    clamped to [min_hedge_delay, max_hedge_delay]), the call is also sent to the
+    next backend and whichever answers first wins; the others are cancelled.
+    If a backend fails, the next one is tried right away. Streams are hedged on
+    the time to their first chunk and cannot fail over once text was produced.
+
+    Every successful attempt's latency feeds its backend's threshold, including
+    those of losing calls; a losing call that is cancelled counts with the time
+    it had run, a lower bound, so slow backends are not judged only by their wins.
+    """
+
+    name = "hedged"
+
+    def __init__(
+        self,
+        backends: List[ModelProvider],
+        hedge_quantile: float = 0.95,
+        min_hedge_delay: float = 0.25,
+        max_hedge_delay: float = 30.0,
+        default_hedge_delay: float = 5.0
+    ):
+        if not backends:
+            raise ValueError("HedgedProvider needs at least one backend")
+        super().__init__("+".join(f"{backend.name}:{backend.model}" for backend in backends))
+        self.backends = list(backends)
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.latencies = {id(backend): LatencyTracker() for backend in self.backends}
+        self.first_chunk_latencies = {id(backend): LatencyTracker() for backend in self.backends}
+
+    def _trackers(self, stream: bool) -> Dict[int, LatencyTracker]:
+        return self.first_chunk_latencies if stream else self.latencies
+
+    def _hedge_delay(self, backend: ModelProvider, stream: bool = False) -> float:
+        threshold = self._trackers(stream)[id(backend)].quantile(self.hedge_quantile)
+        if threshold is None:
+            threshold = self.default_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, threshold))
+
+    def _observe(self, backend: ModelProvider, seconds: float, stream: bool = False, cancelled: bool = False) -> None:
+        """Record an attempt's latency; a cancelled attempt's seconds is only how long it ran, so it is not exported."""
+        self._trackers(stream)[id(backend)].observe(seconds)
+        if not cancelled:
+            telemetry.record_backend_latency(backend.name, backend.model, "first_chunk" if stream else "complete", seconds)
+
+    async def _ahedge(self, call: Callable[[ModelProvider], Awaitable[Any]], stream: bool = False) -> Any:
+        """Run call against the backends with hedging and failover, returning the first success"""
+        waiting = deque(self.backends)
+        running: Dict[asyncio.Task, Tuple[ModelProvider, float]] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch(reason: Optional[str]) -> ModelProvider:
+            backend = waiting.popleft()
+            if reason:
+                logger.info("Sending %s request to %s:%s", reason, backend.name, backend.model)
+                telemetry.record_hedge(backend.name, backend.model, reason)
+            running[asyncio.ensure_future(call(backend))] = (backend, time.perf_counter())
+            return backend
+
+        newest = launch(None)
+        try:
+            while running:
+                timeout = self._hedge_delay(newest, stream) if waiting else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    newest = launch("hedge")
+                    continue
+                for task in done:
+                    backend, started = running.pop(task)
+                    if task.exception() is None:
+                        self._observe(backend, time.perf_counter() - started, stream)
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"{backend.name}:{backend.model} failed: {str(last_error)}")
+                if waiting:
+                    newest = launch("failover")
+            raise last_error
+        finally:
+            # Cancel the losing calls and wait until they have let go of their connections
+            now = time.perf_counter()
+            for task, (backend, started) in running.items():
+                if not task.done():
+                    self._observe(backend, now - started, stream, cancelled=True)
+                elif not task.cancelled() and task.exception() is None:
+                    self._observe(backend, now - started, stream)  # finished alongside the winner
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def _hedge(self, call: Callable[[ModelProvider], Any]) -> Any:
+        """Blocking version of _ahedge; losing calls cannot be interrupted and finish in the background"""
+        waiting = deque(self.backends)
+        running: Dict[Future, Tuple[ModelProvider, float]] = {}
+        last_error: Optional[BaseException] = None
+        executor = _get_hedge_executor()
+
+        def launch(reason: Optional[str]) -> ModelProvider:
+            backend = waiting.popleft()
+            if reason:
+                logger.info("Sending %s request to %s:%s", reason, backend.name, backend.model)
+                telemetry.record_hedge(backend.name, backend.model, reason)
+            # Run in a copy of the caller's context so the request deadline reaches the backend
+            running[executor.submit(contextvars.copy_context().run, call, backend)] = (backend, time.perf_counter())
+            return backend
+
+        newest = launch(None)
+        while running:
+            timeout = self._hedge_delay(newest) if waiting else None
+            done, _ = futures_wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                newest = launch("hedge")
+                continue
+            for future in done:
+                backend, started = running.pop(future)
+                if future.exception() is None:
+                    self._observe(backend, time.perf_counter() - started)
+                    for other, (other_backend, other_started) in running.items():
+                        # Losers that already started run to completion; their latency still counts
+                        if not other.cancel():
+                            other.add_done_callback(functools.partial(self._observe_loser, other_backend, other_started))
+                    return future.result()
+                last_error = future.exception()
+                logger.warning(f"{backend.name}:{backend.model} failed: {str(last_error)}")
+            if waiting:
+                newest = launch("failover")
+        raise last_error
+
+    def _observe_loser(self, backend: ModelProvider, started: float, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._observe(backend, time.perf_counter() - started)
+
+    def generate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        return self._hedge(lambda backend: backend.generate_response(messages, temperature))
+
+    async def agenerate_response(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        return await self._ahedge(lambda backend: backend.agenerate_response(messages, temperature))
+
+    def generate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        return self._hedge(lambda backend: backend.generate_with_tools(messages, temperature, tools))
+
+    async def agenerate_with_tools(self, messages: List[Dict[str, Any]], temperature: float, tools: List[Action]) -> ModelResponse:
+        return await self._ahedge(lambda backend: backend.agenerate_with_tools(messages, temperature, tools))
+
+    async def astream_response(self, messages: List[Dict[str, Any]], temperature: float) -> AsyncIterator[str]:
+        opened: List[AsyncIterator[str]] = []
+
+        async def first_chunk(backend: ModelProvider) -> Tuple[AsyncIterator[str], str]:
+            stream = backend.astream_response(messages, temperature)
+            opened.append(stream)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, ""
+
+        stream, chunk = await self._ahedge(first_chunk, stream=True)
+        # Close the streams that lost the race
+        for other in opened:
+            if other is not stream:
+                await other.aclose()
+        try:
+            if chunk:
+                yield chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+register_model_provider(OpenAIProvider.name, OpenAIProvider)
+register_model_provider(AnthropicProvider.name, AnthropicProvider)
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("HEDGE_EXECUTOR_MAX_WORKERS", "32")),
+            thread_name_prefix="model-hedge"
+        )
+    return _hedge_executor
+
+
+# Providers are shared process-wide so every request reuses the same keep-alive
+# connection pools instead of paying for new clients and TLS handshakes.
+_provider_cache: Dict[Tuple[str, str], ModelProvider] = {}
+
+def get_model_provider(provider: str, model: str) -> ModelProvider:
+    """Return the shared provider instance for a provider name and model."""
+    key = (provider, model)
+    if key not in _provider_cache:
+        # Resolved through the registry, so third-party providers are imported on first use
+        provider_class = get_provider_registry().get(provider)
+        _provider_cache[key] = provider_class(model=model)
+    return _provider_cache[key]
+
+_hedged_cache: Dict[Tuple[Tuple[str, str], ...], HedgedProvider] = {}
+
+def get_hedged_provider(backends: List[Tuple[str, str]], **options: Any) -> ModelProvider:
+    """
+    Return the shared hedged provider for an ordered list of (provider, model) pairs.
+
+    A single pair returns the plain provider. Options are passed to HedgedProvider
+    when it is first created.
+    """
+    key = tuple(backends)
+    if len(key) == 1:
+        return get_model_provider(*key[0])
+    if key not in _hedged_cache:
+        _hedged_cache[key] = HedgedProvider([get_model_provider(*backend) for backend in key], **options)
+    return _hedged_cache[key]
+
+async def aclose_model_providers() -> None:
+    """Close and forget all shared providers, e.g. on application shutdown."""
+    providers = list(_provider_cache.values())
+    _provider_cache.clear()
+    # Hedged providers share the cached backends, which are closed above
+    _hedged_cache.clear()
+    for provider in providers:
+        await provider.aclose()
+    global _hedge_executor
+    if _hedge_executor is not None:
+        # Losing hedged calls are abandoned rather than awaited
+        _hedge_executor.shutdown(wait=False, cancel_futures=True)
+        _hedge_executor = None
@@ -0,0 +1,242 @@
+from collections import Counter, OrderedDict
+from typing import Any, List, NamedTuple, Optional, Sequence
+import logging
+import math
+import re
+
+from .agent_schemas import Action
+from .history import count_tokens
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters, the usual defaults for short passages
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Passages whose word 3-gram sets overlap at least this much count as near-duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# The action that returns the full result of a trimmed observation by its reference
+EXPAND_ACTION = "expand_result"
+
+_term_re = re.compile(r"\w+")
+_url_re = re.compile(r"\w+://\S+")
+
+
+def terms(text: str) -> List[str]:
+    """Split text into lowercase word terms."""
+    return _term_re.findall(text.lower())
+
+
+def split_passages(text: str) -> List[str]:
+    """Split an action result into passages at blank lines, e.g. one per search result."""
+    return [passage.strip() for passage in re.split(r"\n\s*\n", text) if passage.strip()]
+
+
+def bm25_scores(query: str, passages: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> List[float]:
+    """
+    Score passages against a query with Okapi BM25, using the passages as the corpus.
+
+    Args:
+        query: The text to rank against, e.g. the action input
+        passages: The passages to score
+        k1: Term frequency saturation
+        b: Length normalization
+
+    Returns:
+        One score per passage, higher is more relevant
+    """
+    documents = [Counter(terms(passage)) for passage in passages]
+    lengths = [sum(document.values()) for document in documents]
+    average_length = sum(lengths) / len(lengths) if lengths else 0.0
+    frequencies = Counter(term for document in documents for term in document)
+    query_terms = set(terms(query))
+
+    scores = []
+    for document, length in zip(documents, lengths):
+        score = 0.0
+        norm = k1 * (1 - b + b * length / average_length) if average_length else k1
+        for term in query_terms:
+            count = document.get(term)
+            if count:
+                idf = math.log(1 + (len(documents) - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+                score += idf * count * (k1 + 1) / (count + norm)
+        scores.append(score)
+    return scores
+
+
+def _shingles(passage: str) -> frozenset:
+    # URLs are ignored, so mirrors of the same page count as duplicates
+    words = terms(_url_re.sub(" ", passage))
+    if len(words) < 3:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + 3]) for i in range(len(words) - 2))
+
+
+def remove_near_duplicates(passages: Sequence[str], threshold: float = DUPLICATE_THRESHOLD) -> List[str]:
+    """Drop passages whose word 3-grams mostly repeat an earlier passage's, keeping the first of each group."""
+    kept: List[str] = []
+    kept_shingles: List[frozenset] = []
+    for passage in passages:
+        shingles = _shingles(passage)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Cut text at a word boundary so that it fits in max_tokens, marking the cut with an ellipsis."""
+    tokens = count_tokens(text, model)
+    while tokens > max_tokens and text:
+        text = text[:int(len(text) * max_tokens / tokens * 0.95)].rsplit(" ", 1)[0]
+        tokens = count_tokens(text + "...", model)
+    return text + "..." if text else ""
+
+
+def _expand_unbound(ref: str) -> str:
+    raise RuntimeError(f"{EXPAND_ACTION} must be bound to an agent's observation store")
+
+
+# The reference at the end of a trim note, which only the agent that trimmed the result can expand
+EXPAND_REF_PATTERN = re.compile(rf"\. Full result: {EXPAND_ACTION} [^\s\]]+\]")
+
+
+def strip_expand_refs(content: str) -> str:
+    """Remove the expand_result references from trim notes, for history that outlives the agent's store."""
+    return EXPAND_REF_PATTERN.sub(".]", content)
+
+
+def create_expand_action() -> Action:
+    """Build the expand_result action; each agent binds it to its own ObservationProcessor."""
+    return Action(
+        name=EXPAND_ACTION,
+        description="Get the full text of an action result that was trimmed, by the reference given in its trim note",
+        parameters={
+            "ref": {
+                "type": "string",
+                "description": "The reference of the trimmed result, e.g. web_search#1"
+            }
+        },
+        returns="The untrimmed action result",
+        example=f"Action: {EXPAND_ACTION}: web_search#1",
+        handler=_expand_unbound
+    )
+
+
+class ObservationStore:
+    """The full results of trimmed observations, kept outside the conversation for later turns of the query to expand."""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._counter = 0
+
+    def put(self, action_name: str, result: str) -> str:
+        """Store a full result and return its reference."""
+        self._counter += 1
+        ref = f"{action_name}#{self._counter}"
+        self._results[ref] = result
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        return ref
+
+    def get(self, ref: str) -> Optional[str]:
+        return self._results.get(ref)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+class ProcessedObservation(NamedTuple):
+    text: str
+    raw_tokens: int
+    kept_tokens: int
+    ref: Optional[str]  # reference of the full result in the store, when it was trimmed
+
+
+class ObservationProcessor:
+    """
+    Shrink action results before they are added to the conversation.
+
+    Results are split into passages, near-duplicate passages are removed and,
+    when the result is over the action's token budget, the passages most
+    relevant to the action input by BM25 are kept until the budget is used.
+    The untrimmed result is kept in the store, and the trim note gives its
+    reference, which the model can pass to the expand_result action.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, model: str = "gpt-4o", store: Optional[ObservationStore] = None):
+        self.token_budget = token_budget
+        self.model = model
+        self.store = store or ObservationStore()
+
+    def process(self, action_name: str, action_input: str, result: Any, token_budget: Optional[int] = None) -> Any:
+        """
+        Return the result to show the model for an action call.
+
+        Args:
+            action_name: Name of the action that produced the result
+            action_input: The action's input, which passages are ranked against
+            result: The handler's return value; only strings are processed
+            token_budget: The action's own budget, overriding the processor's default
+
+        Returns:
+            The processed string, or result unchanged when no budget applies or it is not a string
+        """
+        budget = token_budget or self.token_budget
+        # An expanded result was asked for in full, so it is not trimmed again
+        if budget is None or not isinstance(result, str) or action_name == EXPAND_ACTION:
+            return result
+        processed = self.shrink(action_name, action_input, result, budget)
+        telemetry.record_observation(action_name, processed.raw_tokens, processed.kept_tokens)
+        if processed.ref is not None:
+            logger.info(
+                f"Trimmed {action_name} observation from {processed.raw_tokens} to {processed.kept_tokens} tokens; "
+                f"full result stored as {processed.ref}"
+            )
+        return processed.text
+
+    def expand(self, ref: str) -> str:
+        """The handler of the expand_result action: return the full result stored under ref."""
+        result = self.store.get(ref.strip())
+        if result is None:
+            return f"No stored result {ref.strip()!r}; only the {len(self.store)} most recent trimmed results are kept"
+        return result
+
+    def shrink(self, action_name: str, action_input: str, result: str, budget: int) -> ProcessedObservation:
+        """Deduplicate, rank and cut a result to budget tokens."""
+        raw_tokens = count_tokens(result, self.model)
+        passages = split_passages(result)
+        unique = remove_near_duplicates(passages)
+        if raw_tokens <= budget and len(unique) == len(passages):
+            return ProcessedObservation(result, raw_tokens, raw_tokens, None)
+
+        ref = self.store.put(action_name, result)
+        # Leave room for the note that tells the model the result was shortened
+        available = max(budget // 2, budget - 40)
+        scores = bm25_scores(action_input, unique)
+        ranked = sorted(range(len(unique)), key=lambda index: -scores[index])
+        selected: List[int] = []
+        used = 0
+        for index in ranked:
+            tokens = count_tokens(unique[index], self.model)
+            if used + tokens <= available:
+                selected.append(index)
+                used += tokens
+        # Kept passages stay in their original order, which carries the source's own ranking
+        kept = [unique[index] for index in sorted(selected)]
+        truncated = not kept and bool(ranked)
+        if truncated:
+            kept = [truncate_to_tokens(unique[ranked[0]], available, self.model)]
+
+        notes = []
+        if len(passages) > len(kept):
+            notes.append(f"{len(passages) - len(kept)} of {len(passages)} duplicate or less relevant passages omitted")
+        if truncated:
+            notes.append("shortened")
+        note = f"[Result trimmed to {budget} tokens: {'; '.join(notes)}. Full result: {EXPAND_ACTION} {ref}]"
+        text = "\n\n".join(kept + [note])
+        return ProcessedObservation(text, raw_tokens, count_tokens(text, self.model), ref)
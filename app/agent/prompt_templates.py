@@ -21,10 +21,51 @@ def format_action(action: Action) -> str:
     
     return "\n".join(action_str)
 
+# Instructions for the free-text Thought/Action/Observation protocol
+TEXT_PROTOCOL_INSTRUCTIONS = """=== Thought Process ===
+You must follow these example structures in your responses:
+
+1. Thought: Explain your reasoning about what to do next
+2. Action: Either invoke an action using exactly this format: Action: <action_name>: <parameters>
+   OR if no action is needed, use: Action: none: No action needed
+If several independent actions are needed, put each one on its own Action: line; they will run in parallel.
+If an action is needed, stop your output here and you will be called again with the result of the action.
+3. Observation: Either the result of the action, or "[No action taken]" if no action was needed
+4. Response to Client: Your final response to the human user
+
+Example structure:
+Thought: The user is asking about X, which requires Y action
+Action: Y: <parameters>
+Observation: <result of Y action>
+Response to Client: <final response>
+
+OR when no action is needed:
+Thought: This is a simple greeting that doesn't require any action
+Action: none: No action needed
+Observation: [No action taken]
+Response to Client: Hello! How can I help you today?
+
+Note: the human user will not see your Thought Process. They will only see the text after Response to Client:
+"""
+
+# Instructions for native tool calling, where actions are sent as tool schemas
+TOOL_CALLING_INSTRUCTIONS = """=== Tool Use ===
+Use the provided tools when you need information or need to take an action. You may call
+several tools at once when they are independent. You will be called again with the results.
+When no tool is needed, or once you have what you need, reply with your final response to
+the human user as plain text.
+"""
+
+def current_datetime_note() -> str:
+    """Format the current date and time note included in the system prompt."""
+    return f"Note: The current date and time is {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+
 def create_base_prompt(
     actions: List[Action],
     additional_context: str = "No additional context",
-    examples: Optional[Union[str, List[Union[str, Dict[str, str]]]]] = None
+    examples: Optional[Union[str, List[Union[str, Dict[str, str]]]]] = None,
+    include_datetime: bool = True,
+    tool_calling: bool = False
 ) -> str:
     """
     Create a base system prompt that can be customized.
@@ -33,6 +74,10 @@ def create_base_prompt(
         actions: List of available actions the agent can perform
         context: Additional context about the agent's role and capabilities
         examples: Optional examples as either a multiline string, list of example dictionaries, or list of example strings
+        include_datetime: Whether to end the prompt with the current date and time. Disable this
+            when the prompt is rendered once and reused, and send current_datetime_note() per request.
+        tool_calling: Whether actions are sent to the model as native tool schemas. The text
+            protocol, action listing and examples are then left out of the prompt.
         
     Returns:
         A formatted system prompt combining all components
@@ -44,38 +89,14 @@ You are an AI agent designed to interact with human users and invoke actions whe
 2. Invoke available actions if necessary 
 3. Provide a response to the human user
 
-Note: The current date and time is {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 Additional Context: {additional_context}
 
-=== Thought Process ===
-You must follow these example structures in your responses:
-
-1. Thought: Explain your reasoning about what to do next
-2. Action: Either invoke an action using exactly this format: Action: <action_name>: <parameters>
-   OR if no action is needed, use: Action: none: No action needed
-If an action is needed, stop your output here and you will be called again with the result of the action.
-3. Observation: Either the result of the action, or "[No action taken]" if no action was needed
-4. Response to Client: Your final response to the human user
-
-Example structure:
-Thought: The user is asking about X, which requires Y action
-Action: Y: <parameters>
-Observation: <result of Y action>
-Response to Client: <final response>
-
-OR when no action is needed:
-Thought: This is a simple greeting that doesn't require any action
-Action: none: No action needed
-Observation: [No action taken]
-Response to Client: Hello! How can I help you today?
-
-Note: the human user will not see your Thought Process. They will only see the text after Response to Client:
-"""
+""" + (TOOL_CALLING_INSTRUCTIONS if tool_calling else TEXT_PROTOCOL_INSTRUCTIONS)
 
     # Convert base prompt to list of lines
     prompt_sections = base_prompt.split('\n')
 
-    if actions:
+    if actions and not tool_calling:
         # Add available actions section
         prompt_sections.extend([
             "",
@@ -86,7 +107,7 @@ Note: the human user will not see your Thought Process. They will only see the t
         ])
 
     # Add examples if provided
-    if examples:
+    if examples and not tool_calling:
         prompt_sections.extend([
             "",
             "=== Examples of Full Flow ===",
@@ -112,6 +133,11 @@ Note: the human user will not see your Thought Process. They will only see the t
         
         prompt_sections.append("")
 
+    # Volatile data goes last so that everything above is a byte-identical prefix
+    # that the providers' prompt caches can reuse across requests
+    if include_datetime:
+        prompt_sections.append(current_datetime_note())
+
     # Combine all sections, filtering out empty strings
     return "\n".join(section for section in prompt_sections if section)
 
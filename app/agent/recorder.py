@@ -0,0 +1,190 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional
+import asyncio
+import logging
+import threading
+import time
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Kinds of conversation records
+USER = "user"  # the user's message
+MODEL = "model"  # a model turn, as generated
+ACTION = "action"  # an action or tool call the agent ran
+OBSERVATION = "observation"  # the result the model was shown
+TIMING = "timing"  # a whole query's latency and outcome
+
+
+class TurnRecord(NamedTuple):
+    conversation_id: str
+    user_id: Optional[str]
+    kind: str
+    content: str
+    data: Dict[str, Any]  # JSON-serializable details, e.g. the action name or the latency
+    created_at: float  # Unix time
+
+
+class TurnStore(ABC):
+    """Where conversation records are persisted, written in batches by a TurnRecorder."""
+
+    @abstractmethod
+    def write(self, records: List[TurnRecord]) -> None:
+        """Persist a batch of records; raise on failure"""
+        pass
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+        pass
+
+
+class TurnRecorder:
+    """
+    Write-behind persistence of conversation turns.
+
+    Agents hand records to record(), which only appends them to an in-memory
+    buffer; a background thread writes the buffer to the store in batches of up
+    to batch_size, whenever a batch is full or flush_interval seconds after the
+    oldest pending record. Persistence therefore adds no database round-trips to
+    model turns.
+
+    Backpressure is applied between queries: once max_pending records are waiting,
+    wait_for_capacity (or await_capacity) holds new queries back until the writer
+    catches up, for up to max_wait seconds. Records of queries already running are
+    still accepted, up to twice max_pending, beyond which they are dropped and
+    counted. Batches that fail to write are retried up to max_retries times.
+    close() writes everything still buffered.
+
+    Args:
+        store: The storage backend
+        batch_size: Most records written per batch
+        flush_interval: Longest a record waits before its batch is written, in seconds
+        max_pending: Buffered records above which new queries wait
+        max_wait: Longest a query waits for capacity before it runs anyway, in seconds
+        max_retries: Attempts to write a failing batch again before dropping it
+    """
+
+    def __init__(
+        self,
+        store: TurnStore,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        max_wait: float = 5.0,
+        max_retries: int = 3
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self._buffer: List[TurnRecord] = []
+        self._writing = 0  # records taken from the buffer but not yet written
+        self._closed = False
+        self._urgent = False  # write batches back to back until the buffer is empty
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="turn-recorder", daemon=True)
+        self._thread.start()
+
+    def record(
+        self,
+        conversation_id: str,
+        kind: str,
+        content: str = "",
+        data: Optional[Dict[str, Any]] = None,
+        user_id: Optional[Any] = None
+    ) -> bool:
+        """Buffer a record without blocking. Returns False if it was dropped because the buffer is full or closed."""
+        record = TurnRecord(conversation_id, str(user_id) if user_id is not None else None, kind, content, data or {}, time.time())
+        with self._condition:
+            if self._closed or len(self._buffer) >= 2 * self.max_pending:
+                telemetry.record_turn_records("dropped")
+                return False
+            self._buffer.append(record)
+            # Wake the writer to start the flush interval, or to write a full batch
+            if len(self._buffer) in (1, self.batch_size):
+                self._condition.notify_all()
+        return True
+
+    @property
+    def pending(self) -> int:
+        """Records buffered or being written."""
+        with self._condition:
+            return len(self._buffer) + self._writing
+
+    def wait_for_capacity(self) -> float:
+        """Block while max_pending records are buffered, for up to max_wait seconds. Returns the time waited."""
+        start = time.perf_counter()
+        with self._condition:
+            if len(self._buffer) < self.max_pending:
+                return 0.0
+            self._urgent = True
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: len(self._buffer) < self.max_pending or self._closed, self.max_wait)
+        waited = time.perf_counter() - start
+        telemetry.record_recorder_wait(waited)
+        logger.warning(f"Query waited {waited:.3f}s for the turn recorder to catch up")
+        return waited
+
+    async def await_capacity(self) -> float:
+        """wait_for_capacity without blocking the event loop; queries only leave the loop when the buffer is full."""
+        with self._condition:
+            full = len(self._buffer) >= self.max_pending
+        return await asyncio.to_thread(self.wait_for_capacity) if full else 0.0
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything buffered now and wait until it is written. Returns False on timeout."""
+        with self._condition:
+            self._urgent = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and not self._writing, timeout)
+
+    def _next_batch(self) -> Optional[List[TurnRecord]]:
+        """Wait until a batch is due and take it from the buffer; None once closed and drained."""
+        with self._condition:
+            while not (len(self._buffer) >= self.batch_size or (self._buffer and (self._closed or self._urgent))):
+                if not self._buffer:
+                    if self._closed:
+                        return None
+                    self._urgent = False
+                    self._condition.wait()
+                    continue
+                remaining = self._buffer[0].created_at + self.flush_interval - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            self._writing = len(batch)
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            self._write(batch)
+            with self._condition:
+                self._writing = 0
+                self._condition.notify_all()
+
+    def _write(self, batch: List[TurnRecord]) -> None:
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.store.write(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} conversation records (attempt {attempt + 1}): {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(min(2.0, 0.1 * 2 ** attempt))
+                continue
+            telemetry.record_turn_flush(time.perf_counter() - start)
+            telemetry.record_turn_records("written", len(batch))
+            return
+        telemetry.record_turn_records("failed", len(batch))
+
+    def close(self) -> None:
+        """Stop accepting records, write everything buffered and close the store."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.store.close()
@@ -0,0 +1,127 @@
+from importlib import import_module
+from importlib.metadata import EntryPoint, entry_points
+from typing import Any, Callable, Dict, Generic, List, TypeVar, Union
+import logging
+import threading
+
+from .agent_schemas import Action
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Entry point groups through which installed packages add providers and actions, e.g.
+#   [project.entry-points."agent.model_providers"]
+#   mistral = "agent_mistral:MistralProvider"
+PROVIDER_ENTRY_POINT_GROUP = "agent.model_providers"
+ACTION_ENTRY_POINT_GROUP = "agent.actions"
+
+
+class Registry(Generic[T]):
+    """
+    Named plugins that are imported only when first looked up.
+
+    Targets are registered as objects or as "module:attribute" strings. Installed
+    packages can add more through an entry point group, which is only scanned
+    when a name is not registered, so neither plugin modules nor the SDKs they
+    wrap are imported at startup.
+    """
+
+    def __init__(self, kind: str, group: str):
+        self.kind = kind
+        self.group = group
+        self._targets: Dict[str, Union[T, str, EntryPoint]] = {}
+        self._loaded: Dict[str, T] = {}
+        self._discovered = False
+        self._lock = threading.Lock()
+
+    def register(self, name: str, target: Union[T, str]) -> None:
+        """
+        Register a plugin, replacing any earlier one of the same name.
+
+        Args:
+            name: Name the plugin is looked up by
+            target: The plugin itself or a "module:attribute" path to import on first use
+        """
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+
+    def names(self) -> List[str]:
+        """Return the names of all registered and installed plugins."""
+        with self._lock:
+            self._discover()
+            return sorted(self._targets)
+
+    def get(self, name: str) -> T:
+        """
+        Return a plugin, importing it on first use.
+
+        Raises:
+            ValueError: If no plugin of that name is registered or installed
+        """
+        loaded = self._loaded.get(name)
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            if name not in self._targets:
+                self._discover()
+            if name not in self._targets:
+                raise ValueError(f"Unsupported {self.kind}: {name}")
+            if name not in self._loaded:
+                self._loaded[name] = self._load(self._targets[name])
+                logger.debug(f"Loaded {self.kind} {name}")
+            return self._loaded[name]
+
+    def _discover(self) -> None:
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in entry_points(group=self.group):
+            # Explicit registrations take precedence over installed packages
+            if entry_point.name in self._targets:
+                logger.warning(f"Ignoring {self.kind} entry point {entry_point.value}: {entry_point.name} is already registered")
+                continue
+            self._targets[entry_point.name] = entry_point
+
+    @staticmethod
+    def _load(target: Union[T, str, EntryPoint]) -> T:
+        if isinstance(target, EntryPoint):
+            return target.load()
+        if isinstance(target, str):
+            module, _, attribute = target.partition(":")
+            loaded: Any = import_module(module)
+            for part in filter(None, attribute.split(".")):
+                loaded = getattr(loaded, part)
+            return loaded
+        return target
+
+
+_provider_registry: Registry[Callable[..., Any]] = Registry("model provider", PROVIDER_ENTRY_POINT_GROUP)
+_action_registry: Registry[Union[Action, Callable[[], Action]]] = Registry("action", ACTION_ENTRY_POINT_GROUP)
+
+
+def get_provider_registry() -> Registry[Callable[..., Any]]:
+    """Return the registry of ModelProvider classes, called with model=... to create a provider."""
+    return _provider_registry
+
+
+def get_action_registry() -> Registry[Union[Action, Callable[[], Action]]]:
+    """Return the registry of actions, each an Action or a function that builds one."""
+    return _action_registry
+
+
+def register_model_provider(name: str, target: Union[Callable[..., Any], str]) -> None:
+    """Register a ModelProvider class, or its "module:attribute" path, under a provider name."""
+    _provider_registry.register(name, target)
+
+
+def register_action(name: str, target: Union[Action, Callable[[], Action], str]) -> None:
+    """Register an Action, a function that builds one, or its "module:attribute" path."""
+    _action_registry.register(name, target)
+
+
+def get_action(name: str) -> Action:
+    """Return a registered or installed action by name."""
+    action = _action_registry.get(name)
+    return action if isinstance(action, Action) else action()
@@ -0,0 +1,110 @@
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence
+import hashlib
+import json
+import logging
+import time
+import unicodedata
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the key layout changes, so old entries are never matched
+KEY_VERSION = 1
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of message text: NFC, trimmed, with runs of whitespace collapsed to one space."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def normalize_message(message: Mapping[str, Any]) -> Dict[str, Any]:
+    """The parts of a history message that affect the answer; tool call ids, which are random, are dropped."""
+    normalized = {"role": message["role"], "content": normalize_text(str(message.get("content") or ""))}
+    if message.get("type", "text") != "text":
+        normalized["type"] = message["type"]
+    if message.get("name"):
+        normalized["name"] = message["name"]
+    if message.get("tool_calls"):
+        normalized["tool_calls"] = [
+            {"name": call["name"], "arguments": call.get("arguments", {})} for call in message["tool_calls"]
+        ]
+    return normalized
+
+
+class ResponseCache:
+    """
+    Final answers of whole conversations, reused for exact repeats.
+
+    The key is a SHA-256 of the normalized non-system messages, the rendered
+    system prompt, the provider, model, temperature and available tools, so an
+    answer is only reused when everything the model would see is the same.
+    Entries carry their own expiry, so shorter TTLs survive being promoted
+    between cache tiers.
+
+    Args:
+        cache: Storage with get(key) and set(key, value, ttl), e.g. a TieredCache
+        ttl: Seconds an answer is reused
+        action_ttls: Shorter TTLs of answers that used an action, e.g. {"web_search": 300}
+            for time-sensitive search results; the shortest applicable TTL wins
+        blocking: Whether the storage does I/O, so async queries access it from a worker thread
+    """
+
+    def __init__(self, cache: Any, ttl: float = 3600.0, action_ttls: Optional[Mapping[str, float]] = None, blocking: bool = False):
+        self.cache = cache
+        self.ttl = ttl
+        self.action_ttls = dict(action_ttls or {})
+        self.blocking = blocking
+
+    def key(
+        self,
+        messages: Iterable[Mapping[str, Any]],
+        system_prompt: str,
+        provider: str,
+        model: str,
+        temperature: float,
+        tools: Sequence[str] = ()
+    ) -> str:
+        """Hash everything that determines the answer to a conversation."""
+        payload = {
+            "version": KEY_VERSION,
+            "system": system_prompt,
+            "provider": provider,
+            "model": model,
+            "temperature": temperature,
+            "tools": sorted(tools),
+            "messages": [normalize_message(message) for message in messages if message["role"] != "system"],
+        }
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, used_actions: Iterable[str]) -> float:
+        """The TTL of an answer produced with the given actions."""
+        return min([self.ttl] + [self.action_ttls[name] for name in used_actions if name in self.action_ttls])
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached answer for key, or None. Storage errors count as misses."""
+        try:
+            entry = self.cache.get(key)
+        except Exception as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            entry = None
+        if entry is not None and entry["expires_at"] <= time.time():
+            entry = None
+        telemetry.record_response_cache("hit" if entry is not None else "miss")
+        return entry["response"] if entry is not None else None
+
+    def put(self, key: str, response: str, used_actions: Iterable[str] = ()) -> None:
+        """Store an answer, with the TTL of the actions it used. Storage errors are logged and ignored."""
+        used_actions = sorted(set(used_actions))
+        ttl = self.ttl_for(used_actions)
+        entry = {"response": response, "expires_at": time.time() + ttl, "actions": used_actions}
+        try:
+            self.cache.set(key, entry, ttl)
+        except Exception as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+            return
+        telemetry.record_response_cache("store")
+
+    def close(self) -> None:
+        self.cache.close()
@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+from typing import Any, Mapping, NamedTuple, Optional, Sequence, Tuple
+import logging
+import re
+import threading
+
+from .speculation import predict_search_query
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# How a turn is answered
+TEMPLATE = "template"  # a canned reply, without a model call
+LIGHT = "light"  # the cheaper model tier, escalated to the full model if it asks for an action
+FULL = "full"  # the agent's own model
+
+# Trivial turns and their replies; patterns must match the whole normalized message
+DEFAULT_TEMPLATES: Tuple[Tuple[str, str], ...] = (
+    (r"(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening))( there| again)?",
+     "Hello! How can I help you today?"),
+    (r"(thanks|thank you|thx|ty|cheers|many thanks)( (so|very) much| a lot| again)?",
+     "You're welcome! Let me know if there's anything else I can help with."),
+    (r"(bye|goodbye|bye bye|see you|see ya|good night|later)( later| soon)?",
+     "Goodbye! Feel free to come back any time."),
+    (r"(ok|okay|cool|great|nice|got it|sounds good|perfect|awesome)",
+     "Great! Is there anything else I can help you with?"),
+)
+
+# Signs that a turn needs the full model's reasoning
+REASONING_PATTERN = (
+    r"```|\b(step by step|analy[sz]e|compare|contrast|evaluate|plan|strategy|debug|prove|derive|calculate|"
+    r"optimi[sz]e|trade-?offs?|pros and cons|design|architecture|implement|refactor)\b"
+)
+
+
+# Signs that the assistant's previous turn is waiting on the user, so a short reply
+# such as "ok" answers it rather than closing the conversation
+PENDING_PATTERN = r"\?|\b(shall i|should i|would you like|do you want|want me to|let me know (if|whether|which))\b"
+
+
+def normalize_turn(text: str) -> str:
+    """Lowercase a message and strip surrounding punctuation and emoji, collapsing whitespace."""
+    text = " ".join(text.lower().split())
+    return re.sub(r"^[^\w]+|[^\w]+$", "", text)
+
+
+class Route(NamedTuple):
+    kind: str  # TEMPLATE, LIGHT or FULL
+    reason: str
+    response: Optional[str] = None  # the reply of TEMPLATE routes
+
+
+class Router(ABC):
+    """
+    Decides how a user turn is answered before the first model call.
+
+    Besides the classifier itself, a router keeps a running estimate of how long
+    full-model queries take, which is what the turns it answers locally or with
+    the light tier are assumed to have saved, and records how often its
+    decisions held up.
+
+    Args:
+        shadow_rate: Fraction of template-answered turns also run through the full
+            agent in the background, to check that no action was needed
+    """
+
+    def __init__(self, shadow_rate: float = 0.0):
+        self.shadow_rate = shadow_rate
+        self._full_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def route(self, text: str, previous: Optional[Mapping[str, Any]] = None) -> Route:
+        """Route the latest user message, given the message before it (None at the start of a conversation)"""
+        pass
+
+    def observe_full(self, seconds: float) -> None:
+        """Record the latency of a query answered by the full model."""
+        with self._lock:
+            # Exponentially weighted, so the estimate follows the provider's current latency
+            self._full_seconds = seconds if self._full_seconds is None else 0.9 * self._full_seconds + 0.1 * seconds
+
+    def saved_seconds(self, seconds: float) -> Optional[float]:
+        """Estimated time saved by a routed query that took seconds, or None before any full query was seen."""
+        if self._full_seconds is None:
+            return None
+        return max(0.0, self._full_seconds - seconds)
+
+    def record_saved(self, kind: str, seconds: float) -> None:
+        """Record the estimated time saved by a query answered by a template or the light tier in seconds."""
+        saved = self.saved_seconds(seconds)
+        if saved is not None:
+            telemetry.record_route_saved(kind, saved)
+            logger.info("Routed %s turn took %.3fs, saving ~%.3fs", kind, seconds, saved)
+
+    def record_outcome(self, kind: str, outcome: str) -> None:
+        """
+        Record whether a routing decision held up, and log the route's accuracy so far.
+
+        Args:
+            kind: The route taken
+            outcome: "confirmed" if the turn needed no more than the route gave it,
+                "escalated" if a light turn needed the full model, "disagreed" if a
+                shadow run of a template turn used an action
+        """
+        telemetry.record_route_outcome(kind, outcome)
+        confirmed = telemetry.ROUTER_OUTCOMES.value(route=kind, outcome="confirmed")
+        checked = sum(telemetry.ROUTER_OUTCOMES.value(route=kind, outcome=name) for name in ("confirmed", "escalated", "disagreed"))
+        logger.info("Routed %s turn %s; %s routing accuracy %.0f/%.0f", kind, outcome, kind, confirmed, checked)
+
+
+class RuleRouter(Router):
+    """
+    A local rule-based router.
+
+    Messages that fully match a template pattern (greetings, thanks, goodbyes,
+    acknowledgements) get its canned reply, unless the previous turn left
+    something pending: an assistant question, offer or tool call, or a tool
+    result; such replies go to the full model. Messages that look like they need
+    current information, or that ask for analysis, code or long reasoning,
+    go to the full model. Other short messages go to the light tier.
+
+    Args:
+        templates: (pattern, reply) pairs matched against the normalized message
+        light_max_words: Longest message, in words, sent to the light tier
+        reasoning_pattern: Regex whose match sends a message to the full model
+        pending_pattern: Regex whose match in the previous assistant turn rules out a template reply
+        shadow_rate: See Router
+    """
+
+    def __init__(
+        self,
+        templates: Sequence[Tuple[str, str]] = DEFAULT_TEMPLATES,
+        light_max_words: int = 40,
+        reasoning_pattern: str = REASONING_PATTERN,
+        pending_pattern: str = PENDING_PATTERN,
+        shadow_rate: float = 0.0
+    ):
+        super().__init__(shadow_rate)
+        self.templates = [(re.compile(pattern), reply) for pattern, reply in templates]
+        self._replies = {reply for _, reply in templates}
+        self.light_max_words = light_max_words
+        self.reasoning_re = re.compile(reasoning_pattern, re.IGNORECASE)
+        self.pending_re = re.compile(pending_pattern, re.IGNORECASE)
+
+    def _pending(self, previous: Optional[Mapping[str, Any]]) -> bool:
+        """Whether the message before the user's leaves something for the user's reply to answer."""
+        if previous is None or previous["role"] == "system":
+            return False
+        if previous["role"] != "assistant" or previous.get("tool_calls"):
+            return True
+        content = str(previous.get("content") or "")
+        # The templates' own closing questions ("anything else?") leave nothing pending
+        return content not in self._replies and bool(self.pending_re.search(content))
+
+    def route(self, text: str, previous: Optional[Mapping[str, Any]] = None) -> Route:
+        normalized = normalize_turn(text)
+        for pattern, reply in self.templates:
+            if pattern.fullmatch(normalized):
+                if self._pending(previous):
+                    return Route(FULL, "replies to a pending assistant turn")
+                return Route(TEMPLATE, f"matched {pattern.pattern[:30]!r}", reply)
+        if predict_search_query(text) is not None:
+            return Route(FULL, "needs current information")
+        if self.reasoning_re.search(text):
+            return Route(FULL, "needs reasoning")
+        if len(text.split()) > self.light_max_words:
+            return Route(FULL, "long message")
+        return Route(LIGHT, "short message without action or reasoning signals")
@@ -0,0 +1,102 @@
+from concurrent.futures import Future
+from typing import Callable, Optional, Sequence, Tuple
+import re
+import time
+
+# Words that do not change what a search query is about
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from how i in is it me my of on or please search
+tell that the their this to was what when where which who why will with would you your look up find google
+""".split())
+
+# Signs that a question needs current or external information
+_needs_search_re = re.compile(
+    r"\b(latest|current(ly)?|today|tonight|now|recent(ly)?|news|this (week|month|year)|yesterday|tomorrow|"
+    r"price|prices|cost|stock|weather|forecast|score|results?|election|released?|update[sd]?|20\d\d|"
+    r"search|look up|google|find out)\b",
+    re.IGNORECASE
+)
+_greeting_re = re.compile(r"^(hi|hello|hey|thanks|thank you|ok|okay|bye|good (morning|afternoon|evening))\b[\s\w,!.]{0,20}$", re.IGNORECASE)
+_filler_re = re.compile(
+    r"^(please|can you|could you|would you|will you|search( the web)?( for)?|look up|google|find( out)?|"
+    r"tell me( about)?|i want to know|i'd like to know)[\s,]+",
+    re.IGNORECASE
+)
+
+
+def query_terms(text: str) -> frozenset:
+    """The lowercase content words of a query."""
+    return frozenset(term for term in re.findall(r"\w+", text.lower()) if term not in STOPWORDS)
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of two queries' content words, between 0 and 1."""
+    terms_a, terms_b = query_terms(a), query_terms(b)
+    if not terms_a or not terms_b:
+        return 1.0 if terms_a == terms_b else 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+def predict_search_query(text: str) -> Optional[str]:
+    """
+    Guess the web search a user message will lead to, without a model call.
+
+    Messages that look like they need current information (recency words, prices,
+    news, explicit requests to search) are turned into a query by removing polite
+    fillers. Greetings and other messages return None.
+    """
+    text = " ".join(text.split())
+    if not text or _greeting_re.match(text) or not _needs_search_re.search(text):
+        return None
+    previous = None
+    while previous != text:
+        previous, text = text, _filler_re.sub("", text)
+    text = text.rstrip("?!. ")
+    return text[:200] or None
+
+
+class Speculator:
+    """
+    Predicts the action a query's first model turn will request, so it can be started before the model answers.
+
+    Args:
+        action: Name of the action to start, e.g. "web_search"
+        predict: Maps the latest user message to the action input, or None to not speculate
+        min_similarity: How close the model's input must be to the predicted one (query_similarity)
+            for the speculative result to be used
+    """
+
+    def __init__(self, action: str, predict: Callable[[str], Optional[str]] = predict_search_query, min_similarity: float = 0.5):
+        self.action = action
+        self.predict = predict
+        self.min_similarity = min_similarity
+
+
+class Speculation:
+    """An action call started speculatively, running in the action executor."""
+
+    __slots__ = ("action", "action_input", "future", "started", "finished")
+
+    def __init__(self, action: str, action_input: str, future: Future):
+        self.action = action
+        self.action_input = action_input
+        self.future = future
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        self.finished = time.monotonic()
+
+    def match(self, requested: Sequence[Tuple[str, str]], min_similarity: float) -> Optional[int]:
+        """Return the index of the first requested (name, input) call this speculation can answer."""
+        for index, (name, action_input) in enumerate(requested):
+            if name == self.action and query_similarity(action_input, self.action_input) >= min_similarity:
+                return index
+        return None
+
+    def saved_seconds(self) -> float:
+        """How much of the action's run time was hidden behind the model call, measured when the model asked for it."""
+        now = time.monotonic()
+        finished = self.finished if self.finished is not None else now
+        return min(finished, now) - self.started
@@ -0,0 +1,97 @@
+from typing import List, NamedTuple, Optional
+import re
+
+RESPONSE_PREFIX = "Response to Client:"
+
+_line_re = re.compile(r'^(Thought|Action|Observation): (.*)$')
+_action_re = re.compile(r'^(\w+): (.*)$')
+
+
+class StreamEvent(NamedTuple):
+    """A unit of parsed output from a streamed ReAct reply."""
+    kind: str  # "thought", "action", "observation", "response" or "text"
+    text: str
+    action_name: Optional[str] = None
+    action_input: Optional[str] = None
+    end: int = 0  # offset in the consumed text just past this line
+
+
+class ReActStreamParser:
+    """
+    Incrementally parse a streamed ReAct reply.
+
+    Chunks are buffered until a full line is available so that Thought/Action/
+    Observation lines can be recognised as soon as their newline arrives. Once the
+    "Response to Client:" prefix has been seen, every following chunk is emitted
+    immediately as a "response" event so it can be forwarded to the client.
+    """
+
+    def __init__(self):
+        self._line = ""
+        self._chunks: List[str] = []
+        self._consumed = 0
+        self._response_started = False
+        self.in_response = False
+
+    @property
+    def text(self) -> str:
+        """The raw text consumed so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """Consume a chunk of streamed text and return any completed events."""
+        self._chunks.append(chunk)
+        if self.in_response:
+            return self._response(chunk)
+
+        events = []
+        self._line += chunk
+        while not self.in_response:
+            newline = self._line.find("\n")
+            if self._line.startswith(RESPONSE_PREFIX):
+                # Forward the rest of the buffer as the first response delta
+                self.in_response = True
+                first = self._line[len(RESPONSE_PREFIX):]
+                self._line = ""
+                events.extend(self._response(first))
+            elif newline == -1:
+                break
+            else:
+                line, self._line = self._line[:newline], self._line[newline + 1:]
+                self._consumed += newline + 1
+                event = self._parse_line(line)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def _response(self, chunk: str) -> List[StreamEvent]:
+        # Drop the space after the prefix even when it arrives in a later chunk
+        if not self._response_started:
+            chunk = chunk.lstrip(" ")
+            self._response_started = bool(chunk)
+        return [StreamEvent("response", chunk)] if chunk else []
+
+    def close(self) -> List[StreamEvent]:
+        """Flush any trailing partial line once the stream has ended."""
+        if self.in_response or not self._line:
+            return []
+        line, self._line = self._line, ""
+        self._consumed += len(line)
+        event = self._parse_line(line)
+        return [event] if event is not None else []
+
+    def _parse_line(self, line: str) -> Optional[StreamEvent]:
+        line = line.rstrip("\r")
+        if not line.strip():
+            return None
+        match = _line_re.match(line)
+        if match is None:
+            return StreamEvent("text", line, end=self._consumed)
+        kind, value = match.groups()
+        if kind == "Action":
+            action_match = _action_re.match(value)
+            if action_match is None:
+                return StreamEvent("text", line, end=self._consumed)
+            action_name, action_input = action_match.groups()
+            return StreamEvent("action", value, action_name, action_input, end=self._consumed)
+        return StreamEvent(kind.lower(), value, end=self._consumed)
@@ -0,0 +1,413 @@
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import threading
+import time
+
+try:
+    from opentelemetry import trace
+except ImportError:  # OpenTelemetry is optional; spans are then only recorded as metrics
+    trace = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TURN_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+_tracer = trace.get_tracer("app.agent") if trace is not None else None
+
+REGISTRY: List["Metric"] = []
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """A labelled metric that can render itself in the Prometheus text format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class CollectedCounter(Metric):
+    """
+    A count kept by another component, read from its collectors when metrics are rendered.
+
+    Each collector returns (labels, value) pairs, e.g. the hit and miss counters a
+    cache already keeps, so the component needs no second set of counters.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._collectors: List[Callable[[], Iterable[Tuple[Dict[str, Any], float]]]] = []
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            collectors = list(self._collectors)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, self._key(labels))} {value}"
+            for collector in collectors
+            for labels, value in collector()
+        ]
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts, then sum and count
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def total(self, **labels: Any) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-2] if state else 0.0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in values:
+            for bound, count in zip(self.buckets + ("+Inf",), state[:-2] + [state[-1]]):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+MODEL_CALL_SECONDS = Histogram(
+    "agent_model_call_seconds", "Latency of model calls", ("provider", "model", "mode", "status")
+)
+MODEL_TTFT_SECONDS = Histogram(
+    "agent_model_time_to_first_token_seconds", "Time to the first streamed token", ("provider", "model")
+)
+MODEL_TOKENS = Counter(
+    "agent_model_tokens_total", "Tokens reported by the provider, by kind (prompt, completion, cached, cache_creation)",
+    ("provider", "model", "kind")
+)
+ACTION_SECONDS = Histogram(
+    "agent_action_seconds", "Run time of action handlers", ("action", "status")
+)
+ACTION_TIMEOUTS = Counter(
+    "agent_action_timeouts_total", "Action calls abandoned after the action timeout", ("action",)
+)
+OBSERVATION_TOKENS = Counter(
+    "agent_observation_tokens_total", "Tokens of action results before and after post-processing, by stage (raw, kept)",
+    ("action", "stage")
+)
+SPECULATIONS = Counter(
+    "agent_speculations_total", "Actions started before the model asked for them, by outcome (hit, miss, unused)",
+    ("action", "outcome")
+)
+SPECULATION_SAVED_SECONDS = Histogram(
+    "agent_speculation_saved_seconds", "Action run time hidden behind the first model call by speculative hits", ("action",)
+)
+BATCH_CONVERSATIONS = Counter(
+    "agent_batch_conversations_total", "Conversations of batch jobs, by outcome (succeeded, failed, resumed)", ("outcome",)
+)
+RESPONSE_CACHE = Counter(
+    "agent_response_cache_total", "Response cache lookups and stores, by outcome (hit, miss, store)", ("outcome",)
+)
+CACHE_EVENTS = CollectedCounter(
+    "agent_cache_events_total", "Cache lookups and removals, by cache, tier and event (hits, misses, evictions, expirations)",
+    ("cache", "tier", "event")
+)
+ROUTER_DECISIONS = Counter(
+    "agent_router_decisions_total", "User turns by the route chosen before the first model call (template, light, full)", ("route",)
+)
+ROUTER_OUTCOMES = Counter(
+    "agent_router_outcomes_total", "Checked routing decisions, by outcome (confirmed, escalated, disagreed)", ("route", "outcome")
+)
+ROUTER_SAVED_SECONDS = Histogram(
+    "agent_router_saved_seconds", "Estimated latency saved by turns answered without the full model", ("route",)
+)
+TURN_RECORDS = Counter(
+    "agent_turn_records_total", "Conversation records given to the write-behind recorder, by outcome (written, dropped, failed)",
+    ("outcome",)
+)
+TURN_FLUSH_SECONDS = Histogram(
+    "agent_turn_flush_seconds", "Time taken to write a batch of conversation records", ()
+)
+TURN_RECORDER_WAIT_SECONDS = Histogram(
+    "agent_turn_recorder_wait_seconds", "Time queries were held back while the turn recorder's buffer was full", ()
+)
+PARSE_SECONDS = Histogram(
+    "agent_parse_seconds", "Time spent parsing model responses", (), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "agent_provider_admission_wait_seconds", "Time model calls queued for admission", ("provider", "model")
+)
+PROVIDER_RETRIES = Counter(
+    "agent_provider_retries_total", "Model calls retried after a transient failure", ("provider", "model", "reason")
+)
+CIRCUIT_OPENED = Counter(
+    "agent_provider_circuit_open_total", "Times a provider circuit breaker opened", ("provider", "model")
+)
+BACKEND_LATENCY_SECONDS = Histogram(
+    "agent_backend_latency_seconds", "Latency of hedged backends, to completion or to the first streamed chunk",
+    ("provider", "model", "kind")
+)
+HEDGED_REQUESTS = Counter(
+    "agent_hedged_requests_total", "Extra requests sent by hedged providers, by reason (hedge or failover)",
+    ("provider", "model", "reason")
+)
+QUERY_SECONDS = Histogram(
+    "agent_query_seconds", "End-to-end latency of agent queries", ("mode",)
+)
+QUERY_TURNS = Histogram(
+    "agent_query_turns", "Model turns taken per agent query", ("mode",), buckets=TURN_BUCKETS
+)
+
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class Span:
+    """A timed section of work, mirrored to an OpenTelemetry span when the API is installed."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start = time.perf_counter()
+        self._otel_span = None
+        self._owns_otel_span = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def end(self) -> None:
+        """End a span created with start_span."""
+        if self._owns_otel_span:
+            self._otel_span.end()
+            self._owns_otel_span = False
+
+
+@contextmanager
+def span(name: str, on_end: Optional[Callable[[Span], None]] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a section of work.
+
+    The span's status is set to "error" if the block raises an exception and to
+    "cancelled" if its task is cancelled; on_end is then called with the finished
+    span. When OpenTelemetry is installed the span is also exported as a trace span
+    with the same attributes; without a configured SDK that is a no-op.
+    """
+    current = Span(name, attributes)
+    with (_tracer.start_as_current_span(name, attributes=attributes) if _tracer is not None else nullcontext()) as otel_span:
+        current._otel_span = otel_span
+        try:
+            yield current
+        except asyncio.CancelledError:
+            current.status = "cancelled"
+            raise
+        except Exception:
+            current.status = "error"
+            raise
+        finally:
+            if on_end is not None:
+                on_end(current)
+
+
+def start_span(name: str, **attributes: Any) -> Span:
+    """
+    Start a span that is ended explicitly with Span.end().
+
+    Used for work that is interleaved with generator yields, where a span cannot
+    stay the current context.
+    """
+    current = Span(name, attributes)
+    if _tracer is not None:
+        current._otel_span = _tracer.start_span(name, attributes=attributes)
+        current._owns_otel_span = True
+    return current
+
+
+def model_call_span(provider: str, model: str, mode: str) -> ContextManager[Span]:
+    """Time a model call and record its latency by provider, model and mode."""
+    return span(
+        "agent.model_call",
+        on_end=lambda current: record_model_call(provider, model, mode, current.status, current.elapsed),
+        provider=provider,
+        model=model,
+        mode=mode
+    )
+
+
+def action_span(action: str) -> ContextManager[Span]:
+    """Time an action handler call and record its run time and outcome."""
+    return span(
+        "agent.action",
+        on_end=lambda current: ACTION_SECONDS.observe(current.elapsed, action=action, status=current.status),
+        action=action
+    )
+
+
+def record_model_call(provider: str, model: str, mode: str, status: str, seconds: float) -> None:
+    MODEL_CALL_SECONDS.observe(seconds, provider=provider, model=model, mode=mode, status=status)
+
+
+def record_time_to_first_token(provider: str, model: str, seconds: float) -> None:
+    MODEL_TTFT_SECONDS.observe(seconds, provider=provider, model=model)
+
+
+def record_usage(provider: str, model: str, usage: Any) -> None:
+    """Count the prompt, completion and cached tokens of a Usage."""
+    for kind in ("prompt", "completion", "cached", "cache_creation"):
+        count = getattr(usage, f"{kind}_tokens")
+        if count:
+            MODEL_TOKENS.inc(count, provider=provider, model=model, kind=kind)
+
+
+def record_action_timeout(action: str) -> None:
+    ACTION_TIMEOUTS.inc(action=action)
+
+
+def record_observation(action: str, raw_tokens: int, kept_tokens: int) -> None:
+    OBSERVATION_TOKENS.inc(raw_tokens, action=action, stage="raw")
+    OBSERVATION_TOKENS.inc(kept_tokens, action=action, stage="kept")
+
+
+def record_speculation(action: str, outcome: str, saved_seconds: Optional[float] = None) -> None:
+    SPECULATIONS.inc(action=action, outcome=outcome)
+    if saved_seconds is not None:
+        SPECULATION_SAVED_SECONDS.observe(saved_seconds, action=action)
+
+
+def record_batch_conversation(outcome: str) -> None:
+    BATCH_CONVERSATIONS.inc(outcome=outcome)
+
+
+def record_response_cache(outcome: str) -> None:
+    RESPONSE_CACHE.inc(outcome=outcome)
+
+
+def record_route(route: str) -> None:
+    ROUTER_DECISIONS.inc(route=route)
+
+
+def record_route_outcome(route: str, outcome: str) -> None:
+    ROUTER_OUTCOMES.inc(route=route, outcome=outcome)
+
+
+def record_route_saved(route: str, saved_seconds: float) -> None:
+    ROUTER_SAVED_SECONDS.observe(saved_seconds, route=route)
+
+
+def record_turn_records(outcome: str, count: int = 1) -> None:
+    TURN_RECORDS.inc(count, outcome=outcome)
+
+
+def record_turn_flush(seconds: float) -> None:
+    TURN_FLUSH_SECONDS.observe(seconds)
+
+
+def record_recorder_wait(seconds: float) -> None:
+    TURN_RECORDER_WAIT_SECONDS.observe(seconds)
+
+
+def record_admission_wait(provider: str, model: str, seconds: float) -> None:
+    ADMISSION_WAIT_SECONDS.observe(seconds, provider=provider, model=model)
+
+
+def record_retry(provider: str, model: str, reason: Any) -> None:
+    PROVIDER_RETRIES.inc(provider=provider, model=model, reason=reason)
+
+
+def record_circuit_open(provider: str, model: str) -> None:
+    CIRCUIT_OPENED.inc(provider=provider, model=model)
+
+
+def record_backend_latency(provider: str, model: str, kind: str, seconds: float) -> None:
+    BACKEND_LATENCY_SECONDS.observe(seconds, provider=provider, model=model, kind=kind)
+
+
+def record_hedge(provider: str, model: str, reason: str) -> None:
+    HEDGED_REQUESTS.inc(provider=provider, model=model, reason=reason)
+
+
+def record_parse(seconds: float) -> None:
+    PARSE_SECONDS.observe(seconds)
+
+
+def record_query(mode: str, turns: int, seconds: float) -> None:
+    QUERY_SECONDS.observe(seconds, mode=mode)
+    QUERY_TURNS.observe(turns, mode=mode)
@@ -0,0 +1,31 @@
+"""
+Process-wide configuration, applied once by the application's entry points.
+
+Library modules only read the environment when they first need a setting and
+never configure logging themselves, so importing them has no side effects.
+"""
+import os
+
+from dotenv import load_dotenv
+
+from app.logs import configure_logging
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_configured = False
+
+
+def configure() -> None:
+    """
+    Load environment variables from .env and set up logging, once per process.
+
+    LOG_LEVEL (default INFO) sets the root logger's level; see app.logs for the
+    pipeline's other settings. Variables that are already set in the environment
+    take precedence over .env.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    load_dotenv()
+    configure_logging(os.getenv("LOG_LEVEL", "INFO").upper(), LOG_FORMAT)
@@ -1,25 +1,92 @@
-from fastapi import HTTPException, APIRouter
+from fastapi import HTTPException, APIRouter, Request
+from fastapi.responses import StreamingResponse
 from uuid import UUID
-from app.agent.agent_schemas import ChatRequest, ChatResponse
-from app.utils.chat import get_chat_response
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+from app.agent.agent_schemas import BatchStats, ChatRequest, ChatResponse
+from app.utils.batch import BatchRunner
+from app.utils.chat import aget_chat_response, astream_chat_response, request_deadline
+import asyncio
+import json
 import logging
+import os
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before its request was answered."""
+    pass
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Return once the client disconnects (or the response is complete)."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Await work, cancelling it if the client disconnects first.
+
+    Raises:
+        ClientDisconnected: If the client disconnected and the work was cancelled
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+    if task.cancelled():
+        logger.info("Client disconnected, cancelled request")
+        raise ClientDisconnected()
+    return task.result()
+
+
+async def stream_until_disconnect(request: Request, events: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Forward events until the client disconnects, then close the source to cancel its in-flight work."""
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({pending, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                logger.info("Client disconnected, cancelled streamed request")
+                return
+            try:
+                event = pending.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        watcher.cancel()
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.wait({pending})
+        await events.aclose()
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, user_id: UUID = None, db=None) -> ChatResponse:
+async def chat_endpoint(request: ChatRequest, http_request: Request, user_id: UUID = None, db=None) -> ChatResponse:
     try:
         logger.info(f"Received chat request with {len(request.messages)} messages")
         
-        # Get response using the utility function, passing all messages and settings
-        response = get_chat_response(
+        # Get response using the utility function, passing all messages and settings.
+        # The agent is cancelled if the client disconnects before it answers.
+        response = await cancel_on_disconnect(http_request, aget_chat_response(
             messages=request.messages,
             user_id=user_id,
             db=db,
-        )
+            deadline=request_deadline(request.timeout),
+        ))
         
         if not response:
             raise HTTPException(
@@ -29,8 +96,87 @@ async def chat_endpoint(request: ChatRequest, user_id: UUID = None, db=None) ->
         
         return ChatResponse(response=response)
     
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process chat request: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+def format_sse(data: dict, event: str = None) -> str:
+    """Format a payload as a server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request, user_id: UUID = None, db=None) -> StreamingResponse:
+    logger.info(f"Received streamed chat request with {len(request.messages)} messages")
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for chunk in stream_until_disconnect(http_request, astream_chat_response(
+                messages=request.messages,
+                user_id=user_id,
+                db=db,
+                deadline=request_deadline(request.timeout),
+            )):
+                yield format_sse({"delta": chunk})
+            yield format_sse({}, event="done")
+        except Exception as e:
+            yield format_sse({"detail": f"Failed to process chat request: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(
+    http_request: Request,
+    batch_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    user_id: UUID = None,
+    db=None
+) -> StreamingResponse:
+    """
+    Run a JSONL body of BatchChatRequests, streaming a JSONL BatchChatResult per conversation as it completes.
+
+    The last line is {"stats": BatchStats}. Posting the same batch_id again resumes
+    the batch: completed conversations are replayed from their checkpoints and only
+    the rest run. BATCH_CONCURRENCY (default 8) is the default concurrency, capped
+    by BATCH_MAX_CONCURRENCY (default 32), and BATCH_RATE_PER_MINUTE optionally
+    limits how fast conversations start.
+    """
+    # The whole body is read first: once the response streams, the connection's
+    # receive channel is used to detect the client disconnecting
+    lines = (await http_request.body()).decode("utf-8").splitlines()
+    batch_id = batch_id or uuid.uuid4().hex
+    limit = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+    runner = BatchRunner(
+        batch_id,
+        concurrency=max(1, min(concurrency or int(os.getenv("BATCH_CONCURRENCY", "8")), limit)),
+        rate_per_minute=float(os.getenv("BATCH_RATE_PER_MINUTE", "0")) or None,
+        user_id=user_id,
+        db=db
+    )
+    logger.info(f"Received batch {batch_id} with {len(lines)} lines, concurrency {runner.concurrency}")
+
+    async def result_stream() -> AsyncIterator[str]:
+        async for item in stream_until_disconnect(http_request, runner.run(lines)):
+            if isinstance(item, BatchStats):
+                yield json.dumps({"stats": item.dict()}) + "\n"
+            else:
+                yield item.json(exclude_none=True) + "\n"
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
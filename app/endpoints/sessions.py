@@ -0,0 +1,101 @@
+from fastapi import HTTPException, APIRouter, Request
+from fastapi.responses import StreamingResponse
+from uuid import UUID
+from typing import AsyncIterator
+from app.agent.agent_schemas import SessionChatResponse, SessionHistoryResponse, SessionMessageRequest, SessionResponse
+from app.endpoints.chat import ClientDisconnected, cancel_on_disconnect, format_sse, stream_until_disconnect
+from app.utils.chat import aget_session_chat_response, astream_session_chat_response, request_deadline
+from app.utils.sessions import SessionNotFoundError, get_session_store
+import asyncio
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def session_not_found(session_id: str) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+
+
+@router.post("/sessions", response_model=SessionResponse, status_code=201)
+async def create_session_endpoint() -> SessionResponse:
+    session_id = await asyncio.to_thread(get_session_store().create)
+    logger.info(f"Created session {session_id}")
+    return SessionResponse(session_id=session_id)
+
+
+@router.get("/sessions/{session_id}", response_model=SessionHistoryResponse)
+async def get_session_endpoint(session_id: str) -> SessionHistoryResponse:
+    messages = await asyncio.to_thread(get_session_store().load, session_id)
+    if messages is None:
+        raise session_not_found(session_id)
+    return SessionHistoryResponse(session_id=session_id, messages=messages)
+
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def delete_session_endpoint(session_id: str) -> None:
+    if not await asyncio.to_thread(get_session_store().delete, session_id):
+        raise session_not_found(session_id)
+
+
+@router.post("/sessions/{session_id}/messages", response_model=SessionChatResponse)
+async def session_chat_endpoint(session_id: str, request: SessionMessageRequest, http_request: Request, user_id: UUID = None, db=None) -> SessionChatResponse:
+    try:
+        logger.info(f"Received message for session {session_id}")
+
+        response = await cancel_on_disconnect(http_request, aget_session_chat_response(
+            session_id=session_id,
+            message=request.message,
+            user_id=user_id,
+            db=db,
+            deadline=request_deadline(request.timeout),
+        ))
+
+        if not response:
+            raise HTTPException(
+                status_code=500,
+                detail="No response received from agent"
+            )
+
+        return SessionChatResponse(session_id=session_id, response=response)
+
+    except SessionNotFoundError:
+        raise session_not_found(session_id)
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process chat request: {str(e)}"
+        )
+
+
+@router.post("/sessions/{session_id}/messages/stream")
+async def session_chat_stream_endpoint(session_id: str, request: SessionMessageRequest, http_request: Request, user_id: UUID = None, db=None) -> StreamingResponse:
+    logger.info(f"Received streamed message for session {session_id}")
+
+    # Fail fast with a 404 rather than an error event once the stream has started
+    if await asyncio.to_thread(get_session_store().load, session_id) is None:
+        raise session_not_found(session_id)
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for chunk in stream_until_disconnect(http_request, astream_session_chat_response(
+                session_id=session_id,
+                message=request.message,
+                user_id=user_id,
+                db=db,
+                deadline=request_deadline(request.timeout),
+            )):
+                yield format_sse({"delta": chunk})
+            yield format_sse({"session_id": session_id}, event="done")
+        except Exception as e:
+            yield format_sse({"detail": f"Failed to process chat request: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
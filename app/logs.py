@@ -0,0 +1,188 @@
+"""
+The application's logging pipeline, set up by app.config.configure.
+
+Log calls on the request path only create a record and put it on a bounded
+queue; a background thread formats and writes it. Records are formatted
+lazily, so modules log bulky payloads with %-style arguments rather than
+f-strings, and tag them with a category, e.g.
+
+    logger.info("Model response:\\n%s", response, extra={"category": "response"})
+
+Records of a category are kept at its sample rate (LOG_SAMPLE_RATES), and every
+message is truncated to LOG_MAX_CHARS when it is written. The categories used by
+the agent are "prompt", "response" and "observation".
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+
+# Sample rates of categories not named in LOG_SAMPLE_RATES
+DEFAULT_SAMPLE_RATES = "prompt=0.01"
+
+# Argument types that cannot change between the log call and the writer formatting the record
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+def parse_sample_rates(text: str) -> Dict[str, float]:
+    """Parse "category=rate,..." into a dict, e.g. "prompt=0.01,observation=0.1"."""
+    rates = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        category, _, rate = item.partition("=")
+        rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class CategorySampler(logging.Filter):
+    """
+    Keep a random sample of the records of each category.
+
+    Args:
+        rates: Fraction of records kept per category; records without a category,
+            or of categories not listed, are always kept
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "category", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class TruncatingFormatter(logging.Formatter):
+    """
+    A formatter that cuts messages to max_chars, noting how much was dropped.
+
+    Exception tracebacks are kept whole. max_chars of 0 disables truncation.
+    """
+
+    def __init__(self, fmt: Optional[str] = None, max_chars: int = 0):
+        super().__init__(fmt)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        if self.max_chars and len(record.message) > self.max_chars:
+            dropped = len(record.message) - self.max_chars
+            record.message = f"{record.message[:self.max_chars]}... [{dropped} more characters]"
+        return super().formatMessage(record)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the writer thread.
+
+    The stdlib handler formats every record before enqueuing it, on the caller's
+    thread; this one only does so when an argument is mutable and could change
+    before the writer gets to it. When the queue is full, records are dropped and
+    counted rather than blocking the request.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args.values() if isinstance(record.args, dict) else record.args or ()
+        if all(isinstance(arg, _IMMUTABLE) for arg in args):
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _DrainingListener(QueueListener):
+    """A QueueListener whose stop waits for room in a full queue, so every queued record is written."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[DeferredQueueHandler] = None
+_sampler: Optional[CategorySampler] = None
+
+
+def configure_logging(level: str, fmt: str, stream: Optional[TextIO] = None) -> None:
+    """
+    Install the logging pipeline on the root logger.
+
+    LOG_ASYNC (default true) writes records from a background thread through a
+    queue of LOG_QUEUE_SIZE records (default 10000); set it to false to write
+    synchronously, e.g. when debugging a crash. LOG_MAX_CHARS (default 2000, 0
+    for no limit) caps the length of a message, and LOG_SAMPLE_RATES (default
+    "prompt=0.01") sets the fraction of records kept per category.
+    LOG_SKIP_CALLER (default false) stops every logger in the process from
+    looking up the caller of each log call; it only takes effect when fmt shows
+    no caller fields.
+
+    Args:
+        level: The root logger's level
+        fmt: The format of written records
+        stream: Where records are written (defaults to stderr)
+    """
+    global _listener, _queue_handler, _sampler
+    # Skip collecting record attributes the format never shows; these are the
+    # switches the logging documentation suggests for optimization
+    caller_fields = ("%(pathname", "%(filename", "%(module", "%(funcName", "%(lineno", "%(stack_info")
+    if os.getenv("LOG_SKIP_CALLER", "false").lower() == "true" and not any(field in fmt for field in caller_fields):
+        # Process-wide: %(pathname)s, %(lineno)d and %(funcName)s become placeholders
+        # in every handler, including ones other libraries install
+        logging._srcfile = None
+    logging.logThreads = "%(thread" in fmt
+    logging.logProcesses = "%(process" in fmt
+    logging.logMultiprocessing = "%(processName" in fmt
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TruncatingFormatter(fmt, max_chars=int(os.getenv("LOG_MAX_CHARS", "2000"))))
+    _sampler = CategorySampler(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES)))
+
+    handler: logging.Handler = output
+    if os.getenv("LOG_ASYNC", "true").lower() == "true":
+        _queue_handler = DeferredQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        _listener = _DrainingListener(_queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        handler = _queue_handler
+    # Sampled records are dropped before they are queued or formatted
+    handler.addFilter(_sampler)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+
+
+def stop_logging() -> int:
+    """
+    Write the records still queued and stop the writer thread. Later records are written synchronously.
+
+    Returns:
+        The number of records dropped because the queue was full
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return 0
+    listener, handler = _listener, _queue_handler
+    _listener = _queue_handler = None
+    root = logging.getLogger()
+    for output in listener.handlers:
+        output.addFilter(_sampler)
+        root.addHandler(output)
+    root.removeHandler(handler)
+    listener.stop()
+    if handler.dropped:
+        logging.getLogger(__name__).warning(f"Dropped {handler.dropped} log records while the log queue was full")
+    return handler.dropped
@@ -1,20 +1,48 @@
 import os
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+import asyncio
 import logging
-from app.endpoints import chat
+from app.endpoints import chat, sessions
+from app.config import configure
+from app.agent.base_agent import get_action_executor, shutdown_action_executor
+from app.agent.model_providers import aclose_model_providers
+from app.agent.telemetry import render_metrics
+from app.utils.batch import close_checkpoint_store
+from app.utils.chat import close_response_cache, close_search_cache, get_agent_template
+from app.utils.fetch import close_page_fetcher
+from app.utils.persistence import close_turn_recorder, get_turn_recorder
+from app.utils.sessions import close_session_store, evict_idle_sessions, get_session_store
 from contextlib import asynccontextmanager
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-
 
-app = FastAPI()
+# Load environment variables from .env file and set up logging
+configure()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared agent template, provider clients, executors and stores once per
+    # worker process. Shutdown runs after the server has drained in-flight requests.
+    get_agent_template()
+    get_action_executor()
+    get_session_store()
+    get_turn_recorder()
+    eviction = asyncio.create_task(evict_idle_sessions(float(os.getenv("SESSION_EVICT_INTERVAL", "60"))))
+    yield
+    eviction.cancel()
+    await aclose_model_providers()
+    await asyncio.to_thread(shutdown_action_executor)
+    close_session_store()
+    close_checkpoint_store()
+    close_search_cache()
+    close_response_cache()
+    await asyncio.to_thread(close_page_fetcher)
+    # Last, so the turns of requests that finished during shutdown are written
+    await asyncio.to_thread(close_turn_recorder)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS with specific origins
 origins = [
@@ -23,6 +51,7 @@ origins = [
 ]
 
 app.include_router(chat.router)
+app.include_router(sessions.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,13 +69,13 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
-
-if __name__ == "__main__":    
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
-
-
-
+@app.get("/metrics")
+async def metrics():
+    """Agent metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
-#python -m app.main
\ No newline at end of file
+if __name__ == "__main__":
+    # Development server; use `python -m app.server` for production
+    from app.server import main
+    main(["--reload"])
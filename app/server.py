@@ -0,0 +1,93 @@
+"""
+Production entry point.
+
+Usage:
+    python -m app.server [--workers 4] [--port 8000]
+
+Runs the app under uvicorn with several worker processes, uvloop and httptools
+when they are installed, and keep-alive and backlog settings suited to a server
+behind a load balancer. Each worker builds and tears down its shared resources
+(provider clients, caches, executors, the session store) in the app's lifespan.
+On SIGTERM a worker stops accepting connections, lets in-flight requests finish
+for up to the graceful shutdown timeout and then runs the lifespan shutdown.
+
+In-process state (the in-memory session store and caches) is per worker; use the
+SQLite or Postgres backends to share it between workers.
+"""
+from importlib.util import find_spec
+from typing import Any, Dict, List
+import argparse
+import logging
+import os
+import sys
+
+import uvicorn
+
+from app.config import configure
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """Return WEB_CONCURRENCY, or one worker per CPU."""
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.server", description=__doc__.split("\n\n")[1].split("\n")[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes (WEB_CONCURRENCY)")
+    parser.add_argument(
+        "--keep-alive", type=int, default=int(os.getenv("SERVER_KEEP_ALIVE", "75")),
+        help="Seconds to hold idle keep-alive connections; keep above the load balancer's idle timeout"
+    )
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("SERVER_BACKLOG", "2048")), help="Listen socket backlog")
+    parser.add_argument(
+        "--limit-concurrency", type=int, default=int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0")) or None,
+        help="Connections per worker before answering 503 (default: unlimited)"
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30")),
+        help="Seconds to let in-flight requests finish after SIGTERM"
+    )
+    parser.add_argument("--access-log", action="store_true", default=os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true")
+    parser.add_argument("--reload", action="store_true", help="Single auto-reloading process for development")
+    return parser.parse_args(argv)
+
+
+def server_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Build the uvicorn.run keyword arguments for the parsed command line."""
+    options: Dict[str, Any] = {
+        "host": args.host,
+        "port": args.port,
+        "lifespan": "on",
+        "loop": "uvloop" if find_spec("uvloop") else "asyncio",
+        "http": "httptools" if find_spec("httptools") else "h11",
+        "timeout_keep_alive": args.keep_alive,
+        "backlog": args.backlog,
+        "limit_concurrency": args.limit_concurrency,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "access_log": args.access_log,
+        "proxy_headers": True,
+    }
+    if args.reload:
+        options["reload"] = True
+    else:
+        options["workers"] = max(1, args.workers)
+    return options
+
+
+def main(argv: List[str] = None) -> None:
+    configure()
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    options = server_options(args)
+    logger.info(
+        f"Starting server on {args.host}:{args.port} with {options.get('workers', 1)} workers, "
+        f"loop={options['loop']}, http={options['http']}"
+    )
+    uvicorn.run("app.main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
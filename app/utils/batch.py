@@ -0,0 +1,307 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.agent import telemetry
+from app.agent.admission import TokenBucket
+from app.agent.agent_schemas import BatchChatRequest, BatchChatResult, BatchStats
+from app.utils.chat import aget_chat_response, request_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore(ABC):
+    """
+    Completed results of batch jobs, by batch id and request id.
+
+    Running a batch again with the same id replays the results saved here instead
+    of running those conversations again, so a job that crashed or lost its
+    connection resumes where it stopped. Checkpoints expire after ttl seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def load(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """Return the saved results of a batch, keyed by request id"""
+        pass
+
+    @abstractmethod
+    def save(self, batch_id: str, request_id: str, result: Dict[str, Any]) -> None:
+        """Save the result of one request of a batch"""
+        pass
+
+    @abstractmethod
+    def delete(self, batch_id: str) -> int:
+        """Delete a batch's checkpoints and return how many results were removed"""
+        pass
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+        pass
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """In-process checkpoints. They survive a client reconnecting, but not a server restart."""
+
+    def __init__(self, ttl: float = 604800.0):
+        super().__init__(ttl)
+        self._batches: Dict[str, tuple[float, Dict[str, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            entry = self._batches.get(batch_id)
+            if entry is None or entry[0] + self.ttl <= time.monotonic():
+                return {}
+            return dict(entry[1])
+
+    def save(self, batch_id: str, request_id: str, result: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for expired in [key for key, (updated_at, _) in self._batches.items() if updated_at + self.ttl <= now]:
+                del self._batches[expired]
+            _, results = self._batches.get(batch_id, (now, {}))
+            results[request_id] = result
+            self._batches[batch_id] = (now, results)
+
+    def delete(self, batch_id: str) -> int:
+        with self._lock:
+            _, results = self._batches.pop(batch_id, (0.0, {}))
+        return len(results)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Checkpoints backed by SQLite, so a batch can resume after the server restarts."""
+
+    def __init__(self, path: str, ttl: float = 604800.0):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_checkpoints (batch_id TEXT NOT NULL, request_id TEXT NOT NULL, "
+            "result TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (batch_id, request_id))"
+        )
+        self._conn.commit()
+
+    def load(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("DELETE FROM batch_checkpoints WHERE created_at <= ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT request_id, result FROM batch_checkpoints WHERE batch_id = ?", (batch_id,)
+            ).fetchall()
+        return {request_id: json.loads(result) for request_id, result in rows}
+
+    def save(self, batch_id: str, request_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batch_checkpoints (batch_id, request_id, result, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, request_id, json.dumps(result), time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, batch_id: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM batch_checkpoints WHERE batch_id = ?", (batch_id,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_checkpoint_store() -> CheckpointStore:
+    """
+    Build the batch checkpoint store from the environment.
+
+    BATCH_CHECKPOINT_STORE selects the backend: "memory" (default) or a SQLite file
+    path as "sqlite:///path/to/batches.db". BATCH_CHECKPOINT_TTL sets how long
+    results are kept, in seconds (default 7 days).
+    """
+    url = os.getenv("BATCH_CHECKPOINT_STORE", "memory")
+    ttl = float(os.getenv("BATCH_CHECKPOINT_TTL", "604800"))
+    if url == "memory":
+        return MemoryCheckpointStore(ttl=ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteCheckpointStore(url[len("sqlite:///"):], ttl=ttl)
+    raise ValueError(f"Unsupported BATCH_CHECKPOINT_STORE: {url}")
+
+
+_checkpoint_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Return the process-wide batch checkpoint store, building it on first use."""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        _checkpoint_store = create_checkpoint_store()
+    return _checkpoint_store
+
+
+def close_checkpoint_store() -> None:
+    """Close and forget the process-wide checkpoint store, e.g. on application shutdown."""
+    global _checkpoint_store
+    if _checkpoint_store is not None:
+        _checkpoint_store.close()
+        _checkpoint_store = None
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class BatchRunner:
+    """
+    Run a batch of independent conversations through the shared agent template.
+
+    At most concurrency conversations run at once and, with rate_per_minute, new
+    ones start no faster than that. Model calls still go through each provider's
+    admission controller, so batch and interactive traffic share one provider
+    rate budget. Requests are only parsed as slots free up, and results are
+    yielded in completion order, each saved to the checkpoint store first.
+
+    Args:
+        batch_id: Identifies the batch in the checkpoint store; reuse it to resume
+        concurrency: Maximum conversations in flight
+        rate_per_minute: Maximum conversations started per minute (None for no limit)
+        checkpoints: Where completed results are saved (defaults to the process-wide store)
+        user_id: Optional user ID for tracking
+        db: Optional database connection
+    """
+
+    def __init__(
+        self,
+        batch_id: str,
+        concurrency: int = 8,
+        rate_per_minute: Optional[float] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        user_id: UUID = None,
+        db=None
+    ):
+        self.batch_id = batch_id
+        self.concurrency = concurrency
+        self.checkpoints = checkpoints or get_checkpoint_store()
+        self.user_id = user_id
+        self.db = db
+        self._bucket = TokenBucket(rate_per_minute) if rate_per_minute else None
+        self._tasks: Set[asyncio.Task] = set()
+        self._latencies: List[float] = []
+        self._counts = {"succeeded": 0, "failed": 0, "resumed": 0}
+
+    async def run(self, lines: Iterable[str]) -> AsyncIterator[BatchChatResult | BatchStats]:
+        """
+        Run every request in lines, a JSONL BatchChatRequest each.
+
+        Yields:
+            A BatchChatResult per request as it completes, then the batch's BatchStats
+        """
+        start = time.monotonic()
+        done = await asyncio.to_thread(self.checkpoints.load, self.batch_id)
+        if done:
+            logger.info(f"Resuming batch {self.batch_id} with {len(done)} completed requests")
+        results: asyncio.Queue = asyncio.Queue()
+        feeder = asyncio.create_task(self._feed(lines, done, results))
+        try:
+            while (result := await results.get()) is not None:
+                yield result
+            await feeder
+        finally:
+            # Closing the iterator early, e.g. on client disconnect, cancels the conversations in flight
+            pending = [feeder, *self._tasks]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        stats = self.stats(time.monotonic() - start)
+        logger.info(
+            f"Batch {self.batch_id} complete: {stats.succeeded} succeeded, {stats.failed} failed, "
+            f"{stats.resumed} resumed in {stats.elapsed_seconds:.1f}s ({stats.conversations_per_second:.2f}/s)"
+        )
+        yield stats
+
+    async def _feed(self, lines: Iterable[str], done: Dict[str, Dict[str, Any]], results: asyncio.Queue) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        try:
+            for line_number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    request = BatchChatRequest(**json.loads(line))
+                except (ValueError, TypeError) as e:
+                    result = BatchChatResult(id=str(line_number), error=f"Invalid request: {str(e)}")
+                    self._record(result, "failed")
+                    await results.put(result)
+                    continue
+                request_id = request.id or str(line_number)
+                if request_id in done:
+                    result = BatchChatResult(**done[request_id], resumed=True)
+                    self._record(result, "resumed")
+                    await results.put(result)
+                    continue
+
+                await slots.acquire()
+                if self._bucket is not None:
+                    await asyncio.sleep(self._bucket.reserve(1))
+                task = asyncio.create_task(self._run_one(request_id, request, slots, results))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            await results.put(None)
+
+    async def _run_one(self, request_id: str, request: BatchChatRequest, slots: asyncio.Semaphore, results: asyncio.Queue) -> None:
+        start = time.monotonic()
+        try:
+            # Errors and unanswered queries must raise: a result returned as an error message would be
+            # checkpointed and replayed on resume
+            response = await aget_chat_response(
+                request.messages, self.user_id, self.db, request_deadline(request.timeout), raise_errors=True
+            )
+            result = BatchChatResult(id=request_id, response=response, seconds=time.monotonic() - start)
+            try:
+                await asyncio.to_thread(
+                    self.checkpoints.save, self.batch_id, request_id, result.dict(include={"id", "response", "seconds"})
+                )
+            except Exception as e:
+                logger.error(f"Error checkpointing request {request_id} of batch {self.batch_id}: {str(e)}")
+            self._record(result, "succeeded")
+        except Exception as e:
+            result = BatchChatResult(id=request_id, error=str(e) or type(e).__name__, seconds=time.monotonic() - start)
+            self._record(result, "failed")
+        finally:
+            slots.release()
+        await results.put(result)
+
+    def _record(self, result: BatchChatResult, outcome: str) -> None:
+        self._counts[outcome] += 1
+        if outcome != "resumed":
+            self._latencies.append(result.seconds)
+        telemetry.record_batch_conversation(outcome)
+
+    def stats(self, elapsed: float) -> BatchStats:
+        """Throughput and latency of the conversations this run completed; resumed ones only count towards total."""
+        ran = self._counts["succeeded"] + self._counts["failed"]
+        return BatchStats(
+            batch_id=self.batch_id,
+            total=ran + self._counts["resumed"],
+            succeeded=self._counts["succeeded"],
+            failed=self._counts["failed"],
+            resumed=self._counts["resumed"],
+            elapsed_seconds=elapsed,
+            conversations_per_second=ran / elapsed if elapsed > 0 else 0.0,
+            p50_seconds=_percentile(self._latencies, 0.5),
+            p95_seconds=_percentile(self._latencies, 0.95)
+        )
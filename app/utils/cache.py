@@ -0,0 +1,302 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Thread-safe hit/miss/eviction counters for a cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def record(self, counter: str, count: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + count)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class Cache(ABC):
+    """Abstract key/value cache with per-entry expiry."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key for ttl seconds (defaults to the cache's ttl)"""
+        pass
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """Return the cached value for key and its remaining seconds (None if unknown), or None if missing or expired"""
+        value = self.get(key)
+        return None if value is None else (value, None)
+
+    def close(self) -> None:
+        """Release any resources held by the cache"""
+        pass
+
+
+class TTLCache(Cache):
+    """In-memory LRU cache whose entries expire after a time-to-live."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 900.0):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.record("misses")
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.stats.record("expirations")
+                self.stats.record("misses")
+                return None
+            self._entries.move_to_end(key)
+            self.stats.record("hits")
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.record("evictions")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(Cache):
+    """
+    On-disk cache backed by SQLite so entries survive restarts. Values must be JSON serializable.
+
+    Expired rows are deleted when the cache is opened and then every purge_interval
+    seconds as entries are written, so the file does not grow without bound.
+    """
+
+    def __init__(self, path: str, ttl: float = 900.0, table: str = "cache", purge_interval: float = 300.0):
+        super().__init__(ttl)
+        self.table = table
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_with_ttl(key)
+        return None if entry is None else entry[0]
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.record("misses")
+                return None
+            value, expires_at = row
+            now = time.time()
+            if expires_at <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats.record("expirations")
+                self.stats.record("misses")
+                return None
+        self.stats.record("hits")
+        return json.loads(value), expires_at - now
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + (self.ttl if ttl is None else ttl))
+            )
+            self._conn.commit()
+            purge = now >= self._next_purge
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete all expired rows and return how many were removed"""
+        with self._lock:
+            self._next_purge = time.time() + self.purge_interval
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        self.stats.record("evictions", cursor.rowcount)
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCache(Cache):
+    """
+    Cache backed by Redis or a Redis-compatible server (requires redis), shared by every worker and host.
+
+    Keys are namespaced with prefix and expire on the server. Values must be JSON serializable.
+    """
+
+    def __init__(self, url: str, ttl: float = 900.0, prefix: str = "cache:"):
+        # Imported here, so only deployments that configure a Redis URL pay for the import
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("RedisCache requires redis: pip install redis") from None
+        super().__init__(ttl)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(self.prefix + key)
+        if value is None:
+            self.stats.record("misses")
+            return None
+        self.stats.record("hits")
+        return json.loads(value)
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        pipeline = self._client.pipeline(transaction=False)
+        pipeline.get(self.prefix + key)
+        pipeline.pttl(self.prefix + key)
+        value, milliseconds = pipeline.execute()
+        if value is None:
+            self.stats.record("misses")
+            return None
+        self.stats.record("hits")
+        return json.loads(value), milliseconds / 1000 if milliseconds > 0 else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        milliseconds = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        self._client.set(self.prefix + key, json.dumps(value), px=milliseconds)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class TieredCache(Cache):
+    """
+    An in-memory cache in front of an optional persistent tier.
+
+    Disk hits are promoted to memory for the rest of their time to live, so the
+    memory tier never serves an entry longer than the disk tier would.
+    """
+
+    def __init__(self, memory: TTLCache, disk: Optional[Cache] = None):
+        super().__init__(memory.ttl)
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = self.disk.get_with_ttl(key)
+            if entry is not None:
+                value, remaining = entry
+                self.memory.set(key, value, remaining)
+        self.stats.record("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+
+    def tier_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the counters of the combined cache and of each tier"""
+        stats = {"total": self.stats.as_dict(), "memory": self.memory.stats.as_dict()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats.as_dict()
+        return stats
+
+
+def cache_samples(name: str, cache: Optional[Cache]) -> Iterator[Tuple[Dict[str, str], int]]:
+    """Yield the counters of a cache, per tier for a TieredCache, as labelled samples for telemetry.CACHE_EVENTS."""
+    if cache is None:
+        return
+    tiers = cache.tier_stats() if isinstance(cache, TieredCache) else {"total": cache.stats.as_dict()}
+    for tier, counters in tiers.items():
+        for event, count in counters.items():
+            yield {"cache": name, "tier": tier, "event": event}, count
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is in
+    flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -1,70 +1,324 @@
 import logging
-from dotenv import load_dotenv
-from duckduckgo_search import DDGS
-from app.agent.base_agent import BaseAgent
+from app.agent import telemetry
+from app.agent.base_agent import AgentTemplate, BaseAgent
 from app.agent.agent_schemas import Action, Message
+from app.agent.deadline import Deadline
+from app.agent.observations import strip_expand_refs
+from app.agent.registry import get_action, register_action
+from app.agent.response_cache import ResponseCache
+from app.agent.routing import Router, RuleRouter
+from app.agent.speculation import Speculator, predict_search_query
 from uuid import UUID
-from typing import List
+from typing import Any, Dict, List, AsyncIterator, Optional, Tuple
+from app.utils.cache import Cache, RedisCache, SingleFlight, SQLiteCache, TieredCache, TTLCache, cache_samples
+from app.utils.persistence import get_turn_recorder
+from app.utils.sessions import SessionNotFoundError, get_session_store
+import asyncio
+import os
+import re
+import threading
+import weakref
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# The duckduckgo_search client class, imported on the first search
+DDGS: Optional[type] = None
+_ddgs_local = threading.local()
+_search_flight = SingleFlight()
+# Turns of the same session are serialized so each sees the previous one's history
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
 
-def web_search(query: str) -> str:
+
+def create_search_cache() -> Cache:
+    """
+    Build the web search cache from the environment.
+    
+    SEARCH_CACHE_TTL and SEARCH_CACHE_SIZE configure the in-memory LRU tier, and
+    SEARCH_CACHE_PATH enables an on-disk SQLite tier that survives restarts.
+    """
+    ttl = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+    memory = TTLCache(max_size=int(os.getenv("SEARCH_CACHE_SIZE", "1024")), ttl=ttl)
+    path = os.getenv("SEARCH_CACHE_PATH")
+    disk = SQLiteCache(path, ttl=ttl, table="search_cache") if path else None
+    return TieredCache(memory, disk)
+
+
+_search_cache: Optional[Cache] = None
+
+
+def get_search_cache() -> Cache:
+    """Return the web search cache, building it from the environment on first use."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = create_search_cache()
+    return _search_cache
+
+
+def set_search_cache(cache: Cache) -> None:
+    """Replace the cache used by web_search."""
+    global _search_cache
+    _search_cache = cache
+
+
+def close_search_cache() -> None:
+    """Release the web search cache's persistent tier, e.g. on application shutdown."""
+    if _search_cache is not None:
+        _search_cache.close()
+
+
+def search_cache_stats() -> dict:
+    """Return the web search cache's hit/miss/eviction counters."""
+    stats = get_search_cache().stats.as_dict()
+    stats["deduplicated"] = _search_flight.shared
+    return stats
+
+
+def _search_cache_samples():
+    # Only caches already in use are reported; rendering metrics must not build one
+    yield from cache_samples("search", _search_cache)
+    yield {"cache": "search", "tier": "total", "event": "deduplicated"}, _search_flight.shared
+
+
+telemetry.CACHE_EVENTS.add_collector(_search_cache_samples)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query into a cache key."""
+    return re.sub(r"\s+", " ", query).strip().strip("\"'").lower()
+
+
+def _get_ddgs() -> Any:
+    """Return a DDGS client reused by the current thread."""
+    global DDGS
+    ddgs = getattr(_ddgs_local, "ddgs", None)
+    if ddgs is None:
+        if DDGS is None:
+            from duckduckgo_search import DDGS
+        ddgs = _ddgs_local.ddgs = DDGS()
+    return ddgs
+
+
+def deep_search_enabled() -> bool:
+    """Whether web_search fetches the top result pages (WEB_SEARCH_DEEP)."""
+    return os.getenv("WEB_SEARCH_DEEP", "false").lower() == "true"
+
+
+def web_search(query: str, deep: Optional[bool] = None) -> str:
+    """
+    Search the web using DuckDuckGo, serving repeated queries from the search cache.
+
+    Args:
+        query: The search query
+        deep: Fetch the top result pages and return their main text instead of
+            the snippets (defaults to WEB_SEARCH_DEEP)
+    """
+    if deep is None:
+        deep = deep_search_enabled()
+    key = ("deep:" if deep else "") + normalize_query(query)
+    search_cache = get_search_cache()
+    cached = search_cache.get(key)
+    if cached is not None:
+        logger.info("Web search cache hit for query: %s", query)
+        return cached
+
+    def search_and_store() -> str:
+        result = _deep_search_uncached(query) if deep else _search_uncached(query)
+        search_cache.set(key, result)
+        return result
+
+    # Concurrent misses for the same query share a single upstream search
+    return _search_flight.do(key, search_and_store)
+
+
+def _search_results(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+    """Search DuckDuckGo and return each result's title, snippet and link."""
+    ddgs = _get_ddgs()
+    results = []
+    # Handle both old and new response formats
+    for result in ddgs.text(query, max_results=max_results):
+        if isinstance(result, dict):
+            results.append({
+                "title": result.get('title', ''),
+                "snippet": result.get('snippet') or result.get('body') or result.get('text', ''),
+                "link": result.get('link') or result.get('href', '')
+            })
+        else:
+            # If result is not a dict, convert to string
+            results.append({"title": '', "snippet": str(result), "link": ''})
+    return results
+
+
+def _format_result(result: Dict[str, str]) -> str:
+    if result["title"] and result["link"]:
+        return f"{result['title']}\n{result['snippet']}\nSource: {result['link']}"
+    return result["snippet"]
+
+
+def _search_uncached(query: str) -> str:
     """Search the web using DuckDuckGo."""
-    logger.info(f"Performing web search with query: {query}")
+    logger.info("Performing web search with query: %s", query)
     try:
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=5))
+        results = _search_results(query)
         if not results:
             return "No results found."
-            
-        # Handle both old and new response formats
-        snippets = []
-        for result in results:
-            if isinstance(result, dict):
-                snippet = result.get('snippet') or result.get('body') or result.get('text', '')
-                title = result.get('title', '')
-                link = result.get('link', '')
-            else:
-                # If result is not a dict, convert to string
-                snippet = str(result)
-                title = ''
-                link = ''
-                
-            if title and link:
-                snippets.append(f"{title}\n{snippet}\nSource: {link}")
-            else:
-                snippets.append(snippet)
-                
-        logger.debug(f"Web search returned {len(snippets)} results")
-        return "\n\n".join(snippets)
+        logger.debug("Web search returned %d results", len(results))
+        return "\n\n".join(_format_result(result) for result in results)
     except Exception as e:
         logger.error(f"Error during web search: {str(e)}")
         raise
 
 
+def _deep_search_uncached(query: str) -> str:
+    """
+    Search the web and return the main text of the top result pages in one observation.
 
-def get_chat_response(messages: List[Message], user_id: UUID = None, db=None) -> str:
+    The top DEEP_SEARCH_PAGES (default 3) results are fetched concurrently; each
+    of their paragraphs becomes a passage tagged with its source, so the
+    observation processor can rank paragraphs from all pages against the query.
+    Results whose page could not be fetched fall back to their snippet.
     """
-    Create a web-search enabled agent and get response for messages.
-    
-    Args:
-        messages: List of chat messages
-        user_id: Optional user ID for tracking
-        db: Optional database connection
-        
-    Returns:
-        The agent's response string
+    # Imported on first use, so HTTP client setup stays out of application startup
+    from app.utils.fetch import get_page_fetcher
+
+    logger.info("Performing deep web search with query: %s", query)
+    try:
+        results = _search_results(query)
+        if not results:
+            return "No results found."
+        top = [result for result in results if result["link"]][:int(os.getenv("DEEP_SEARCH_PAGES", "3"))]
+        pages = get_page_fetcher().fetch_all([result["link"] for result in top])
+        fetched = {result["link"]: page for result, page in zip(top, pages) if page is not None and page.paragraphs}
+        logger.info("Deep search extracted %d of %d pages for query: %s", len(fetched), len(top), query)
+
+        sections = []
+        for result in results:
+            page = fetched.get(result["link"])
+            if page is None:
+                sections.append(_format_result(result))
+                continue
+            title = result["title"] or page.title
+            for i, paragraph in enumerate(page.paragraphs):
+                heading = f"{title}\n" if i == 0 and title else ""
+                sections.append(f"{heading}{paragraph}\nSource: {result['link']}")
+        return "\n\n".join(sections)
+    except Exception as e:
+        logger.error(f"Error during deep web search: {str(e)}")
+        raise
+
+
+def create_web_search_action() -> Action:
+    """Build the web_search action."""
+    return Action(
+        name="web_search",
+        description="Search the web for current information",
+        parameters={
+            "query": {
+                "type": "string",
+                "description": "The search query"
+            }
+        },
+        returns="Text snippets from web search results",
+        example="Action: web_search: Current inflation rate in United States 2024",
+        handler=web_search,
+        # Results are deduplicated and ranked against the query, then cut to this many tokens
+        observation_token_budget=int(os.getenv("WEB_SEARCH_OBSERVATION_TOKENS", "1200" if deep_search_enabled() else "300"))
+    )
+
+
+register_action("web_search", create_web_search_action)
+
+
+_agent_template: Optional[AgentTemplate] = None
+
+
+def parse_model_list(value: str) -> List[Tuple[str, str]]:
+    """Parse a comma-separated list of provider:model pairs, e.g. "anthropic:claude-3-5-sonnet-latest"."""
+    models = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        provider, _, model = item.partition(":")
+        if not model:
+            raise ValueError(f"Expected provider:model, got {item!r}")
+        models.append((provider, model))
+    return models
+
+
+def parse_name_list(value: str) -> List[str]:
+    """Parse a comma-separated list of names, e.g. the actions in AGENT_ACTIONS."""
+    return [name for name in (part.strip() for part in value.split(",")) if name]
+
+
+def create_search_speculator() -> Optional[Speculator]:
+    """
+    Build the speculator that starts likely web searches alongside the first model call.
+
+    Enabled with AGENT_SPECULATIVE_SEARCH=true; AGENT_SPECULATION_MIN_SIMILARITY
+    (default 0.5) is how close the model's query must be to the predicted one.
+    """
+    if os.getenv("AGENT_SPECULATIVE_SEARCH", "false").lower() != "true":
+        return None
+    return Speculator(
+        "web_search",
+        predict_search_query,
+        min_similarity=float(os.getenv("AGENT_SPECULATION_MIN_SIMILARITY", "0.5"))
+    )
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the agent's response cache from the environment.
+
+    Enabled with AGENT_RESPONSE_CACHE=true. RESPONSE_CACHE_TTL (default 3600) is
+    how long answers are reused and RESPONSE_CACHE_SEARCH_TTL (default 300) the
+    TTL of answers that used web_search. RESPONSE_CACHE_SIZE sets the in-memory
+    LRU size, and RESPONSE_CACHE_URL adds a shared tier, either
+    "sqlite:///path/to/responses.db" or a "redis://" URL.
     """
-    logger.info(f"Processing chat request - User ID: {user_id}")
-    logger.debug(f"Received {len(messages)} messages")
+    if os.getenv("AGENT_RESPONSE_CACHE", "false").lower() != "true":
+        return None
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    memory = TTLCache(max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")), ttl=ttl)
+    url = os.getenv("RESPONSE_CACHE_URL")
+    if not url:
+        shared = None
+    elif url.startswith("sqlite:///"):
+        shared = SQLiteCache(url[len("sqlite:///"):], ttl=ttl, table="response_cache")
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        shared = RedisCache(url, ttl=ttl, prefix="agent:response:")
+    else:
+        raise ValueError(f"Unsupported RESPONSE_CACHE_URL: {url}")
+    return ResponseCache(
+        TieredCache(memory, shared),
+        ttl=ttl,
+        action_ttls={"web_search": float(os.getenv("RESPONSE_CACHE_SEARCH_TTL", "300"))},
+        blocking=shared is not None
+    )
+
+
+def create_router() -> Optional[Router]:
+    """
+    Build the pre-router that answers trivial turns locally and sends simple ones to a cheaper model.
+
+    Enabled with AGENT_ROUTER=true. AGENT_ROUTER_LIGHT_MAX_WORDS (default 40) is
+    the longest message sent to the light tier, and AGENT_ROUTER_SHADOW_RATE
+    (default 0) the fraction of template-answered turns re-run on the full agent
+    in the background to measure routing accuracy.
+    """
+    if os.getenv("AGENT_ROUTER", "false").lower() != "true":
+        return None
+    return RuleRouter(
+        light_max_words=int(os.getenv("AGENT_ROUTER_LIGHT_MAX_WORDS", "40")),
+        shadow_rate=float(os.getenv("AGENT_ROUTER_SHADOW_RATE", "0"))
+    )
+
+
+def create_web_search_agent_template() -> AgentTemplate:
+    """
+    Build the shareable definition of the web-search enabled agent.
 
+    AGENT_ACTIONS (default "web_search") lists the registered or installed
+    actions the agent may invoke. With the router enabled, AGENT_ROUTER_LIGHT_MODEL
+    (default "gpt-4o-mini", empty to disable) is the light tier's model.
+    """
     # Define example web search interaction as a multiline string
     WEB_SEARCH_EXAMPLE = """Web Search Example:
 State: The user is asking about the Trump administration's recent use of the 1787 Alien Enemies Act.
@@ -82,37 +336,247 @@ Observation: [No action taken]
 Response to Client: Hello! How can I help you today?
 """
 
-    # Define the web search action
-    web_search_action = Action(
-        name="web_search",
-        description="Search the web for current information",
-        parameters={
-            "query": {
-                "type": "string",
-                "description": "The search query"
-            }
-        },
-        returns="Text snippets from web search results",
-        example="Action: web_search: Current inflation rate in United States 2024",
-        handler=web_search
+    router = create_router()
+    template = AgentTemplate(
+        actions=[get_action(name) for name in parse_name_list(os.getenv("AGENT_ACTIONS", "web_search"))],
+        custom_examples=[WEB_SEARCH_EXAMPLE, NO_ACTION_EXAMPLE],
+        additional_context="You are a helpful AI assistant that can search the web and answer questions.",
+        temperature=1.0,
+        provider="openai",
+        model="gpt-4o",
+        max_turns=4,
+        tool_calling=os.getenv("AGENT_TOOL_CALLING", "false").lower() == "true",
+        fallback_models=parse_model_list(os.getenv("AGENT_FALLBACK_MODELS", "")),
+        speculator=create_search_speculator(),
+        response_cache=create_response_cache(),
+        router=router,
+        light_model=(os.getenv("AGENT_ROUTER_LIGHT_MODEL", "gpt-4o-mini") or None) if router else None
     )
+    logger.debug("Agent template initialized successfully")
+    return template
+
+
+def get_agent_template() -> AgentTemplate:
+    """Return the process-wide agent template, building it on first use."""
+    global _agent_template
+    if _agent_template is None:
+        _agent_template = create_web_search_agent_template()
+    return _agent_template
+
+
+def close_response_cache() -> None:
+    """Release the response cache's shared tier, e.g. on application shutdown."""
+    if _agent_template is not None and _agent_template.response_cache is not None:
+        _agent_template.response_cache.close()
+
+
+def create_web_search_agent() -> BaseAgent:
+    """Create a per-conversation web-search enabled agent from the shared template."""
+    return get_agent_template().create_agent()
+
+
+def request_deadline(timeout: Optional[float] = None) -> Deadline:
+    """
+    Build the deadline of a chat request.
+
+    CHAT_REQUEST_TIMEOUT (seconds, default 120) caps every request; clients may
+    ask for a shorter budget.
+    """
+    limit = float(os.getenv("CHAT_REQUEST_TIMEOUT", "120"))
+    return Deadline(min(timeout, limit) if timeout else limit)
+
+
+def get_chat_response(messages: List[Message], user_id: UUID = None, db=None, deadline: Optional[Deadline] = None) -> str:
+    """
+    Create a web-search enabled agent and get response for messages.
+    
+    Args:
+        messages: List of chat messages
+        user_id: Optional user ID for tracking
+        db: Optional TurnRecorder for the conversation's turns (defaults to the process-wide one)
+        deadline: Optional time budget for the request
+        
+    Returns:
+        The agent's response string
+    """
+    logger.info("Processing chat request - User ID: %s", user_id)
+    logger.debug("Received %d messages", len(messages))
 
     try:
-        head_agent = BaseAgent(
-            actions=[web_search_action],
-            custom_examples=[WEB_SEARCH_EXAMPLE, NO_ACTION_EXAMPLE],
-            additional_context="You are a helpful AI assistant that can search the web and answer questions.",
-            temperature=1.0,
-            provider="openai",
-            model="gpt-4o",
-            max_turns=4
-        )
-        logger.debug("Agent initialized successfully")
+        head_agent = create_web_search_agent()
         
-        response = head_agent.query(messages, user_id, db)
+        response = head_agent.query(messages, user_id, db or get_turn_recorder(), deadline)
         logger.info("Successfully processed chat response")
         return response
         
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
         raise
+
+
+async def aget_chat_response(
+    messages: List[Message],
+    user_id: UUID = None,
+    db=None,
+    deadline: Optional[Deadline] = None,
+    raise_errors: bool = False
+) -> str:
+    """
+    Create a web-search enabled agent and get response for messages without blocking the event loop.
+    
+    Args:
+        messages: List of chat messages
+        user_id: Optional user ID for tracking
+        db: Optional TurnRecorder for the conversation's turns (defaults to the process-wide one)
+        deadline: Optional time budget for the request
+        raise_errors: Raise the agent's errors instead of returning them as the response
+        
+    Returns:
+        The agent's response string
+    """
+    logger.info("Processing chat request - User ID: %s", user_id)
+    logger.debug("Received %d messages", len(messages))
+
+    try:
+        head_agent = create_web_search_agent()
+        
+        response = await head_agent.aquery(messages, user_id, db or get_turn_recorder(), deadline, raise_errors)
+        logger.info("Successfully processed chat response")
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
+        raise
+
+
+async def astream_chat_response(messages: List[Message], user_id: UUID = None, db=None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    """
+    Create a web-search enabled agent and stream its response for messages.
+    
+    Args:
+        messages: List of chat messages
+        user_id: Optional user ID for tracking
+        db: Optional TurnRecorder for the conversation's turns (defaults to the process-wide one)
+        deadline: Optional time budget for the request
+        
+    Yields:
+        Chunks of the agent's response string
+    """
+    logger.info("Processing streamed chat request - User ID: %s", user_id)
+    logger.debug("Received %d messages", len(messages))
+
+    try:
+        head_agent = create_web_search_agent()
+        
+        async for chunk in head_agent.astream(messages, user_id, db or get_turn_recorder(), deadline):
+            yield chunk
+        logger.info("Successfully streamed chat response")
+        
+    except Exception as e:
+        logger.error(f"Error processing streamed chat request: {str(e)}", exc_info=True)
+        raise
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+async def _restore_session_agent(session_id: str) -> BaseAgent:
+    """Create an agent whose history is the stored conversation of a session."""
+    history = await asyncio.to_thread(get_session_store().load, session_id)
+    if history is None:
+        raise SessionNotFoundError(session_id)
+    head_agent = create_web_search_agent()
+    # Stored histories exclude system messages, which the template rebuilds for every agent
+    head_agent.messages.extend(history)
+    head_agent.conversation_id = session_id
+    return head_agent
+
+
+def _session_turn(agent: BaseAgent, start: int, response: str) -> List[Dict[str, Any]]:
+    """
+    Return the messages of a query to store in its session.
+
+    An answered query stores everything it added, including its internal action
+    and observation turns. Otherwise (an error, a partial answer after the
+    deadline, running out of turns) only the user's message and the response the
+    client was given are stored, so the history matches what the user saw.
+    Trimmed results keep their trim notes but lose their expand_result
+    references, since the full results live only in this agent's store.
+    """
+    turn = [
+        {**message, "content": strip_expand_refs(message["content"])} if message.get("content") else message
+        for message in agent.messages[start:] if message["role"] != "system"
+    ]
+    if agent.answered:
+        return turn
+    return turn[:1] + [{"role": "assistant", "content": response}]
+
+
+async def aget_session_chat_response(session_id: str, message: Message, user_id: UUID = None, db=None, deadline: Optional[Deadline] = None) -> str:
+    """
+    Continue a server-side session with a new message.
+    
+    Args:
+        session_id: ID of a session created with the session store
+        message: The newest chat message
+        user_id: Optional user ID for tracking
+        db: Optional TurnRecorder for the conversation's turns (defaults to the process-wide one)
+        deadline: Optional time budget for the request
+        
+    Returns:
+        The agent's response string
+
+    Raises:
+        SessionNotFoundError: If the session does not exist or has expired
+    """
+    logger.info("Processing session chat request - Session ID: %s, User ID: %s", session_id, user_id)
+
+    async with _session_lock(session_id):
+        head_agent = await _restore_session_agent(session_id)
+        start = len(head_agent.messages)
+        try:
+            response = await head_agent.aquery([message], user_id, db or get_turn_recorder(), deadline)
+        except Exception as e:
+            logger.error(f"Error processing session chat request: {str(e)}", exc_info=True)
+            raise
+        await asyncio.to_thread(get_session_store().append, session_id, _session_turn(head_agent, start, response))
+        logger.info("Successfully processed session chat response")
+        return response
+
+
+async def astream_session_chat_response(session_id: str, message: Message, user_id: UUID = None, db=None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    """
+    Continue a server-side session with a new message, streaming the response.
+    
+    Args:
+        session_id: ID of a session created with the session store
+        message: The newest chat message
+        user_id: Optional user ID for tracking
+        db: Optional TurnRecorder for the conversation's turns (defaults to the process-wide one)
+        deadline: Optional time budget for the request
+        
+    Yields:
+        Chunks of the agent's response string
+
+    Raises:
+        SessionNotFoundError: If the session does not exist or has expired
+    """
+    logger.info("Processing streamed session chat request - Session ID: %s, User ID: %s", session_id, user_id)
+
+    async with _session_lock(session_id):
+        head_agent = await _restore_session_agent(session_id)
+        start = len(head_agent.messages)
+        chunks = []
+        try:
+            async for chunk in head_agent.astream([message], user_id, db or get_turn_recorder(), deadline):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error processing streamed session chat request: {str(e)}", exc_info=True)
+            raise
+        await asyncio.to_thread(get_session_store().append, session_id, _session_turn(head_agent, start, "".join(chunks)))
+        logger.info("Successfully streamed session chat response")
@@ -0,0 +1,357 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from html.parser import HTMLParser
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Sequence
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+
+from app.agent import telemetry
+from app.utils.cache import Cache, SQLiteCache, TieredCache, TTLCache, cache_samples
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Elements whose text is never part of a page's main content
+SKIP_TAGS = frozenset({
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "header", "footer", "aside", "form", "button", "select", "option"
+})
+# Elements that end a paragraph of text
+BLOCK_TAGS = frozenset({
+    "p", "div", "section", "article", "main", "br", "li", "ul", "ol", "dd", "dt", "tr", "td", "th",
+    "pre", "blockquote", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "table", "hr"
+})
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+
+class MainTextExtractor(HTMLParser):
+    """
+    Extract the readable paragraphs of an HTML page as it is streamed in.
+
+    Text inside navigation, scripts, forms and similar chrome is skipped, and
+    paragraphs shorter than min_words (menu items, bylines, buttons) are dropped.
+    Feeding can stop as soon as done is set, so large pages are not downloaded
+    in full.
+    """
+
+    def __init__(self, max_chars: int = 4000, min_words: int = 6):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.min_words = min_words
+        self.title = ""
+        self.paragraphs: List[str] = []
+        self._chars = 0
+        self._skip_depth = 0
+        self._in_title = False
+        self._buffer: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self._chars >= self.max_chars
+
+    def handle_starttag(self, tag: str, attrs: List[Any]) -> None:
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag: str, attrs: List[Any]) -> None:
+        # Self-closing elements such as <br/> only end the current paragraph
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth and not self.done:
+            self._buffer.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+        self.title = " ".join(self.title.split())
+
+    def _flush(self) -> None:
+        text = " ".join("".join(self._buffer).split())
+        self._buffer = []
+        if len(text.split()) < self.min_words or self.done:
+            return
+        text = text[:self.max_chars - self._chars]
+        self.paragraphs.append(text)
+        self._chars += len(text)
+
+
+class Page(NamedTuple):
+    url: str
+    title: str
+    paragraphs: List[str]
+
+
+class FetchStats:
+    """Counters of a page fetcher, for logging and benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"fetched": 0, "cached": 0, "revalidated": 0, "failed": 0, "timeouts": 0}
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            self.counts[counter] += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+class PageFetcher:
+    """
+    Fetch and extract web pages concurrently through one pooled HTTP client.
+
+    The client and its connection pool live on a private event loop thread, so
+    synchronous action handlers running in the action executor can fan out many
+    requests without creating a loop or client per call. Each host gets at most
+    per_host concurrent requests and every page has timeout seconds in total.
+
+    Extracted pages are cached by URL. Entries older than fresh_for are
+    revalidated with If-None-Match / If-Modified-Since, so unchanged pages cost
+    a 304 instead of a download; a cached copy is also served if the page
+    cannot be fetched.
+    """
+
+    def __init__(
+        self,
+        cache: Cache,
+        timeout: float = 3.0,
+        max_connections: int = 32,
+        per_host: int = 4,
+        max_bytes: int = 1_000_000,
+        max_chars: int = 4000,
+        fresh_for: float = 300.0,
+        user_agent: str = "Mozilla/5.0 (compatible; agent-deep-search/1.0)"
+    ):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.fresh_for = fresh_for
+        self.user_agent = user_agent
+        self.stats = FetchStats()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional["httpx.AsyncClient"] = None
+        # Only touched on the fetcher's loop; a host's semaphore lives while requests to it are in flight
+        self._host_limits: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+    def fetch_all(self, urls: Sequence[str]) -> List[Optional[Page]]:
+        """
+        Fetch and extract pages concurrently from any thread.
+
+        Args:
+            urls: Page URLs
+
+        Returns:
+            One Page per URL, or None for pages that failed, timed out or are not HTML or text
+        """
+        if not urls:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self.afetch_all(urls), self._ensure_loop())
+        try:
+            # Every page is bounded by the timeout, so this only guards against a stuck loop
+            return future.result(timeout=self.timeout + 5)
+        except FutureTimeoutError:
+            future.cancel()
+            return [None] * len(urls)
+
+    async def afetch_all(self, urls: Sequence[str]) -> List[Optional[Page]]:
+        """Fetch and extract pages concurrently; must run on the fetcher's loop."""
+        return list(await asyncio.gather(*(self._fetch_within_timeout(url) for url in urls)))
+
+    def close(self) -> None:
+        """Close the connection pool and stop the fetcher's loop, e.g. on application shutdown."""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+        if loop is None:
+            return
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                # Imported with the first deep search, keeping it out of application startup
+                import httpx
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="page-fetcher", daemon=True)
+                thread.start()
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout),
+                    limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                    follow_redirects=True,
+                    headers={"User-Agent": self.user_agent, "Accept": "text/html,application/xhtml+xml,text/plain;q=0.8"}
+                )
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def _fetch_within_timeout(self, url: str) -> Optional[Page]:
+        try:
+            return await asyncio.wait_for(self._fetch(url), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.record("timeouts")
+            logger.info(f"Timed out fetching {url} after {self.timeout:.1f}s")
+            return None
+
+    async def _fetch(self, url: str) -> Optional[Page]:
+        import httpx
+        cached = self.cache.get(url)
+        if cached is not None and time.time() - cached["checked_at"] < self.fresh_for:
+            self.stats.record("cached")
+            return _page(url, cached)
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            async with self._host_limit(url):
+                async with self._client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached is not None:
+                        self.stats.record("revalidated")
+                        self.cache.set(url, {**cached, "checked_at": time.time()})
+                        return _page(url, cached)
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                    if response.status_code != 200 or content_type not in TEXT_CONTENT_TYPES:
+                        logger.info(f"Skipping {url}: status {response.status_code}, content type {content_type or 'unknown'}")
+                        self.stats.record("failed")
+                        return _page(url, cached) if cached is not None else None
+                    document = await self._extract(response, plain_text=content_type == "text/plain")
+        except httpx.HTTPError as e:
+            logger.info(f"Failed to fetch {url}: {type(e).__name__}: {e}")
+            self.stats.record("failed")
+            return _page(url, cached) if cached is not None else None
+
+        self.stats.record("fetched")
+        # Without validators a stale page is downloaded again
+        document["etag"] = response.headers.get("etag")
+        document["last_modified"] = response.headers.get("last-modified")
+        document["checked_at"] = time.time()
+        self.cache.set(url, document)
+        return _page(url, document)
+
+    async def _extract(self, response: "httpx.Response", plain_text: bool) -> Dict[str, Any]:
+        """Parse the body as it arrives, stopping once enough text was extracted or max_bytes were read."""
+        extractor = MainTextExtractor(max_chars=self.max_chars)
+        received = 0
+        text = []
+        async for chunk in response.aiter_text():
+            received += len(chunk)
+            if plain_text:
+                text.append(chunk)
+                if received >= min(self.max_bytes, 2 * self.max_chars):
+                    break
+                continue
+            extractor.feed(chunk)
+            if extractor.done or received >= self.max_bytes:
+                break
+        if plain_text:
+            for paragraph in re.split(r"\n\s*\n", "".join(text)):
+                extractor.handle_data(paragraph)
+                extractor.handle_endtag("p")
+        extractor.close()
+        return {"title": extractor.title, "paragraphs": extractor.paragraphs}
+
+
+def _page(url: str, document: Dict[str, Any]) -> Page:
+    return Page(url, document["title"], document["paragraphs"])
+
+
+def create_page_cache() -> Cache:
+    """
+    Build the extracted page cache from the environment.
+
+    Pages are kept for PAGE_CACHE_TTL seconds (default one day) in an in-memory
+    LRU of PAGE_CACHE_SIZE entries, and in the SQLite file at SEARCH_CACHE_PATH
+    when it is set.
+    """
+    ttl = float(os.getenv("PAGE_CACHE_TTL", "86400"))
+    memory = TTLCache(max_size=int(os.getenv("PAGE_CACHE_SIZE", "256")), ttl=ttl)
+    path = os.getenv("SEARCH_CACHE_PATH")
+    disk = SQLiteCache(path, ttl=ttl, table="page_cache") if path else None
+    return TieredCache(memory, disk)
+
+
+_page_fetcher: Optional[PageFetcher] = None
+_page_fetcher_lock = threading.Lock()
+
+
+def get_page_fetcher() -> PageFetcher:
+    """
+    Return the process-wide page fetcher, creating it on first use.
+
+    DEEP_SEARCH_TIMEOUT (seconds per page, default 3), DEEP_SEARCH_PER_HOST
+    (default 4), DEEP_SEARCH_PAGE_CHARS (extracted characters per page, default
+    4000) and PAGE_FRESH_SECONDS (default 300, after which cached pages are
+    revalidated) configure it.
+    """
+    global _page_fetcher
+    with _page_fetcher_lock:
+        if _page_fetcher is None:
+            _page_fetcher = PageFetcher(
+                cache=create_page_cache(),
+                timeout=float(os.getenv("DEEP_SEARCH_TIMEOUT", "3")),
+                per_host=int(os.getenv("DEEP_SEARCH_PER_HOST", "4")),
+                max_chars=int(os.getenv("DEEP_SEARCH_PAGE_CHARS", "4000")),
+                fresh_for=float(os.getenv("PAGE_FRESH_SECONDS", "300"))
+            )
+        return _page_fetcher
+
+
+def _page_cache_samples():
+    fetcher = _page_fetcher
+    return cache_samples("page", fetcher.cache if fetcher is not None else None)
+
+
+telemetry.CACHE_EVENTS.add_collector(_page_cache_samples)
+
+
+def close_page_fetcher() -> None:
+    """Close the shared page fetcher's connections and cache, e.g. on application shutdown."""
+    global _page_fetcher
+    with _page_fetcher_lock:
+        fetcher, _page_fetcher = _page_fetcher, None
+    if fetcher is not None:
+        fetcher.close()
+        fetcher.cache.close()
@@ -0,0 +1,165 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from app.agent.recorder import TurnRecord, TurnRecorder, TurnStore
+
+logger = logging.getLogger(__name__)
+
+# Schema of the Postgres table; create it in Supabase (e.g. in the SQL editor) before using SupabaseTurnStore
+POSTGRES_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS agent_conversation_turns ("
+    "id BIGSERIAL PRIMARY KEY, conversation_id TEXT NOT NULL, user_id TEXT, kind TEXT NOT NULL, "
+    "content TEXT NOT NULL, data JSONB NOT NULL, created_at TIMESTAMPTZ NOT NULL); "
+    "CREATE INDEX IF NOT EXISTS agent_conversation_turns_conversation "
+    "ON agent_conversation_turns (conversation_id, created_at)"
+)
+
+
+class SQLiteTurnStore(TurnStore):
+    """Conversation records in a local SQLite file, e.g. for development and tests."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_turns (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "conversation_id TEXT NOT NULL, user_id TEXT, kind TEXT NOT NULL, content TEXT NOT NULL, "
+            "data TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS conversation_turns_conversation ON conversation_turns (conversation_id, created_at)"
+        )
+        self._conn.commit()
+
+    def write(self, records: List[TurnRecord]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO conversation_turns (conversation_id, user_id, kind, content, data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(r.conversation_id, r.user_id, r.kind, r.content, json.dumps(r.data), r.created_at) for r in records]
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresTurnStore(TurnStore):
+    """Conversation records in Postgres (requires psycopg), e.g. a Supabase project's database by its connection string."""
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg
+        except ImportError:
+            raise ImportError("PostgresTurnStore requires psycopg: pip install 'psycopg[binary]'") from None
+        self._lock = threading.Lock()
+        self._conn = psycopg.connect(dsn, autocommit=True)
+        self._conn.execute(POSTGRES_SCHEMA)
+
+    def write(self, records: List[TurnRecord]) -> None:
+        with self._lock, self._conn.transaction(), self._conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO agent_conversation_turns (conversation_id, user_id, kind, content, data, created_at) "
+                "VALUES (%s, %s, %s, %s, %s, to_timestamp(%s))",
+                [(r.conversation_id, r.user_id, r.kind, r.content, json.dumps(r.data), r.created_at) for r in records]
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SupabaseTurnStore(TurnStore):
+    """
+    Conversation records in a Supabase table, inserted through its REST API.
+
+    The table must already exist, with the columns of POSTGRES_SCHEMA.
+
+    Args:
+        url: The Supabase project URL
+        key: A key allowed to insert into the table
+        table: The table name
+    """
+
+    def __init__(self, url: str, key: str, table: str = "agent_conversation_turns"):
+        from supabase import create_client
+        self._client = create_client(url, key)
+        self.table = table
+
+    def write(self, records: List[TurnRecord]) -> None:
+        rows = [
+            {
+                "conversation_id": r.conversation_id,
+                "user_id": r.user_id,
+                "kind": r.kind,
+                "content": r.content,
+                "data": r.data,
+                "created_at": datetime.fromtimestamp(r.created_at, timezone.utc).isoformat()
+            }
+            for r in records
+        ]
+        self._client.table(self.table).insert(rows).execute()
+
+
+def create_turn_recorder() -> Optional[TurnRecorder]:
+    """
+    Build the write-behind recorder of conversation turns from the environment.
+
+    TURN_STORE selects the backend: "none" (default, nothing is persisted), a SQLite
+    file path as "sqlite:///path/to/turns.db", a "postgresql://" DSN, or "supabase"
+    to insert through the REST API of SUPABASE_URL with SUPABASE_KEY.
+    TURN_BATCH_SIZE (default 100) and TURN_FLUSH_INTERVAL (seconds, default 1) set
+    when batches are written; once TURN_MAX_PENDING records (default 10000) are
+    waiting, new queries wait up to TURN_MAX_WAIT seconds (default 5) for the writer.
+    """
+    url = os.getenv("TURN_STORE", "none")
+    if url == "none":
+        return None
+    if url.startswith("sqlite:///"):
+        store = SQLiteTurnStore(url[len("sqlite:///"):])
+    elif url.startswith(("postgres://", "postgresql://")):
+        store = PostgresTurnStore(url)
+    elif url == "supabase":
+        store = SupabaseTurnStore(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+    else:
+        raise ValueError(f"Unsupported TURN_STORE: {url}")
+    return TurnRecorder(
+        store,
+        batch_size=int(os.getenv("TURN_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("TURN_FLUSH_INTERVAL", "1")),
+        max_pending=int(os.getenv("TURN_MAX_PENDING", "10000")),
+        max_wait=float(os.getenv("TURN_MAX_WAIT", "5"))
+    )
+
+
+_turn_recorder: Optional[TurnRecorder] = None
+_turn_recorder_built = False
+_turn_recorder_lock = threading.Lock()
+
+
+def get_turn_recorder() -> Optional[TurnRecorder]:
+    """Return the process-wide turn recorder, building it on first use; None when persistence is disabled."""
+    global _turn_recorder, _turn_recorder_built
+    if not _turn_recorder_built:
+        with _turn_recorder_lock:
+            if not _turn_recorder_built:
+                _turn_recorder = create_turn_recorder()
+                _turn_recorder_built = True
+    return _turn_recorder
+
+
+def close_turn_recorder() -> None:
+    """Write the buffered records, close the process-wide turn recorder and forget it, e.g. on application shutdown."""
+    global _turn_recorder, _turn_recorder_built
+    with _turn_recorder_lock:
+        recorder, _turn_recorder, _turn_recorder_built = _turn_recorder, None, False
+    if recorder is not None:
+        pending = recorder.pending
+        recorder.close()
+        logger.info(f"Turn recorder closed after writing {pending} pending records")
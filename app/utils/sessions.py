@@ -0,0 +1,306 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFoundError(KeyError):
+    """Raised when a session does not exist or was evicted for being idle."""
+    pass
+
+
+class SessionStore(ABC):
+    """
+    Server-side conversation histories.
+
+    A session holds the canonical, append-only history of a conversation,
+    including the agent's internal turns (actions, observations and tool calls),
+    so clients only send the newest message. Sessions idle for longer than
+    idle_ttl seconds are evicted.
+    """
+
+    def __init__(self, idle_ttl: float):
+        self.idle_ttl = idle_ttl
+
+    @abstractmethod
+    def create(self) -> str:
+        """Create an empty session and return its id"""
+        pass
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the session's messages, or None if it does not exist or has expired"""
+        pass
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append messages to an existing session and mark it as active"""
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Delete a session, returning whether it existed"""
+        pass
+
+    @abstractmethod
+    def evict_idle(self) -> int:
+        """Delete every session idle for longer than idle_ttl and return how many were removed"""
+        pass
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU session store. Sessions are lost on restart and not shared between workers."""
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 3600.0):
+        super().__init__(idle_ttl)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), [])
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.info(f"Evicted least recently used session {evicted}")
+        return session_id
+
+    def load(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            touched_at, messages = entry
+            if touched_at + self.idle_ttl <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return list(messages)
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                raise SessionNotFoundError(session_id)
+            entry[1].extend(messages)
+            self._sessions[session_id] = (time.monotonic(), entry[1])
+            self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            expired = [session_id for session_id, (touched_at, _) in self._sessions.items() if touched_at <= cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store backed by SQLite, so sessions survive restarts and are shared by local workers."""
+
+    def __init__(self, path: str, idle_ttl: float = 3600.0):
+        super().__init__(idle_ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            "session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE, "
+            "seq INTEGER NOT NULL, message TEXT NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+        self._conn.commit()
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("INSERT INTO sessions (id, updated_at) VALUES (?, ?)", (session_id, time.time()))
+            self._conn.commit()
+        return session_id
+
+    def load(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row[0] + self.idle_ttl <= time.time():
+                return None
+            rows = self._conn.execute(
+                "SELECT message FROM session_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [json.loads(message) for (message,) in rows]
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            cursor = self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+            if cursor.rowcount == 0:
+                self._conn.rollback()
+                raise SessionNotFoundError(session_id)
+            (start,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM session_messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                [(session_id, start + i, json.dumps(message)) for i, message in enumerate(messages)]
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.idle_ttl,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresSessionStore(SessionStore):
+    """Session store backed by Postgres (requires psycopg), shared by every worker and host."""
+
+    def __init__(self, dsn: str, idle_ttl: float = 3600.0):
+        try:
+            import psycopg
+        except ImportError:
+            raise ImportError("PostgresSessionStore requires psycopg: pip install 'psycopg[binary]'") from None
+        super().__init__(idle_ttl)
+        self._lock = threading.Lock()
+        self._conn = psycopg.connect(dsn, autocommit=True)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agent_sessions (id TEXT PRIMARY KEY, updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agent_session_messages ("
+            "session_id TEXT NOT NULL REFERENCES agent_sessions(id) ON DELETE CASCADE, "
+            "seq INTEGER NOT NULL, message JSONB NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("INSERT INTO agent_sessions (id) VALUES (%s)", (session_id,))
+        return session_id
+
+    def load(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM agent_sessions WHERE id = %s AND updated_at > now() - make_interval(secs => %s)",
+                (session_id, self.idle_ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT message FROM agent_session_messages WHERE session_id = %s ORDER BY seq", (session_id,)
+            ).fetchall()
+        # psycopg decodes JSONB columns to Python objects
+        return [message for (message,) in rows]
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        with self._lock, self._conn.transaction():
+            row = self._conn.execute(
+                "UPDATE agent_sessions SET updated_at = now() WHERE id = %s RETURNING "
+                "(SELECT COALESCE(MAX(seq), -1) + 1 FROM agent_session_messages WHERE session_id = %s)",
+                (session_id, session_id)
+            ).fetchone()
+            if row is None:
+                raise SessionNotFoundError(session_id)
+            with self._conn.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO agent_session_messages (session_id, seq, message) VALUES (%s, %s, %s)",
+                    [(session_id, row[0] + i, json.dumps(message)) for i, message in enumerate(messages)]
+                )
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM agent_sessions WHERE id = %s", (session_id,))
+        return cursor.rowcount > 0
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM agent_sessions WHERE updated_at <= now() - make_interval(secs => %s)", (self.idle_ttl,)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store() -> SessionStore:
+    """
+    Build the session store from the environment.
+
+    SESSION_STORE selects the backend: "memory" (default), a SQLite file path as
+    "sqlite:///path/to/sessions.db", or a "postgresql://" DSN. SESSION_IDLE_TTL sets
+    the idle eviction time in seconds and SESSION_MAX_COUNT the in-memory LRU size.
+    """
+    url = os.getenv("SESSION_STORE", "memory")
+    idle_ttl = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+    if url == "memory":
+        return MemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")), idle_ttl=idle_ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):], idle_ttl=idle_ttl)
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresSessionStore(url, idle_ttl=idle_ttl)
+    raise ValueError(f"Unsupported SESSION_STORE: {url}")
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store, building it on first use."""
+    global _session_store
+    if _session_store is None:
+        _session_store = create_session_store()
+    return _session_store
+
+
+async def evict_idle_sessions(interval: float) -> None:
+    """Evict idle sessions from the process-wide store every interval seconds, until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await asyncio.to_thread(get_session_store().evict_idle)
+            if evicted:
+                logger.info(f"Evicted {evicted} idle sessions")
+        except Exception as e:
+            logger.error(f"Error evicting idle sessions: {str(e)}")
+
+
+def close_session_store() -> None:
+    """Close and forget the process-wide session store, e.g. on application shutdown."""
+    global _session_store
+    if _session_store is not None:
+        _session_store.close()
+        _session_store = None
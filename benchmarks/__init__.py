@@ -0,0 +1 @@
+"""Latency, throughput and allocation benchmarks for the agent, run against local fake backends."""
@@ -0,0 +1,282 @@
+"""
+Benchmark the agent against local fake LLM and search backends.
+
+Usage:
+    python -m benchmarks [--concurrency 1,8,32] [--requests 50] [--output results.json]
+                         [--baseline results.json --max-regression 0.25]
+
+No API keys or network access are needed: provider clients are pointed at a local
+fake server, web_search at FakeDDGS and its result links at a local fake page server. With --baseline the run exits non-zero if
+any workload regressed, so it can gate CI. Startup cost is measured separately by
+python -m benchmarks.import_time.
+"""
+from typing import Any, Callable, Dict, List
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from .fake_llm import FakeLLMConfig, FakeLLMServer
+from .fake_pages import FakePageConfig, FakePageServer
+from .fake_redis import FakeRedisServer
+from .fake_search import install_fake_ddgs
+from .harness import BenchmarkResult, find_regressions, format_results, run_benchmark
+
+SCENARIOS = ("create_base_prompt", "process_actions", "long_conversation", "deep_search", "query", "aquery", "chat_endpoint", "repeated_chat", "simple_chat")
+
+# Questions the repeated_chat workload cycles through, as FAQ traffic does
+REPEATED_QUESTIONS = tuple(f"Please search for frequently asked question {i}" for i in range(5))
+
+# Everyday turns the simple_chat workload alternates: template-answerable ones, then short questions for the light tier
+SIMPLE_TURNS = ("Hi there!", "Thanks!", "What is benchmark concept {n}?", "Explain benchmark idea {n} briefly")
+
+# Turns of the long_conversation workload, each a search result observation and a reply
+LONG_CONVERSATION_TURNS = 40
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Timed requests per concurrency level")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Seconds before the fake LLM starts answering")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0, help="Fake LLM completion token rate")
+    parser.add_argument("--completion-tokens", type=int, default=40, help="Length of the fake final answers")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Seconds per fake web search")
+    parser.add_argument("--page-latency", type=float, default=0.02, help="Seconds before a fake page starts streaming")
+    parser.add_argument("--tool-calling", action="store_true", help="Benchmark the native tool-calling mode")
+    parser.add_argument("--deep-search", action="store_true", help="Make web_search fetch the top result pages in every scenario")
+    parser.add_argument("--speculative-search", action="store_true", help="Start predicted web searches alongside the first model call")
+    parser.add_argument(
+        "--response-cache", choices=("none", "memory", "sqlite", "redis"), default="none",
+        help="Enable the response cache, with an optional shared tier (redis uses a local fake server)"
+    )
+    parser.add_argument("--router", action="store_true", help="Route trivial and simple turns before the model call")
+    parser.add_argument("--light-llm-latency", type=float, default=0.005, help="Seconds before the fake light-tier model starts answering")
+    parser.add_argument(
+        "--turn-store", choices=("none", "sqlite"), default="none",
+        help="Persist conversation turns through the write-behind recorder to a temporary SQLite file"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed fractional slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application's INFO logging")
+    return parser.parse_args(argv)
+
+
+def build_workloads(args: argparse.Namespace) -> Dict[str, Callable[[int], Any]]:
+    """Create the workloads. Application modules are imported here, after the environment points at the fakes."""
+    import httpx
+    from app.agent.agent_schemas import Message
+    from app.agent.model_providers import get_model_provider
+    from app.agent.prompt_templates import create_base_prompt
+    from app.main import app
+    from app.utils.chat import get_agent_template, web_search
+
+    template = get_agent_template()
+    actions = list(template.actions.values())
+    # Every request searches for a new topic so runs never hit the search cache
+    topics = itertools.count()
+
+    def check(response: str) -> str:
+        if "Benchmark answer" not in response:
+            raise RuntimeError(f"Unexpected agent response: {response[:200]}")
+        return response
+
+    def prompt_workload(i: int) -> str:
+        return create_base_prompt(actions, additional_context=f"Benchmark context {i}")
+
+    def process_actions_workload(i: int) -> Any:
+        agent = template.create_agent()
+        return agent.process_actions(f"Thought: Look it up.\nAction: web_search: benchmark topic {next(topics)}")
+
+    openai_provider = get_model_provider("openai", "gpt-4o")
+    anthropic_provider = get_model_provider("anthropic", "claude-3-5-sonnet-latest")
+    observation = "Observation: " + "Search result snippet with enough text to resemble a real page. " * 30
+
+    def long_conversation_workload(i: int) -> int:
+        # Convert the growing history to both wire formats on every turn, as a multi-turn query does
+        agent = template.create_agent()
+        agent.add_message(Message(role="user", content=f"Research benchmark topic {i} in depth"))
+        sent = 0
+        for turn in range(LONG_CONVERSATION_TURNS):
+            agent.add_message({"role": "assistant", "content": f"Thought: Keep looking.\nAction: web_search: topic {i} part {turn}", "type": "text"})
+            agent.add_message(observation)
+            sent += len(openai_provider._convert_messages(agent.context_messages()))
+            sent += len(anthropic_provider._convert_messages(agent.context_messages())[1])
+        return sent
+
+    def deep_search_workload(i: int) -> str:
+        # Every request fetches and extracts new pages from the fake page server
+        result = web_search(f"benchmark deep topic {next(topics)}", deep=True)
+        if "Paragraph 0" not in result:
+            raise RuntimeError(f"Deep search did not extract the pages: {result[:200]}")
+        return result
+
+    def query_workload(i: int) -> str:
+        agent = template.create_agent()
+        return check(agent.query([Message(role="user", content=f"Please search for benchmark topic {next(topics)}")], None, None))
+
+    async def aquery_workload(i: int) -> str:
+        agent = template.create_agent()
+        return check(await agent.aquery([Message(role="user", content=f"Please search for benchmark topic {next(topics)}")], None, None))
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+
+    async def chat_workload(i: int) -> str:
+        response = await client.post("/chat", json={
+            "messages": [{"role": "user", "content": f"Please search for benchmark topic {next(topics)}"}]
+        })
+        response.raise_for_status()
+        return check(response.json()["response"])
+
+    async def repeated_chat_workload(i: int) -> str:
+        response = await client.post("/chat", json={
+            "messages": [{"role": "user", "content": REPEATED_QUESTIONS[i % len(REPEATED_QUESTIONS)]}]
+        })
+        response.raise_for_status()
+        return check(response.json()["response"])
+
+    async def simple_chat_workload(i: int) -> str:
+        turn = SIMPLE_TURNS[i % len(SIMPLE_TURNS)].format(n=next(topics))
+        response = await client.post("/chat", json={"messages": [{"role": "user", "content": turn}]})
+        response.raise_for_status()
+        return response.json()["response"]
+
+    return {
+        "create_base_prompt": prompt_workload,
+        "process_actions": process_actions_workload,
+        "long_conversation": long_conversation_workload,
+        "deep_search": deep_search_workload,
+        "query": query_workload,
+        "aquery": aquery_workload,
+        "chat_endpoint": chat_workload,
+        "repeated_chat": repeated_chat_workload,
+        "simple_chat": simple_chat_workload,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[BenchmarkResult]:
+    workloads = build_workloads(args)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(workloads)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    for name in scenarios:
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            result = await run_benchmark(name, workloads[name], concurrency, args.requests)
+            print(f"{name} @ {concurrency}: p95 {result.p95_ms:.2f} ms, {result.rps:.1f} rps", file=sys.stderr)
+            results.append(result)
+
+    from app.agent.model_providers import aclose_model_providers
+    from app.utils.fetch import close_page_fetcher
+    from app.utils.persistence import close_turn_recorder
+    await aclose_model_providers()
+    close_page_fetcher()
+    close_turn_recorder()
+    return results
+
+
+def speculation_summary() -> str:
+    """Summarize the speculative search outcomes recorded during the run."""
+    from app.agent.telemetry import SPECULATIONS, SPECULATION_SAVED_SECONDS
+    hits, misses, unused = (SPECULATIONS.value(action="web_search", outcome=outcome) for outcome in ("hit", "miss", "unused"))
+    total = hits + misses + unused
+    saved = SPECULATION_SAVED_SECONDS.total(action="web_search")
+    return (
+        f"Speculative search: {total:.0f} started, {hits:.0f} hits ({hits / total if total else 0:.0%}), "
+        f"{misses:.0f} misses, {unused:.0f} unused, "
+        f"{saved * 1000 / hits if hits else 0:.1f} ms saved per hit"
+    )
+
+
+def router_summary() -> str:
+    """Summarize the routing decisions and outcomes recorded during the run."""
+    from app.agent.routing import FULL, LIGHT, TEMPLATE
+    from app.agent.telemetry import ROUTER_DECISIONS, ROUTER_OUTCOMES, ROUTER_SAVED_SECONDS
+    decisions = ", ".join(f"{ROUTER_DECISIONS.value(route=kind):.0f} {kind}" for kind in (TEMPLATE, LIGHT, FULL))
+    escalated = ROUTER_OUTCOMES.value(route=LIGHT, outcome="escalated")
+    saved = sum(ROUTER_SAVED_SECONDS.total(route=kind) for kind in (TEMPLATE, LIGHT))
+    return f"Router: {decisions}; {escalated:.0f} light turns escalated, {saved:.2f} s saved in total"
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    config = FakeLLMConfig(
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        model_latencies={"gpt-4o-mini": args.light_llm_latency}
+    )
+
+    with FakeLLMServer(config) as server, FakePageServer(FakePageConfig(latency=args.page_latency)) as pages, \
+            contextlib.ExitStack() as stack:
+        os.environ["OPENAI_BASE_URL"] = f"{server.base_url}/v1"
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+        os.environ["AGENT_TOOL_CALLING"] = "true" if args.tool_calling else "false"
+        os.environ["WEB_SEARCH_DEEP"] = "true" if args.deep_search else "false"
+        os.environ["AGENT_SPECULATIVE_SEARCH"] = "true" if args.speculative_search else "false"
+        os.environ["AGENT_RESPONSE_CACHE"] = "false" if args.response_cache == "none" else "true"
+        os.environ["AGENT_ROUTER"] = "true" if args.router else "false"
+        os.environ.pop("RESPONSE_CACHE_URL", None)
+        os.environ["TURN_STORE"] = "none"
+        if args.turn_store == "sqlite":
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            os.environ["TURN_STORE"] = "sqlite:///" + os.path.join(directory, "turns.db")
+        if args.response_cache == "sqlite":
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            os.environ["RESPONSE_CACHE_URL"] = "sqlite:///" + os.path.join(directory, "responses.db")
+        elif args.response_cache == "redis":
+            os.environ["RESPONSE_CACHE_URL"] = stack.enter_context(FakeRedisServer()).url
+        install_fake_ddgs(args.search_latency, pages.base_url)
+        from app.config import configure
+        configure()
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        results = asyncio.run(run(args))
+        print(f"Fake LLM served {server.requests} requests, fake pages {pages.requests}", file=sys.stderr)
+        if args.speculative_search:
+            print(speculation_summary(), file=sys.stderr)
+        if args.router:
+            print(router_summary(), file=sys.stderr)
+        if args.turn_store != "none":
+            from app.agent.telemetry import TURN_FLUSH_SECONDS, TURN_RECORDS
+            written, dropped = TURN_RECORDS.value(outcome="written"), TURN_RECORDS.value(outcome="dropped")
+            batches = TURN_FLUSH_SECONDS.count()
+            print(
+                f"Turn recorder: {written:.0f} records written in {batches} batches "
+                f"({TURN_FLUSH_SECONDS.total() * 1000 / batches if batches else 0:.2f} ms each), {dropped:.0f} dropped",
+                file=sys.stderr
+            )
+        if args.response_cache != "none":
+            from app.agent.telemetry import RESPONSE_CACHE
+            hits, misses = RESPONSE_CACHE.value(outcome="hit"), RESPONSE_CACHE.value(outcome="miss")
+            print(f"Response cache: {hits:.0f} hits, {misses:.0f} misses", file=sys.stderr)
+
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([result._asdict() for result in results], f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
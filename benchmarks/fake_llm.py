@@ -0,0 +1,295 @@
+"""
+A local, deterministic stand-in for the OpenAI and Anthropic chat APIs.
+
+The server answers /v1/chat/completions and /v1/messages (streamed and not, with
+and without tools) after a configurable latency, emitting completion tokens at a
+configurable rate. Replies follow a fixed script so runs are comparable:
+
+- a user message containing "search" gets a web_search action (or tool call),
+- an observation or tool result gets a final answer,
+- anything else gets a final answer straight away.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+
+class FakeLLMConfig:
+    """Timing and size of the simulated completions."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: float = 200.0,
+        completion_tokens: int = 40,
+        model_latencies: Optional[Dict[str, float]] = None
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        # Per-model overrides of latency, e.g. a faster light tier
+        self.model_latencies = dict(model_latencies or {})
+
+    def latency_for(self, model: str) -> float:
+        return self.model_latencies.get(model, self.latency)
+
+
+def _estimate_tokens(value: Any) -> int:
+    return max(1, len(json.dumps(value)) // 4)
+
+
+def _text_of(content: Any) -> str:
+    """Flatten OpenAI string content or Anthropic content blocks to text."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if block.get("type") == "text":
+            parts.append(block["text"])
+        elif block.get("type") == "tool_result":
+            parts.append(f"Observation: {_text_of(block.get('content'))}")
+    return "\n".join(parts)
+
+
+def _last_turn(messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Return the role and text of the last non-system message."""
+    for message in reversed(messages):
+        if message["role"] == "tool":
+            return "tool", _text_of(message.get("content"))
+        if message["role"] != "system":
+            text = _text_of(message.get("content"))
+            if message["role"] == "user" and text.startswith("Observation:"):
+                return "tool", text
+            return message["role"], text
+    return "user", ""
+
+
+def scripted_reply(messages: List[Dict[str, Any]], config: FakeLLMConfig) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Decide the next scripted turn.
+
+    Returns:
+        (answer, search_query): exactly one of them is set
+    """
+    role, text = _last_turn(messages)
+    if role == "user" and "search" in text.lower():
+        return None, " ".join(text.split())[:80]
+    words = " ".join(f"word{i}" for i in range(max(config.completion_tokens - 1, 0)))
+    return f"Benchmark answer: {words}".strip(), None
+
+
+def _text_protocol(answer: Optional[str], query: Optional[str]) -> str:
+    if query is not None:
+        return f"Thought: This needs current information.\nAction: web_search: {query}"
+    return f"Thought: I can answer now.\nAction: none: No action needed\nObservation: [No action taken]\nResponse to Client: {answer}"
+
+
+def _chunks(text: str) -> List[str]:
+    words = text.split(" ")
+    return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+
+def create_fake_llm_app(config: Optional[FakeLLMConfig] = None) -> FastAPI:
+    """Build the fake provider API."""
+    config = config or FakeLLMConfig()
+    app = FastAPI()
+    app.state.config = config
+    app.state.requests = 0
+
+    async def wait(model: str, completion_tokens: int) -> None:
+        await asyncio.sleep(config.latency_for(model) + completion_tokens / config.tokens_per_second)
+
+    async def paced(model: str, pieces: List[str]) -> AsyncIterator[str]:
+        await asyncio.sleep(config.latency_for(model))
+        for piece in pieces:
+            await asyncio.sleep(1 / config.tokens_per_second)
+            yield piece
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        answer, query = scripted_reply(body["messages"], config)
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if body.get("tools"):
+            if query is not None:
+                message["tool_calls"] = [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "web_search", "arguments": json.dumps({"query": query})}
+                }]
+            else:
+                message["content"] = answer
+        else:
+            message["content"] = _text_protocol(answer, query)
+        completion_tokens = _estimate_tokens(message)
+        usage = {
+            "prompt_tokens": _estimate_tokens(body["messages"]),
+            "completion_tokens": completion_tokens,
+            "total_tokens": _estimate_tokens(body["messages"]) + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+
+        if not body.get("stream"):
+            await wait(body["model"], completion_tokens)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"
+                }],
+                "usage": usage
+            }
+
+        def chunk(choices: List[Dict[str, Any]], **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": choices,
+                **extra
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            async for piece in paced(body["model"], _chunks(message["content"] or "")):
+                yield chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        answer, query = scripted_reply(body["messages"], config)
+        if body.get("tools") and query is not None:
+            content = [{
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex[:12]}",
+                "name": "web_search",
+                "input": {"query": query}
+            }]
+        else:
+            text = answer if body.get("tools") else _text_protocol(answer, query)
+            content = [{"type": "text", "text": text}]
+        usage = {
+            "input_tokens": _estimate_tokens([body.get("system"), body["messages"]]),
+            "output_tokens": _estimate_tokens(content),
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        }
+        message = {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": content,
+            "stop_reason": "tool_use" if content[0]["type"] == "tool_use" else "end_turn",
+            "stop_sequence": None,
+            "usage": usage
+        }
+
+        if not body.get("stream"):
+            await wait(body["model"], usage["output_tokens"])
+            return message
+
+        def event(name: str, payload: Dict[str, Any]) -> str:
+            return f"event: {name}\ndata: {json.dumps({'type': name, **payload})}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            yield event("message_start", {"message": {**message, "content": [], "stop_reason": None}})
+            yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+            async for piece in paced(body["model"], _chunks(content[0].get("text", ""))):
+                yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": piece}})
+            yield event("content_block_stop", {"index": 0})
+            yield event("message_delta", {
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": usage["output_tokens"]}
+            })
+            yield event("message_stop", {})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """
+    Run an ASGI app on a local port in a background thread.
+
+    Use as a context manager; base_url is the server root.
+    """
+
+    name = "local-server"
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None):
+        self.app = app
+        self.port = port or _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.app, host="127.0.0.1", port=self.port, log_level="warning", backlog=4096
+        ))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def requests(self) -> int:
+        return self.app.state.requests
+
+    def start(self) -> "LocalServer":
+        self._thread = threading.Thread(target=self._server.run, name=self.name, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{type(self).__name__} did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "LocalServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class FakeLLMServer(LocalServer):
+    """
+    Run the fake provider API on a local port in a background thread.
+
+    Use as a context manager; base_url is the server root (append /v1 for OpenAI).
+    """
+
+    name = "fake-llm"
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None, port: Optional[int] = None):
+        super().__init__(create_fake_llm_app(config), port)
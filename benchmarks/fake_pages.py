@@ -0,0 +1,103 @@
+"""
+A local stand-in for the web pages that deep search fetches.
+
+/pages/{digest}/{i} serves a deterministic HTML article wrapped in the usual
+chrome (navigation, scripts, footer) with an ETag and Last-Modified, answering
+conditional requests with 304. /slow/... answers after slow_latency seconds and
+/binary/... with a non-text content type, to exercise timeouts and skipping.
+FakeDDGS links point here once its base_url is set to the server's.
+"""
+from typing import Optional
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+
+from .fake_llm import LocalServer
+
+LAST_MODIFIED = "Mon, 06 Jan 2025 12:00:00 GMT"
+
+CHROME_TOP = """<!doctype html>
+<html><head><title>{title}</title>
+<script>window.analytics = {{ track: function() {{ return "tracking code that is not content"; }} }};</script>
+<style>body {{ font-family: sans-serif; }} .nav a {{ padding: 4px; }}</style>
+</head><body>
+<header><nav class="nav"><a href="/">Home</a><a href="/news">News</a><a href="/about">About us and our team</a></nav></header>
+<main><article><h1>{title}</h1>
+"""
+CHROME_BOTTOM = """</article></main>
+<aside>Related: subscribe to our newsletter for more articles like this one every week</aside>
+<footer><p>Copyright 2025 Example Media. All rights reserved. Terms of service and privacy policy apply.</p></footer>
+</body></html>"""
+
+
+class FakePageConfig:
+    """Timing and size of the simulated pages."""
+
+    def __init__(self, latency: float = 0.02, paragraphs: int = 12, slow_latency: float = 10.0):
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.slow_latency = slow_latency
+
+
+def render_page(digest: str, index: int, paragraphs: int) -> str:
+    """Return the HTML of a page; its text only depends on the path."""
+    title = f"Article {index} about topic {digest}"
+    body = "".join(
+        f"<p>Paragraph {n} of article {index} ({digest}) explains detail {n * 7 + index} of the topic "
+        f"with <b>enough</b> words &amp; context to count as main content for extraction.</p>\n"
+        for n in range(paragraphs)
+    )
+    return CHROME_TOP.format(title=title) + body + CHROME_BOTTOM
+
+
+def create_fake_pages_app(config: Optional[FakePageConfig] = None) -> FastAPI:
+    config = config or FakePageConfig()
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.not_modified = 0
+
+    @app.get("/pages/{digest}/{index}")
+    async def page(digest: str, index: int, request: Request):
+        app.state.requests += 1
+        etag = '"' + hashlib.sha1(f"{digest}/{index}".encode()).hexdigest()[:16] + '"'
+        headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+        if request.headers.get("if-none-match") == etag:
+            app.state.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        await asyncio.sleep(config.latency)
+        html = render_page(digest, index, config.paragraphs)
+
+        async def chunks():
+            # Sent in pieces so the client parses the page as it streams in
+            for start in range(0, len(html), 1024):
+                yield html[start:start + 1024]
+
+        return StreamingResponse(chunks(), media_type="text/html; charset=utf-8", headers=headers)
+
+    @app.get("/slow/{digest}/{index}")
+    async def slow(digest: str, index: int):
+        app.state.requests += 1
+        await asyncio.sleep(config.slow_latency)
+        return HTMLResponse(render_page(digest, index, config.paragraphs))
+
+    @app.get("/binary/{digest}/{index}")
+    async def binary(digest: str, index: int):
+        app.state.requests += 1
+        return Response(b"\x89PNG\r\n\x1a\n" + bytes(256), media_type="image/png")
+
+    return app
+
+
+class FakePageServer(LocalServer):
+    """Run the fake pages on a local port in a background thread."""
+
+    name = "fake-pages"
+
+    def __init__(self, config: Optional[FakePageConfig] = None, port: Optional[int] = None):
+        super().__init__(create_fake_pages_app(config), port)
+
+    @property
+    def not_modified(self) -> int:
+        return self.app.state.not_modified
@@ -0,0 +1,160 @@
+"""
+A local stand-in for a Redis server, enough for the application's Redis cache tier.
+
+It implements HELLO (so RESP3 clients can connect), PING, SELECT, GET, SET
+(with EX/PX/NX/XX), DEL, EXISTS, PTTL and FLUSHDB on an in-memory dict with
+expiry; other commands (e.g. the client's CLIENT SETINFO handshake) get an
+error reply, which clients ignore. Connections speak RESP2 until HELLO 3
+switches them to RESP3. Data is lost when the server stops.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import socketserver
+import threading
+import time
+
+from .fake_llm import _free_port
+
+
+def _encode(value: Any, resp3: bool = False) -> bytes:
+    if value is None or value is False:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if value is True:
+        return b"+OK\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, dict):
+        if resp3:
+            return b"%%%d\r\n" % len(value) + b"".join(_encode(k, resp3) + _encode(v, resp3) for k, v in value.items())
+        return b"*%d\r\n" % (2 * len(value)) + b"".join(_encode(k) + _encode(v) for k, v in value.items())
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisStore:
+    """The keyspace, shared by every connection."""
+
+    def __init__(self):
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self.commands = 0
+
+    def _live(self, key: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def execute(self, args: List[bytes]) -> Any:
+        command = args[0].upper()
+        with self._lock:
+            self.commands += 1
+            if command == b"HELLO":
+                protocol = int(args[1]) if len(args) > 1 else 2
+                return {b"server": b"redis", b"version": b"7.2.0", b"proto": protocol, b"mode": b"standalone"}
+            if command == b"PING":
+                return True
+            if command == b"SELECT":
+                return True
+            if command == b"GET":
+                entry = self._live(args[1])
+                return entry[0] if entry else None
+            if command == b"SET":
+                return self._set(args[1], args[2], [arg.upper() for arg in args[3:]], args[3:])
+            if command == b"DEL":
+                return sum(self._data.pop(key, None) is not None for key in args[1:])
+            if command == b"EXISTS":
+                return sum(self._live(key) is not None for key in args[1:])
+            if command == b"PTTL":
+                entry = self._live(args[1])
+                if entry is None:
+                    return -2
+                return -1 if entry[1] is None else int((entry[1] - time.monotonic()) * 1000)
+            if command == b"FLUSHDB":
+                self._data.clear()
+                return True
+        return ValueError(f"unknown command '{args[0].decode()}'")
+
+    def _set(self, key: bytes, value: bytes, options: List[bytes], raw: List[bytes]) -> Any:
+        expires_at = None
+        if b"EX" in options:
+            expires_at = time.monotonic() + float(raw[options.index(b"EX") + 1])
+        if b"PX" in options:
+            expires_at = time.monotonic() + float(raw[options.index(b"PX") + 1]) / 1000
+        exists = self._live(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        self._data[key] = (value, expires_at)
+        return True
+
+
+class _RESPHandler(socketserver.StreamRequestHandler):
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self) -> None:
+        store: FakeRedisStore = self.server.store
+        resp3 = False
+        while (args := self._read_command()) is not None:
+            if not args:
+                continue
+            if args[0].upper() == b"HELLO" and len(args) > 1:
+                resp3 = args[1] == b"3"
+            self.wfile.write(_encode(store.execute(args), resp3))
+            self.wfile.flush()
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeRedisServer:
+    """
+    Run the fake Redis server on a local port in a background thread.
+
+    Use as a context manager; url is a redis:// URL for clients.
+    """
+
+    name = "fake-redis"
+
+    def __init__(self, port: Optional[int] = None):
+        self.port = port or _free_port()
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        self.store = FakeRedisStore()
+        self._server: Optional[_ThreadingServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def requests(self) -> int:
+        return self.store.commands
+
+    def start(self) -> "FakeRedisServer":
+        self._server = _ThreadingServer(("127.0.0.1", self.port), _RESPHandler)
+        self._server.store = self.store
+        self._thread = threading.Thread(target=self._server.serve_forever, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeRedisServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,51 @@
+"""A deterministic stand-in for duckduckgo_search.DDGS."""
+from typing import Dict, List, Optional
+import hashlib
+import threading
+import time
+
+
+class FakeDDGS:
+    """Return fixed, query-dependent results after a simulated network latency."""
+
+    latency = 0.02
+    calls = 0
+    base_url = "https://example.com"  # where result links point, e.g. a FakePageServer
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def text(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        with FakeDDGS._lock:
+            FakeDDGS.calls += 1
+        time.sleep(self.latency)
+        digest = hashlib.sha1(query.encode()).hexdigest()[:8]
+        return [
+            {
+                "title": f"Result {i} for {query}",
+                "body": f"Snippet {i} ({digest}) describing {query} with enough text to resemble a real search result.",
+                "href": f"{self.base_url}/pages/{digest}/{i}"
+            }
+            for i in range(max_results)
+        ]
+
+
+def install_fake_ddgs(latency: float = 0.02, base_url: Optional[str] = None) -> None:
+    """
+    Route web_search to FakeDDGS and start from an empty search cache.
+
+    Args:
+        latency: Seconds each simulated search takes
+        base_url: Root that result links point to, e.g. a FakePageServer's base_url
+    """
+    from app.utils import chat
+    from app.utils.cache import TieredCache, TTLCache
+
+    FakeDDGS.latency = latency
+    FakeDDGS.calls = 0
+    if base_url is not None:
+        FakeDDGS.base_url = base_url
+    chat.DDGS = FakeDDGS
+    chat._ddgs_local = threading.local()
+    chat.set_search_cache(TieredCache(TTLCache(max_size=1024, ttl=900.0)))
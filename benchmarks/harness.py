@@ -0,0 +1,180 @@
+"""Run a workload at a fixed concurrency and summarize its latency, throughput and allocations."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import asyncio
+import inspect
+import logging
+import math
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+Workload = Callable[[int], Any]
+
+
+class BenchmarkResult(NamedTuple):
+    """Summary of one workload at one concurrency level. Latencies are in milliseconds."""
+    name: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration: float
+    rps: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    alloc_kib: float  # peak traced memory per request
+    alloc_blocks: float  # memory blocks still allocated after each request
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the nearest-rank percentile of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def _call(fn: Workload, i: int, executor: Optional[ThreadPoolExecutor]) -> Any:
+    if inspect.iscoroutinefunction(fn):
+        return await fn(i)
+    if executor is None:
+        return fn(i)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, i)
+
+
+async def measure_allocations(fn: Workload, samples: int, offset: int = 0) -> tuple[float, float]:
+    """
+    Run fn serially under tracemalloc.
+
+    Returns:
+        (peak KiB allocated per call, memory blocks retained per call)
+    """
+    if samples <= 0:
+        return 0.0, 0.0
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        blocks_before = len(tracemalloc.take_snapshot().traces)
+        for i in range(samples):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            await _call(fn, offset + i, None)
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - baseline
+        blocks_after = len(tracemalloc.take_snapshot().traces)
+    finally:
+        tracemalloc.stop()
+    return peak_total / samples / 1024, (blocks_after - blocks_before) / samples
+
+
+async def run_benchmark(
+    name: str,
+    fn: Workload,
+    concurrency: int,
+    requests: int,
+    warmup: int = 2,
+    alloc_samples: int = 10
+) -> BenchmarkResult:
+    """
+    Run a workload and summarize it.
+
+    Synchronous workloads run on a thread pool sized to the concurrency (or inline
+    when the concurrency is 1); coroutine functions run on the event loop. Each call
+    receives a unique integer so workloads can vary their inputs.
+
+    Args:
+        name: Label for the report
+        fn: Workload called as fn(i)
+        concurrency: Maximum number of calls in flight
+        requests: Number of timed calls
+        warmup: Untimed calls made first to fill caches and connection pools
+        alloc_samples: Serial calls traced with tracemalloc after the timed run
+
+    Returns:
+        The benchmark summary
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") if concurrency > 1 else None
+    try:
+        for i in range(warmup):
+            await _call(fn, -1 - i, executor)
+
+        latencies: List[float] = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await _call(fn, i, executor)
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"{name} request {i} failed: {str(e)}")
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(timed(i) for i in range(requests)))
+        duration = time.perf_counter() - start
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    alloc_kib, alloc_blocks = await measure_allocations(fn, min(alloc_samples, requests), offset=requests)
+    return BenchmarkResult(
+        name=name,
+        concurrency=concurrency,
+        requests=requests,
+        errors=errors,
+        duration=duration,
+        rps=requests / duration if duration else 0.0,
+        mean_ms=sum(latencies) / len(latencies) if latencies else 0.0,
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        alloc_kib=alloc_kib,
+        alloc_blocks=alloc_blocks
+    )
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """Render results as a plain-text table."""
+    header = f"{'benchmark':<22} {'conc':>5} {'reqs':>6} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'KiB/req':>9} {'blocks':>8}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.name:<22} {r.concurrency:>5} {r.requests:>6} {r.errors:>4} {r.rps:>9.1f} "
+            f"{r.p50_ms:>9.2f} {r.p95_ms:>9.2f} {r.p99_ms:>9.2f} {r.alloc_kib:>9.1f} {r.alloc_blocks:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def find_regressions(
+    results: List[BenchmarkResult],
+    baseline: List[Dict[str, Any]],
+    max_regression: float
+) -> List[str]:
+    """
+    Compare results against a saved baseline.
+
+    Returns:
+        A description of every workload whose p95 latency or throughput is worse
+        than the baseline by more than max_regression (a fraction)
+    """
+    previous = {(b["name"], b["concurrency"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get((r.name, r.concurrency))
+        if base is None:
+            continue
+        if base["p95_ms"] and r.p95_ms > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{r.name}@{r.concurrency}: p95 {base['p95_ms']:.2f} -> {r.p95_ms:.2f} ms")
+        if base["rps"] and r.rps < base["rps"] * (1 - max_regression):
+            regressions.append(f"{r.name}@{r.concurrency}: rps {base['rps']:.1f} -> {r.rps:.1f}")
+        if r.errors > base["errors"]:
+            regressions.append(f"{r.name}@{r.concurrency}: errors {base['errors']} -> {r.errors}")
+    return regressions
@@ -0,0 +1,102 @@
+"""
+Measure how long importing the application takes in a fresh interpreter.
+
+Usage:
+    python -m benchmarks.import_time [--module app.main] [--runs 5] [--budget-ms 800]
+
+Every run imports the module in a new process with -X importtime, so nothing is
+cached in sys.modules. The run exits non-zero if the median import time is over
+the budget or if any of the --forbid modules (by default the provider SDKs and the
+search client, which must load on first use) were imported, so it can gate CI.
+"""
+from typing import Dict, List, NamedTuple, Tuple
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Repository root, so the child interpreter imports this checkout's app package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_FORBIDDEN = ("openai", "anthropic", "duckduckgo_search", "uvicorn")
+
+
+class ImportProfile(NamedTuple):
+    total_us: int  # the module's cumulative import time
+    self_us: Dict[str, int]  # top-level package -> time spent in its own modules
+    modules: List[str]
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--module", default="app.main", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to measure")
+    parser.add_argument(
+        "--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "800")),
+        help="Allowed median import time (IMPORT_TIME_BUDGET_MS)"
+    )
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="Comma-separated modules that must not be imported")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level packages to list")
+    return parser.parse_args(argv)
+
+
+def profile_import(module: str) -> ImportProfile:
+    """Import module in a new interpreter and parse its -X importtime report."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=False
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    self_us: Dict[str, int] = {}
+    modules = []
+    total = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        own_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not own_us.strip().isdigit():
+            continue  # the header line
+        name = name.strip()
+        modules.append(name)
+        package = name.split(".")[0]
+        self_us[package] = self_us.get(package, 0) + int(own_us)
+        if name == module:
+            total = int(cumulative_us)
+    return ImportProfile(total, self_us, modules)
+
+
+def summarize(profiles: List[ImportProfile], top: int) -> List[Tuple[str, float]]:
+    """Return the top-level packages whose own modules take longest to import, by median milliseconds."""
+    packages = {package for profile in profiles for package in profile.self_us}
+    medians = [
+        (package, statistics.median(profile.self_us.get(package, 0) for profile in profiles) / 1000)
+        for package in packages
+    ]
+    return sorted(medians, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    profiles = [profile_import(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(profile.total_us for profile in profiles) / 1000
+
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for package, ms in summarize(profiles, args.top):
+        print(f"  {package:<30} {ms:8.1f} ms")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"OVER BUDGET import {args.module} took {median_ms:.1f} ms, budget {args.budget_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    forbidden = {name.strip() for name in args.forbid.split(",") if name.strip()}
+    for package in sorted({module.split(".")[0] for module in profiles[0].modules} & forbidden):
+        print(f"EAGER IMPORT {package} is imported by {args.module}; import it on first use", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
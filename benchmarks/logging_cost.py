@@ -0,0 +1,143 @@
+"""
+Measure what logging costs the request thread for each agent request.
+
+Usage:
+    python -m benchmarks.logging_cost [--requests 2000] [--observation-chars 8000] [--response-chars 1500]
+
+Replays the INFO log calls of one text-protocol query with a web search against
+two setups, both writing to a temporary file:
+
+- sync: the calls as they were before app.logs, eager f-strings written by a
+  synchronous handler, without sampling or truncation
+- pipeline: the current calls through app.logs with its default settings
+
+Reported times are per request, on the request thread; the pipeline's writer
+thread drains its queue afterwards, and that time is reported separately.
+"""
+from typing import Callable, List
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from app.config import LOG_FORMAT
+from app.logs import configure_logging, stop_logging
+
+logger = logging.getLogger("benchmarks.logging_cost")
+
+_RESPONSE_LOG = {"category": "response"}
+_OBSERVATION_LOG = {"category": "observation"}
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.logging_cost", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--requests", type=int, default=2000, help="Requests replayed per setup")
+    parser.add_argument("--observation-chars", type=int, default=8000, help="Length of the search observation")
+    parser.add_argument("--response-chars", type=int, default=1500, help="Length of the final answer")
+    return parser.parse_args(argv)
+
+
+def sync_request(i: int, observation: str, answer: str) -> None:
+    """The log calls of one query as they were made before the pipeline."""
+    action_turn = f"Thought: This needs current information.\nAction: web_search: benchmark topic {i}"
+    final_turn = f"Thought: I can answer now.\nAction: none: No action needed\nResponse to Client: {answer}"
+    logger.info(f"Starting query for user {i}")
+    logger.info(f"Generating model response with {2} messages")
+    logger.info(f"Model response:\n{action_turn}")
+    logger.info(f"Processing mid-process response with actions: {'web_search'}")
+    logger.info(f"Performing web search with query: benchmark topic {i}")
+    logger.info(f"Action executed successfully. Observation: {observation}")
+    logger.info(f"Response: {None}")
+    logger.info(f"Observation: Observation: {observation}")
+    logger.info(f"Action {1}/{5} executed")
+    logger.info(f"Adding observation to messages: Observation: {observation}")
+    logger.info(f"Generating model response with {4} messages")
+    logger.info(f"Model response:\n{final_turn}")
+    logger.info(f"Processing complete response with actions: {'none'}")
+    logger.info(f"Action executed successfully. Observation: {'[No action taken]'}")
+    logger.info(f"Response: {answer}")
+    logger.info(f"Observation: {None}")
+    logger.info(f"Query complete with response: {answer}")
+
+
+def pipeline_request(i: int, observation: str, answer: str) -> None:
+    """The log calls of one query as the agent makes them now."""
+    action_turn = f"Thought: This needs current information.\nAction: web_search: benchmark topic {i}"
+    final_turn = f"Thought: I can answer now.\nAction: none: No action needed\nResponse to Client: {answer}"
+    logger.info(f"Starting query for user {i}")
+    logger.info(f"Generating model response with {2} messages")
+    logger.info("Model response:\n%s", action_turn, extra=_RESPONSE_LOG)
+    logger.info(f"Processing mid-process response with actions: {'web_search'}")
+    logger.info(f"Performing web search with query: benchmark topic {i}")
+    logger.info("Action executed successfully. Observation: %s", observation, extra=_OBSERVATION_LOG)
+    logger.info(f"Action {1}/{5} executed")
+    logger.info(f"Adding observation of {len(observation) + 13} characters to messages")
+    logger.info(f"Generating model response with {4} messages")
+    logger.info("Model response:\n%s", final_turn, extra=_RESPONSE_LOG)
+    logger.info(f"Processing complete response with actions: {'none'}")
+    logger.info("Action executed successfully. Observation: %s", "[No action taken]", extra=_OBSERVATION_LOG)
+    logger.info("Query complete with response: %s", answer, extra=_RESPONSE_LOG)
+
+
+def replay(request: Callable[[int, str, str], None], args: argparse.Namespace) -> List[float]:
+    """Run request args.requests times and return each run's request-thread time in microseconds."""
+    observation = ("Search result snippet with enough text to resemble a real page. " * (args.observation_chars // 64 + 1))[:args.observation_chars]
+    answer = ("Benchmark answer text. " * (args.response_chars // 23 + 1))[:args.response_chars]
+    timings = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        request(i, observation, answer)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    for handler in saved_handlers:
+        root.removeHandler(handler)
+    try:
+        with tempfile.TemporaryFile("w") as sync_file, tempfile.TemporaryFile("w") as pipeline_file:
+            handler = logging.StreamHandler(sync_file)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            root.addHandler(handler)
+            root.setLevel(logging.INFO)
+            sync = replay(sync_request, args)
+            reset_root()
+
+            # Room for every record: requests are replayed back to back, far faster than real ones arrive
+            os.environ["LOG_QUEUE_SIZE"] = str(args.requests * 20)
+            configure_logging("INFO", LOG_FORMAT, stream=pipeline_file)
+            pipeline = replay(pipeline_request, args)
+            start = time.perf_counter()
+            dropped = stop_logging()
+            drain_ms = (time.perf_counter() - start) * 1000
+            reset_root()
+            written = sync_file.tell(), pipeline_file.tell()
+    finally:
+        root.setLevel(saved_level)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+
+    for name, timings, size in (("sync", sync, written[0]), ("pipeline", pipeline, written[1])):
+        print(
+            f"{name:<9} p50 {statistics.median(timings):8.1f} us  p95 {statistics.quantiles(timings, n=20)[-1]:8.1f} us  "
+            f"mean {statistics.fmean(timings):8.1f} us per request, {size / args.requests / 1024:6.1f} KiB written per request"
+        )
+    print(f"pipeline writer drained its queue in {drain_ms:.1f} ms after the last request, {dropped} records dropped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from app.utils import chat, fetch
+from app.utils.cache import TTLCache
+from app.utils.fetch import PageFetcher
+from benchmarks.fake_pages import FakePageConfig, FakePageServer
+from benchmarks.fake_search import install_fake_ddgs
+
+
+@pytest.fixture(scope="module")
+def pages():
+    with FakePageServer(FakePageConfig(latency=0.0, slow_latency=2.0)) as server:
+        yield server
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = PageFetcher(TTLCache(max_size=64, ttl=60.0), timeout=0.5)
+    yield fetcher
+    fetcher.close()
+
+
+@pytest.fixture
+def fake_search(pages, fetcher, monkeypatch):
+    """Route web_search to the fake search results, whose links point at the fake pages."""
+    for name in ("DDGS", "_ddgs_local", "_search_cache"):
+        monkeypatch.setattr(chat, name, getattr(chat, name))
+    monkeypatch.setattr(fetch, "_page_fetcher", fetcher)
+    monkeypatch.setenv("DEEP_SEARCH_PAGES", "3")
+    install_fake_ddgs(latency=0.0, base_url=pages.base_url)
+
+
+def test_fetch_extracts_main_text(pages, fetcher):
+    [page] = fetcher.fetch_all([f"{pages.base_url}/pages/abc123/1"])
+
+    assert page.title == "Article 1 about topic abc123"
+    assert len(page.paragraphs) == 12
+    assert page.paragraphs[0].startswith("Paragraph 0 of article 1 (abc123)")
+    assert "enough words & context" in page.paragraphs[0]
+    text = "\n".join(page.paragraphs)
+    for chrome in ("tracking code", "About us", "newsletter", "Copyright"):
+        assert chrome not in text
+
+
+def test_fetch_skips_slow_and_binary_pages(pages, fetcher):
+    start = time.monotonic()
+    slow, binary = fetcher.fetch_all([f"{pages.base_url}/slow/abc123/2", f"{pages.base_url}/binary/abc123/3"])
+
+    assert slow is None and binary is None
+    assert time.monotonic() - start < 2.0
+    assert fetcher.stats.as_dict()["timeouts"] == 1
+
+
+def test_fetch_revalidates_stale_pages(pages, fetcher):
+    fetcher.fresh_for = 0.0
+    url = f"{pages.base_url}/pages/def456/1"
+    [first] = fetcher.fetch_all([url])
+    not_modified = pages.not_modified
+    [second] = fetcher.fetch_all([url])
+
+    assert second == first
+    assert pages.not_modified == not_modified + 1
+    assert fetcher.stats.as_dict()["revalidated"] == 1
+
+
+def test_deep_search_returns_page_paragraphs_with_sources(pages, fake_search):
+    result = chat.web_search("python release notes", deep=True)
+
+    sections = result.split("\n\n")
+    sources = [section.rsplit("Source: ", 1)[1] for section in sections]
+    assert all(source.startswith(f"{pages.base_url}/pages/") for source in sources)
+    # The top three results are replaced by their pages' paragraphs, the rest keep their snippets
+    assert len(set(sources)) == 5
+    assert len(sections) == 3 * 12 + 2
+    assert sections[0].startswith("Result 0 for python release notes\nParagraph 0 of article 0")
+    assert sections[-1].startswith("Result 4 for python release notes\nSnippet 4")
+
+
+def test_deep_search_is_cached(pages, fake_search):
+    first = chat.web_search("cached deep query", deep=True)
+    requests = pages.requests
+
+    assert chat.web_search("Cached  deep query", deep=True) == first
+    assert pages.requests == requests
+    # Deep and snippet results are cached separately
+    assert chat.web_search("cached deep query", deep=False) != first
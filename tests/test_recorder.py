@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.agent.recorder import USER, TurnRecorder
+from app.utils.persistence import SQLiteTurnStore
+
+
+class BatchLoggingStore(SQLiteTurnStore):
+    """A SQLiteTurnStore that remembers its batch sizes and can hold writes back."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, records):
+        self.release.wait(10)
+        super().write(records)
+        self.batches.append(len(records))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "turns.db")
+
+
+@pytest.fixture
+def store(path):
+    return BatchLoggingStore(path)
+
+
+def stored_rows(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM conversation_turns").fetchone()[0]
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_full_batches_are_written_without_waiting_for_the_interval(store, path):
+    recorder = TurnRecorder(store, batch_size=10, flush_interval=60.0)
+    for i in range(25):
+        assert recorder.record("conversation", USER, f"message {i}", user_id="user")
+
+    assert wait_until(lambda: recorder.pending == 5)
+    assert store.batches == [10, 10]
+    assert recorder.flush(timeout=5.0)
+    assert store.batches == [10, 10, 5]
+    assert stored_rows(path) == 25
+    recorder.close()
+
+
+def test_partial_batch_is_written_after_the_flush_interval(store, path):
+    recorder = TurnRecorder(store, batch_size=100, flush_interval=0.05)
+    for i in range(3):
+        recorder.record("conversation", USER, f"message {i}")
+
+    assert wait_until(lambda: recorder.pending == 0)
+    assert store.batches == [3]
+    recorder.close()
+
+
+def test_close_writes_buffered_records(store, path):
+    recorder = TurnRecorder(store, batch_size=100, flush_interval=60.0)
+    for i in range(5):
+        recorder.record("conversation", USER, f"message {i}", data={"index": i})
+    recorder.close()
+
+    assert stored_rows(path) == 5
+    assert not recorder.record("conversation", USER, "after close")
+
+
+def test_backpressure_holds_new_queries_and_drops_beyond_twice_max_pending(store, path):
+    recorder = TurnRecorder(store, batch_size=100, flush_interval=60.0, max_pending=5, max_wait=0.2)
+    store.release.clear()
+    # The writer takes the first record and blocks on the store
+    recorder.record("conversation", USER, "first")
+    recorder.flush(timeout=0.1)
+    assert wait_until(lambda: recorder.pending == 1 and not recorder._buffer)
+
+    for i in range(5):
+        assert recorder.record("conversation", USER, f"message {i}")
+    assert recorder.wait_for_capacity() >= 0.2
+    # Queries already running may buffer up to twice max_pending
+    for i in range(5):
+        assert recorder.record("conversation", USER, f"late {i}")
+    assert not recorder.record("conversation", USER, "dropped")
+
+    store.release.set()
+    assert recorder.flush(timeout=5.0)
+    assert recorder.wait_for_capacity() == 0.0
+    assert stored_rows(path) == 11
+    recorder.close()
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+
+from app.agent import telemetry
+from app.agent.agent_schemas import Action, Message
+from app.agent.base_agent import AgentTemplate
+from app.agent.model_providers import aclose_model_providers
+from app.agent.response_cache import ResponseCache
+from app.utils.cache import TTLCache
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+
+
+@pytest.fixture(scope="module")
+def llm():
+    with FakeLLMServer(FakeLLMConfig(latency=0.0, tokens_per_second=1e6, completion_tokens=5)) as server:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setenv("OPENAI_BASE_URL", f"{server.base_url}/v1")
+            monkeypatch.setenv("OPENAI_API_KEY", "test")
+            yield server
+            # Providers are shared process-wide; drop the ones pointing at this server
+            asyncio.run(aclose_model_providers())
+
+
+def failing_search(query: str) -> str:
+    raise RuntimeError("search is down")
+
+
+@pytest.fixture
+def template(llm):
+    search = Action(
+        name="web_search",
+        description="Search the web for current information",
+        parameters={"query": {"type": "string", "description": "The search query"}},
+        returns="Text snippets from web search results",
+        handler=failing_search
+    )
+    return AgentTemplate(actions=[search], response_cache=ResponseCache(TTLCache(max_size=64, ttl=60.0)))
+
+
+def ask(template: AgentTemplate, text: str):
+    agent = template.create_agent()
+    return agent.query([Message(role="user", content=text)], None, None), agent
+
+
+def test_repeated_conversation_is_served_from_cache(llm, template):
+    hits = telemetry.RESPONSE_CACHE.value(outcome="hit")
+    first, agent = ask(template, "What is the capital of France?")
+    requests = llm.requests
+    # Whitespace differences normalize to the same key
+    second, cached = ask(template, "What is the  capital of France? ")
+
+    assert agent.answered and cached.answered
+    assert second == first
+    assert llm.requests == requests
+    assert telemetry.RESPONSE_CACHE.value(outcome="hit") == hits + 1
+
+
+def test_different_conversation_misses(llm, template):
+    ask(template, "Tell me a joke")
+    misses = telemetry.RESPONSE_CACHE.value(outcome="miss")
+    requests = llm.requests
+    ask(template, "Tell me a different joke")
+
+    assert llm.requests == requests + 1
+    assert telemetry.RESPONSE_CACHE.value(outcome="miss") == misses + 1
+
+
+def test_unanswered_turn_is_not_cached(llm, template):
+    stores = telemetry.RESPONSE_CACHE.value(outcome="store")
+    # The fake model searches for messages that mention search, and the search fails
+    first, agent = ask(template, "Please search for today's news")
+    requests = llm.requests
+    ask(template, "Please search for today's news")
+
+    assert not agent.answered
+    assert first.startswith("Error executing web_search")
+    assert llm.requests > requests
+    assert telemetry.RESPONSE_CACHE.value(outcome="store") == stores
+
+
+def test_expired_answer_is_a_miss(template):
+    cache = template.response_cache
+    cache.put("key", "answer")
+    assert cache.get("key") == "answer"
+    cache.cache.set("key", {"response": "answer", "expires_at": time.time() - 1, "actions": []}, 60.0)
+    assert cache.get("key") is None